@@ -1,10 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Header
+from fastapi.responses import PlainTextResponse
+from typing import List, Optional
+import hmac
+import os
 from sqlalchemy.orm import Session
 from db.session import get_db
-from models.database import User, UserRole, Document
+from models.database import User, UserRole, Document, IngestionJob
 from api.documents import get_current_user
 from api.auth import UserResponse
+from core import auth_cache
+from core.security import get_password_hasher
+from services.metrics import REGISTRY
 
 router = APIRouter()
 
@@ -20,6 +26,24 @@ def list_users(
 ):
     return db.query(User).all()
 
+@router.get("/cache-stats")
+def cache_stats(admin: User = Depends(require_admin)):
+    from services.embedding_service import EmbeddingService
+    from services.embedding_batcher import get_embedding_batcher
+    from services.answer_cache import get_answer_cache
+    from services.reranker import get_reranker
+    reranker = get_reranker()
+    model = EmbeddingService().model
+    return {
+        "answers": get_answer_cache().stats(),
+        "reranker": reranker.stats() if reranker else None,
+        "embeddings": EmbeddingService().cache_stats(),
+        "embedding_batcher": get_embedding_batcher().stats(),
+        "embedding_server": model.server_stats() if model.name == "remote" else None,
+        "auth": auth_cache.stats(),
+        "password_hasher": get_password_hasher().stats(),
+    }
+
 @router.delete("/documents/{doc_id}")
 def delete_document(
     doc_id: int,
@@ -30,42 +54,187 @@ def delete_document(
     if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
     
+    from services.ingestion import get_ingestion_worker
+    worker = get_ingestion_worker()
+    worker.cancel_document(db, doc_id)
+    # SQLite doesn't enforce foreign keys, so ON DELETE CASCADE never fires
+    db.query(IngestionJob).filter(IngestionJob.document_id == doc_id).delete(synchronize_session=False)
+
     db.delete(doc)
     db.commit()
     # Ideally, also delete from vector store
-    from services.vector_service import VectorService
-    VectorService().delete_by_document(str(doc_id))
+    from services.vector_service import get_vector_service
+    vs = get_vector_service()
+    vs.delete_by_document(str(doc_id))
+    if vs.building_collection_name:
+        # The document may have been the last one a full reindex waited for
+        worker.check_rebuild(db, vs.building_collection_name)
     
 @router.post("/reindex")
 def reindex_all_documents(
-    background_tasks: BackgroundTasks,
+    only_changed: bool = False,
     db: Session = Depends(get_db),
     admin: User = Depends(require_admin)
 ):
-    from services.vector_service import VectorService
-    from api.documents import process_document_task
+    """Re-embeds documents without taking search offline.
+
+    A full reindex builds a new versioned collection while the current one
+    keeps serving, then switches to it atomically. With `only_changed`, only
+    documents whose chunking/model config differs from the current one are
+    re-ingested, each swapped in place as it completes.
+    """
+    from services.ingestion import get_ingestion_worker, current_index_config
     import os
-    
-    # 1. Reset vector collection
-    vs = VectorService()
-    vs.reset_collection()
-    
-    # 2. Re-process all documents in DB
+
+    worker = get_ingestion_worker()
+    vs = worker.vector_service
+    if vs.building_collection_name:
+        raise HTTPException(status_code=409, detail="A full re-index is already in progress")
+
+    config = current_index_config()
+    # A different embedding model can't share a collection with the old vectors
+    full = not only_changed or vs.collection_model() != vs.embedding_service.model_name
     docs = db.query(Document).all()
+    if not full:
+        docs = [d for d in docs if d.index_config != config]
+
+    # Documents uploaded before file paths were stored: index the upload
+    # directory once instead of listing it per document.
+    legacy_paths = None
     upload_dir = "./uploads"
-    
-    reindexed_count = 0
+
+    targets = []
     for doc in docs:
-        # Find the actual file path
-        # Note: In a real app we'd store the exact path, but here we can search
-        files = os.listdir(upload_dir)
-        matching_files = [f for f in files if f.endswith(f"_{doc.filename}")]
-        
-        if matching_files:
-            file_path = os.path.join(upload_dir, matching_files[0])
-            doc.processed = 0 # Mark as pending
-            db.commit()
-            background_tasks.add_task(process_document_task, doc.id, file_path)
-            reindexed_count += 1
-            
-    return {"message": f"Re-indexing started for {reindexed_count} documents."}
+        if not doc.file_path:
+            if legacy_paths is None:
+                legacy_paths = {}
+                if os.path.isdir(upload_dir):
+                    # Stored as "<uuid>_<original filename>"
+                    for f in sorted(os.listdir(upload_dir)):
+                        legacy_paths.setdefault(f.split("_", 1)[-1], os.path.join(upload_dir, f))
+            doc.file_path = legacy_paths.get(doc.filename)
+        if doc.file_path and os.path.exists(doc.file_path):
+            targets.append(doc)
+    db.commit()
+
+    target_collection = vs.begin_rebuild() if full else None
+    for doc in targets:
+        # Queued as a durable job; the worker pool bounds concurrency
+        worker.enqueue(db, doc.id, doc.file_path, target_collection=target_collection)
+    rebuild = None
+    if target_collection:
+        # Settles at once when there is nothing to rebuild; otherwise its
+        # outcome shows up under GET /api/admin/jobs
+        rebuild = worker.check_rebuild(db, target_collection)
+
+    mode = f"full rebuild into {target_collection}" if full else "changed documents only"
+    return {"message": f"Re-indexing started for {len(targets)} documents ({mode}).", "rebuild": rebuild}
+
+@router.get("/jobs")
+def ingestion_stats(admin: User = Depends(require_admin)):
+    from services.ingestion import get_ingestion_worker
+    return get_ingestion_worker().stats()
+
+@router.get("/llm-pool")
+def llm_pool_stats(admin: User = Depends(require_admin)):
+    from services.llm_service import get_llm_client
+    return get_llm_client().stats()
+
+@router.get("/context-stats")
+def context_stats(admin: User = Depends(require_admin)):
+    from services.context_packer import get_context_packer
+    return get_context_packer().stats()
+
+@router.get("/llm-queue")
+def llm_queue_stats(admin: User = Depends(require_admin)):
+    from services.llm_scheduler import get_llm_scheduler
+    return get_llm_scheduler().stats()
+
+@router.get("/history-queue")
+def history_queue_stats(admin: User = Depends(require_admin)):
+    from db.write_behind import get_message_writer
+    return get_message_writer().stats()
+
+@router.get("/stream-stats")
+def stream_stats(admin: User = Depends(require_admin)):
+    from services.sse import get_token_coalescer
+    return get_token_coalescer().stats()
+
+@router.get("/streams")
+def chat_stream_stats(admin: User = Depends(require_admin)):
+    from services.stream_control import get_stream_registry
+    return get_stream_registry().stats()
+
+
+# --- Prometheus metrics -----------------------------------------------------
+
+# Static bearer token for scrapers, which cannot refresh a login JWT
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+async def require_metrics_access(authorization: Optional[str] = Header(None)):
+    token = authorization[7:] if authorization and authorization.startswith("Bearer ") else None
+    if not token:
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    if METRICS_TOKEN and hmac.compare_digest(token, METRICS_TOKEN):
+        return
+    require_admin(await get_current_user(token))
+
+def _threadpool_limiter():
+    import anyio.to_thread
+    return anyio.to_thread.current_default_thread_limiter()
+
+@REGISTRY.gauge("auramind_threadpool_size", "Threads available to sync endpoints and run_in_threadpool.")
+def _threadpool_size():
+    return _threadpool_limiter().total_tokens
+
+@REGISTRY.gauge("auramind_threadpool_busy", "Threadpool threads in use.")
+def _threadpool_busy():
+    return _threadpool_limiter().borrowed_tokens
+
+@REGISTRY.gauge("auramind_threadpool_waiting", "Calls queued for a threadpool thread.")
+def _threadpool_waiting():
+    return _threadpool_limiter().statistics().tasks_waiting
+
+@REGISTRY.gauge("auramind_embedding_batch_queue", "Queries waiting for the embedding batcher.")
+def _embedding_queue():
+    from services.embedding_batcher import get_embedding_batcher
+    return get_embedding_batcher().stats()["queued"]
+
+@REGISTRY.gauge("auramind_llm_queue_depth", "Requests waiting for a generation slot.")
+def _llm_queue():
+    from services.llm_scheduler import get_llm_scheduler
+    return get_llm_scheduler().stats()["queued"]
+
+@REGISTRY.gauge("auramind_llm_active", "Generations holding a scheduler slot.")
+def _llm_active():
+    from services.llm_scheduler import get_llm_scheduler
+    return get_llm_scheduler().stats()["active"]
+
+@REGISTRY.gauge("auramind_history_write_queue", "Chat messages waiting to be committed.")
+def _history_queue():
+    from db.write_behind import get_message_writer
+    return get_message_writer().stats()["depth"]
+
+@REGISTRY.gauge("auramind_password_hash_pending", "bcrypt calls queued or running.")
+def _hash_pending():
+    return get_password_hasher().stats()["pending"]
+
+@REGISTRY.gauge("auramind_chat_streams_active", "Chat answers currently streaming.")
+def _streams_active():
+    from services.stream_control import get_stream_registry
+    return get_stream_registry().stats()["active"]
+
+@REGISTRY.gauge("auramind_ingest_jobs_active", "Documents being ingested by the worker pool.")
+def _ingest_active():
+    from services.ingestion import get_ingestion_worker
+    return len(get_ingestion_worker()._active)
+
+@REGISTRY.gauge("auramind_batch_jobs_running", "Batch question jobs running in this worker.")
+def _batch_jobs_running():
+    from services.batch_query import get_batch_job_manager
+    return get_batch_job_manager().stats()["running"]
+
+@router.get("/metrics", response_class=PlainTextResponse, dependencies=[Depends(require_metrics_access)])
+async def metrics():
+    # Async so the threadpool gauges are read from the event loop
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
@@ -1,9 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
-from db.session import get_db
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.session import get_async_db
 from models.database import User, UserRole
-from core.security import verify_password, get_password_hash, create_access_token
+from core.security import create_access_token, get_password_hasher, PasswordHasherBusy
 from pydantic import BaseModel, EmailStr, ConfigDict, field_validator
 
 router = APIRouter()
@@ -27,30 +28,48 @@ class UserResponse(BaseModel):
         # ("admin" / "user") rather than rejecting it or emitting "UserRole.ADMIN".
         return v.value if isinstance(v, UserRole) else v
 
+def _hasher_busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many sign-in attempts in progress, try again shortly",
+        headers={"Retry-After": "1"},
+    )
+
+# Async with the async session: the only blocking work, bcrypt, runs on the
+# password hasher's own executor, so a login burst never holds threadpool
+# workers that sync endpoints need.
 @router.post("/register", response_model=UserResponse)
-def register(user_in: UserCreate, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.email == user_in.email).first()
+async def register(user_in: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    db_user = await db.scalar(select(User.id).where(User.email == user_in.email))
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
     # First user becomes admin
-    user_count = db.query(User).count()
+    user_count = await db.scalar(select(func.count(User.id)))
     role = UserRole.ADMIN if user_count == 0 else UserRole.USER
 
+    try:
+        hashed_password = await get_password_hasher().hash(user_in.password)
+    except PasswordHasherBusy:
+        raise _hasher_busy()
     new_user = User(
         email=user_in.email,
-        hashed_password=get_password_hash(user_in.password),
+        hashed_password=hashed_password,
         role=role
     )
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     return new_user
 
 @router.post("/login")
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
+    user = await db.scalar(select(User).where(User.email == form_data.username))
+    try:
+        valid = user is not None and await get_password_hasher().verify(form_data.password, user.hashed_password)
+    except PasswordHasherBusy:
+        raise _hasher_busy()
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -1,91 +1,370 @@
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from typing import List, Optional
+from datetime import datetime
+import os
 import json
+import time
+import uuid
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from db.session import get_db
-from services.llm_service import get_llm_client
-from services.vector_service import VectorService
+from db.session import get_db, get_async_db
+from db.write_behind import get_message_writer
+from services.llm_service import get_llm_client, LLMErrorMessage
+from services.vector_service import get_vector_service
+from services.answer_cache import get_answer_cache
+from services.reranker import get_reranker, RERANK_CANDIDATES, RERANK_TOP_K
+from services.llm_scheduler import get_llm_scheduler, AdmissionRejected
+from services.context_packer import get_context_packer, citations_for
+from services.sse import encode_event, chunk_frame, DONE_FRAME, get_token_coalescer
+from services.stream_control import get_stream_registry, StreamConflict
+from services.metrics import RequestTimings, observe_stage
 from api.documents import get_current_user
-from models.database import User, Conversation, Message as DBMessage
-from pydantic import BaseModel
+from models.database import User, UserRole, Conversation, BatchJob, JobStatus
+from services.batch_query import BatchRun, get_batch_job_manager, BATCH_MAX_QUERIES, BATCH_JOB_MAX_QUERIES
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 
 router = APIRouter()
-llm_client = get_llm_client()
-vector_service = VectorService()
+# App-scoped singletons; heavy parts (store client, models) load on first use
+vector_service = get_vector_service()
+answer_cache = get_answer_cache()
+reranker = get_reranker()
+llm_scheduler = get_llm_scheduler()
+context_packer = get_context_packer()
+token_coalescer = get_token_coalescer()
+stream_registry = get_stream_registry()
 
 class ChatRequest(BaseModel):
     query: str
     conversation_id: Optional[int] = None
+    use_cache: bool = True
+    # Per-request hybrid retrieval weights (defaults from HYBRID_*_WEIGHT)
+    vector_weight: Optional[float] = None
+    lexical_weight: Optional[float] = None
+    # Client-chosen id for POST /cancel (one is generated when omitted)
+    request_id: Optional[str] = Field(None, max_length=64)
+    # Adds a {"type": "timings"} event with per-stage milliseconds before [DONE]
+    include_timings: bool = False
+
+class CancelRequest(BaseModel):
+    request_id: str
+
+class BatchRequest(BaseModel):
+    queries: List[str] = Field(..., min_length=1)
+    # False stops after retrieval and packing (for retrieval evaluation)
+    generate: bool = True
+    use_cache: bool = True
+    vector_weight: Optional[float] = None
+    lexical_weight: Optional[float] = None
+    # Answers generated at once (defaults to BATCH_CONCURRENCY)
+    concurrency: Optional[int] = Field(None, ge=1, le=32)
+
+class BatchJobResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    status: str
+    total: int
+    completed: int
+    failed: int
+    error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
+    @field_validator("status", mode="before")
+    @classmethod
+    def _status_to_value(cls, v):
+        return v.value if isinstance(v, JobStatus) else v
+
+class ChatPreferences(BaseModel):
+    answer_cache_opt_out: bool
 
 from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+
+@router.put("/preferences", response_model=ChatPreferences)
+def update_preferences(
+    prefs: ChatPreferences,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    # current_user is a cached, detached instance; update this session's copy
+    user = db.get(User, current_user.id)
+    user.answer_cache_opt_out = prefs.answer_cache_opt_out
+    db.commit()
+    return prefs
 
 @router.post("/query")
 async def query_rag(
     request: ChatRequest,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     # Guard against IDOR: if a conversation is targeted, it must belong to the
     # current user before we stream into / persist messages on it.
     if request.conversation_id is not None:
-        conv = db.query(Conversation).filter(
-            Conversation.id == request.conversation_id,
-            Conversation.user_id == current_user.id,
-        ).first()
-        if not conv:
+        conv_id = await db.scalar(
+            select(Conversation.id).where(
+                Conversation.id == request.conversation_id,
+                Conversation.user_id == current_user.id,
+            )
+        )
+        if conv_id is None:
             raise HTTPException(status_code=404, detail="Conversation not found")
 
-    async def event_generator():
-        # 1. Retrieve relevant chunks
-        results = await vector_service.search(request.query, n_results=5)
-        
+    # Cached answers were retrieved with the default weights
+    default_retrieval = request.vector_weight is None and request.lexical_weight is None
+    use_cache = request.use_cache and default_retrieval and not current_user.answer_cache_opt_out
+
+    # Admission control: a request the LLM can't serve within the queue
+    # deadline is refused before any retrieval work is spent on it. A cached
+    # answer needs no LLM, so those are still served.
+    timings = RequestTimings()
+    query_embedding = None
+    cached = None
+    try:
+        llm_scheduler.check_admission(current_user.id)
+    except AdmissionRejected as e:
+        if use_cache:
+            with timings.stage("embed_query"):
+                query_embedding = await vector_service.embed_query(request.query)
+            cached = answer_cache.lookup(query_embedding, vector_service.corpus_version)
+        if not cached:
+            raise HTTPException(
+                status_code=429,
+                detail=f"The model is busy; please retry in {e.retry_after}s.",
+                headers={"Retry-After": str(e.retry_after)},
+            )
+
+    try:
+        stream = stream_registry.open(request.request_id or uuid.uuid4().hex, current_user.id)
+    except StreamConflict:
+        raise HTTPException(status_code=409, detail="A request with this id is already streaming")
+
+    def persist(answer: str, truncated: bool, citations):
+        # Hand history to the write-behind queue; it is committed in a batch
+        # with other conversations' messages, off this stream
+        if request.conversation_id:
+            get_message_writer().submit([
+                {"role": "user", "content": request.query, "citations": None, "truncated": False,
+                 "conversation_id": request.conversation_id},
+                {"role": "bot", "content": answer, "citations": json.dumps(citations), "truncated": truncated,
+                 "conversation_id": request.conversation_id},
+            ])
+
+    def finish():
+        observe_stage("chat_total", time.perf_counter() - timings.started)
+        if request.include_timings:
+            stream.emit(encode_event({'type': 'timings', 'timings': timings.breakdown()}))
+        stream.emit(DONE_FRAME)
+
+    async def produce():
+        # Runs as its own task (see services/stream_control.py): a disconnect
+        # or /cancel cancels it wherever it is awaiting
+        nonlocal query_embedding, cached
+        # 1. Embed the query once; it keys both the answer cache and retrieval
+        if query_embedding is None:
+            with timings.stage("embed_query"):
+                query_embedding = await vector_service.embed_query(request.query)
+        corpus_version = vector_service.corpus_version
+
+        if cached is None and use_cache:
+            cached = answer_cache.lookup(query_embedding, corpus_version)
+        if cached:
+            # Replay a near-identical question answered against this exact corpus
+            citations = cached["citations"]
+            stream.parts.append(cached["answer"])
+            stream.on_close = lambda answer, truncated: persist(answer, truncated, citations)
+            stream.emit(encode_event({'type': 'citations', 'citations': citations, 'cached': True}))
+            stream.emit(encode_event({'type': 'chunk', 'text': cached["answer"], 'cached': True}), cached["answer"])
+            finish()
+            return
+
+        # 2. Retrieve relevant chunks; over-fetch when a reranker will
+        # pick the few best for the prompt
+        with timings.stage("retrieve"):
+            results = await vector_service.search(
+                request.query,
+                n_results=RERANK_CANDIDATES if reranker else 5,
+                query_embeddings=[query_embedding],
+                vector_weight=request.vector_weight,
+                lexical_weight=request.lexical_weight,
+            )
+        if reranker:
+            with timings.stage("rerank"):
+                results = await reranker.rerank(request.query, results, top_k=RERANK_TOP_K)
+
         if not results:
-            yield f"data: {json.dumps({'error': 'No relevant context found.'})}\n\n"
+            stream.emit(encode_event({'error': 'No relevant context found.'}))
+            finish()
             return
 
-        # 2. Extract context and citations
-        contexts = [r['content'] for r in results]
-        citations = []
-        for r in results:
-            citations.append({
-                "content": r['content'][:200] + "...", 
-                "pages": r['metadata'].get('pages', 'Unknown'),
-                "document_name": r['metadata'].get('filename', 'Unknown'),
-                "document_id": r['metadata'].get('document_id')
-            })
+        # 3. Merge neighbouring chunks and pack them into the prompt's
+        # token budget; only chunks that made it in are cited. Token counting
+        # runs the tokenizer, so it stays off the event loop.
+        with timings.stage("pack"):
+            contexts, results, packing = await run_in_threadpool(context_packer.pack, results)
+        citations = citations_for(results)
 
         # Send citations first
-        yield f"data: {json.dumps({'type': 'citations', 'citations': citations})}\n\n"
+        stream.emit(encode_event({'type': 'citations', 'citations': citations, 'context': packing}))
 
-        # 3. Generate answer using LLM streaming
-        full_answer = ""
-        async for chunk in llm_client.generate_stream(request.query, context=contexts):
-            full_answer += chunk
-            yield f"data: {json.dumps({'type': 'chunk', 'text': chunk})}\n\n"
+        # Queue for a generation slot only now that there is a prompt: a
+        # slot or rate token taken before retrieval would be wasted on
+        # questions that end without generating
+        ticket = llm_scheduler.enqueue(current_user.id)
+        try:
+            # Wait for a generation slot, reporting queue position changes
+            position = 0
+            while not ticket.granted:
+                if time.monotonic() - ticket.enqueued_at > llm_scheduler.deadline:
+                    stream.emit(encode_event({'error': 'The model is busy. Please try again shortly.'}))
+                    finish()
+                    return
+                new_position = llm_scheduler.position(ticket)
+                if new_position and new_position != position:
+                    position = new_position
+                    stream.emit(encode_event({'type': 'queued', 'position': position}))
+                await llm_scheduler.wait(ticket, timeout=1.0)
+            timings.record("llm_queue_wait", ticket.granted_at - ticket.enqueued_at)
 
-        # 4. Save to database once finished
-        if request.conversation_id:
-            try:
-                # Save User Message
-                user_msg = DBMessage(
-                    role="user",
-                    content=request.query,
-                    conversation_id=request.conversation_id
-                )
-                db.add(user_msg)
-                
-                # Save Bot Message
-                bot_msg = DBMessage(
-                    role="bot",
-                    content=full_answer,
-                    citations=json.dumps(citations),
-                    conversation_id=request.conversation_id
-                )
-                db.add(bot_msg)
-                db.commit()
-            except Exception as e:
-                print(f"Error saving to history: {e}")
-
-        yield "data: [DONE]\n\n"
-
-    return StreamingResponse(event_generator(), media_type="text/event-stream")
+            # 4. Generate answer using LLM streaming; deltas are kept in a
+            # list (joined once) and coalesced into fewer SSE frames. From
+            # here on, a stop or disconnect persists what was delivered.
+            stream.on_close = lambda answer, truncated: persist(answer, truncated, citations)
+            failed = False
+            generation_started = time.perf_counter()
+
+            async def deltas():
+                nonlocal failed
+                async for chunk in get_llm_client().generate_stream(request.query, context=contexts):
+                    if not stream.generated:
+                        # The LLM client records TTFT in the histograms itself
+                        timings.stages["ttft"] = time.perf_counter() - generation_started
+                    failed = failed or isinstance(chunk, LLMErrorMessage)
+                    stream.parts.append(chunk)
+                    stream.generated += 1
+                    yield chunk
+
+            async for text in token_coalescer.coalesce(deltas()):
+                stream.emit(chunk_frame(text), text)
+            timings.stages["generate"] = time.perf_counter() - generation_started
+        finally:
+            # Frees the generation slot as soon as the answer ends or is cancelled
+            llm_scheduler.release(ticket)
+
+        full_answer = "".join(stream.parts)
+        if use_cache and not failed and full_answer:
+            answer_cache.store(query_embedding, corpus_version, request.query, full_answer, citations)
+        finish()
+
+    stream.start(produce())
+    return StreamingResponse(
+        stream.frames(),
+        media_type="text/event-stream",
+        headers={"X-Request-ID": stream.request_id},
+        # Runs once the response ends, including after a client disconnect
+        # that left the body generator suspended
+        background=BackgroundTask(stream.aclose, "disconnected"),
+    )
+
+@router.post("/cancel")
+async def cancel_query(request: CancelRequest, current_user: User = Depends(get_current_user)):
+    """Stops an answer that is still streaming; what was sent is kept, marked truncated."""
+    if not stream_registry.cancel(request.request_id, current_user.id):
+        raise HTTPException(status_code=404, detail="No active request with this id")
+    return {"request_id": request.request_id, "cancelled": True}
+
+def _batch_run(request: BatchRequest, current_user: User) -> BatchRun:
+    options = {"concurrency": request.concurrency} if request.concurrency else {}
+    return BatchRun(
+        request.queries,
+        current_user.id,
+        generate=request.generate,
+        use_cache=request.use_cache and not current_user.answer_cache_opt_out,
+        vector_weight=request.vector_weight,
+        lexical_weight=request.lexical_weight,
+        **options,
+    )
+
+@router.post("/batch")
+async def batch_query(request: BatchRequest, current_user: User = Depends(get_current_user)):
+    """Answers many questions in one request, streamed back as NDJSON.
+
+    One line per question in completion order (with retrieval results,
+    citations and per-stage timings), then a `{"summary": ...}` line.
+    Nothing is written to conversation history.
+    """
+    if len(request.queries) > BATCH_MAX_QUERIES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {BATCH_MAX_QUERIES} queries per request; submit larger sets to /api/chat/batch/jobs",
+        )
+    run = _batch_run(request, current_user)
+
+    async def lines():
+        async for item in run.results():
+            yield json.dumps(item) + "\n"
+        yield json.dumps({"summary": run.summary()}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson", background=BackgroundTask(run.aclose))
+
+@router.post("/batch/jobs", response_model=BatchJobResponse, status_code=202)
+async def submit_batch_job(request: BatchRequest, current_user: User = Depends(get_current_user)):
+    """Runs a batch in the background; poll the job and fetch its results when done."""
+    if len(request.queries) > BATCH_JOB_MAX_QUERIES:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_JOB_MAX_QUERIES} queries per job")
+    return await get_batch_job_manager().submit(_batch_run(request, current_user))
+
+def _check_batch_job_owner(job: Optional[BatchJob], current_user: User) -> BatchJob:
+    # Only the submitter (or an admin) may see or cancel a job
+    if not job or (current_user.role != UserRole.ADMIN and job.user_id != current_user.id):
+        raise HTTPException(status_code=404, detail="Batch job not found")
+    return job
+
+def _get_batch_job_for_user(job_id: int, db: Session, current_user: User) -> BatchJob:
+    return _check_batch_job_owner(db.get(BatchJob, job_id), current_user)
+
+@router.get("/batch/jobs/{job_id}", response_model=BatchJobResponse)
+def get_batch_job(job_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    return _get_batch_job_for_user(job_id, db, current_user)
+
+@router.get("/batch/jobs/{job_id}/results")
+def get_batch_job_results(job_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    """The NDJSON results written so far (all of them once the job has finished)."""
+    job = _get_batch_job_for_user(job_id, db, current_user)
+    if not job.result_path or not os.path.exists(job.result_path):
+        raise HTTPException(status_code=404, detail="No results yet")
+    # A running job keeps appending; serve only the complete lines there now
+    size = os.path.getsize(job.result_path)
+
+    def read():
+        with open(job.result_path, "rb") as f:
+            remaining = size
+            pending = b""
+            while remaining > 0:
+                block = f.read(min(remaining, 1024 * 1024))
+                if not block:
+                    break
+                remaining -= len(block)
+                lines, _, pending = (pending + block).rpartition(b"\n")
+                if lines:
+                    yield lines + b"\n"
+
+    return StreamingResponse(read(), media_type="application/x-ndjson")
+
+@router.post("/batch/jobs/{job_id}/cancel", response_model=BatchJobResponse)
+async def cancel_batch_job(
+    job_id: int,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Stops a running job; it is marked cancelled once it has wound down."""
+    # Async: the job's task must be cancelled from the event loop's thread
+    job = _check_batch_job_owner(await db.get(BatchJob, job_id), current_user)
+    if job.status not in (JobStatus.PENDING, JobStatus.RUNNING):
+        raise HTTPException(status_code=409, detail=f"Job is already {job.status.value}")
+    if not get_batch_job_manager().cancel(job.id):
+        raise HTTPException(status_code=409, detail="The job is running in another server worker")
+    return job
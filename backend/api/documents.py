@@ -1,71 +1,63 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, Response, UploadFile, File
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from db.session import get_db, SessionLocal
-from models.database import Document, User
-from services.document_processor import DocumentProcessor
-from services.vector_service import VectorService
+from db.session import get_db, AsyncSessionLocal
+from models.database import Document, User, UserRole, IngestionJob, JobStatus
+from services.ingestion import get_ingestion_worker
 from api.auth import oauth2_scheme
-from core.security import decode_access_token
-import shutil
+from core import auth_cache
+from api.pagination import keyset_page, page_params
+from pydantic import BaseModel, ConfigDict, field_validator
+from datetime import datetime
+from typing import Optional, Tuple
+import hashlib
 import os
 import uuid
 
 router = APIRouter()
-doc_processor = DocumentProcessor()
-vector_service = VectorService()
+UPLOAD_BLOCK_SIZE = 1024 * 1024
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    payload = decode_access_token(token)
-    if not payload:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    user = db.query(User).filter(User.email == payload["sub"]).first()
-    return user
-
-def process_document_task(doc_id: int, file_path: str):
-    # Open a dedicated session: the request-scoped session is closed once the
-    # response is sent, and SQLAlchemy sessions are not safe to share with the
-    # worker thread this background task runs in.
-    db_session = SessionLocal()
-    try:
-        pages = doc_processor.extract_text(file_path)
-        chunks = doc_processor.chunk_text(pages)
-
-        doc = db_session.query(Document).filter(Document.id == doc_id).first()
-        filename = doc.filename if doc else "Unknown"
+class JobResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
 
-        # Prepend filename to each chunk for better LLM context recognition
-        vector_chunks = [f"Source: {filename}\nContent: {c['content']}" for c in chunks]
-        metadatas = [{"document_id": str(doc_id), "pages": str(c['pages']), "filename": filename} for c in chunks]
+    id: int
+    document_id: int
+    status: str
+    attempts: int
+    max_attempts: int
+    progress: float
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
 
-        # Use local EmbeddingService for near-instant indexing
-        from services.embedding_service import EmbeddingService
-        embedding_service = EmbeddingService()
+    @field_validator("status", mode="before")
+    @classmethod
+    def _status_to_value(cls, v):
+        return v.value if isinstance(v, JobStatus) else v
 
-        embeddings = embedding_service.get_batch_embeddings(vector_chunks)
-
-        vector_service.add_chunks(vector_chunks, metadatas, embeddings=embeddings)
-
-        # Mark as processed
-        if doc:
-            doc.processed = 1
-            db_session.commit()
-    except Exception as e:
-        print(f"Error processing document: {e}")
-        db_session.rollback()
-        doc = db_session.query(Document).filter(Document.id == doc_id).first()
-        if doc:
-            doc.processed = -1
-            db_session.commit()
-    finally:
-        db_session.close()
+async def get_current_user(token: str = Depends(oauth2_scheme)):
+    # Async so a cache hit resolves on the event loop without a threadpool hop
+    payload = auth_cache.decode_token_cached(token)
+    if not payload:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    user = auth_cache.get_cached_user(payload["sub"])
+    if user is None:
+        async with AsyncSessionLocal() as db:
+            user = await db.scalar(select(User).where(User.email == payload["sub"]))
+        if user is None:
+            raise HTTPException(status_code=401, detail="User no longer exists")
+        # Closing the session detached the instance; it is shared read-only
+        auth_cache.cache_user(user)
+    return user
 
 @router.post("/upload")
-async def upload_document(
-    background_tasks: BackgroundTasks,
+def upload_document(
     file: UploadFile = File(...),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
+    # Plain def: the copy, hash and sync session run in the threadpool, not on the event loop
     if not file.filename.endswith(".pdf"):
         raise HTTPException(status_code=400, detail="Only PDF files are supported")
     
@@ -74,21 +66,74 @@ async def upload_document(
     os.makedirs(upload_dir, exist_ok=True)
     file_path = os.path.join(upload_dir, f"{file_id}_{file.filename}")
     
+    # Hash while writing so duplicate detection costs no extra pass over the file
+    hasher = hashlib.sha256()
     with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    
+        while block := file.file.read(UPLOAD_BLOCK_SIZE):
+            hasher.update(block)
+            buffer.write(block)
+    content_hash = hasher.hexdigest()
+
+    # Byte-identical file already indexed (or being indexed): link to it
+    # instead of storing and embedding a second copy.
+    existing = db.query(Document).filter(
+        Document.content_hash == content_hash,
+        Document.processed != -1,
+    ).order_by(Document.id).first()
+    if existing:
+        os.remove(file_path)
+        return {
+            "message": f"Identical file already uploaded as '{existing.filename}'",
+            "document_id": existing.id,
+            "duplicate": True,
+        }
+
     new_doc = Document(
         filename=file.filename,
-        uploader_id=current_user.id
+        uploader_id=current_user.id,
+        content_hash=content_hash,
+        file_path=file_path,
     )
     db.add(new_doc)
     db.commit()
     db.refresh(new_doc)
     
-    background_tasks.add_task(process_document_task, new_doc.id, file_path)
+    # Processing runs in the ingestion worker pool, not in this process
+    job = get_ingestion_worker().enqueue(db, new_doc.id, file_path)
     
-    return {"message": "File uploaded successfully, processing started", "document_id": new_doc.id}
+    return {"message": "File uploaded successfully, processing started", "document_id": new_doc.id, "job_id": job.id}
 
 @router.get("/")
-def list_documents(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    return db.query(Document).all()
+def list_documents(
+    response: Response,
+    page: Tuple[int, Optional[str]] = Depends(page_params(100)),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Newest uploads first; older pages via the X-Next-Cursor header."""
+    limit, cursor = page
+    query = db.query(
+        Document.id, Document.filename, Document.upload_date, Document.processed, Document.uploader_id
+    )
+    return [row._asdict() for row in keyset_page(query, Document.id, limit, cursor, response)]
+
+def _get_job_for_user(job_id: int, db: Session, current_user: User) -> IngestionJob:
+    job = db.query(IngestionJob).filter(IngestionJob.id == job_id).first()
+    # Only the uploader (or an admin) may see or cancel a job; jobs of a
+    # deleted document are gone with it
+    if not job or job.document is None or (
+        current_user.role != UserRole.ADMIN and job.document.uploader_id != current_user.id
+    ):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+def get_job(job_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    return _get_job_for_user(job_id, db, current_user)
+
+@router.post("/jobs/{job_id}/cancel", response_model=JobResponse)
+def cancel_job(job_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    job = _get_job_for_user(job_id, db, current_user)
+    if job.status not in (JobStatus.PENDING, JobStatus.RUNNING):
+        raise HTTPException(status_code=409, detail=f"Job is already {job.status.value}")
+    return get_ingestion_worker().cancel(db, job)
@@ -1,10 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import List, Optional, Tuple
 import json
 from db.session import get_db
 from models.database import User, Conversation, Message as DBMessage
 from api.documents import get_current_user
+from api.pagination import keyset_page, page_params
 from pydantic import BaseModel
 from datetime import datetime
 
@@ -21,7 +22,8 @@ class ConversationSchema(BaseModel):
 class MessageSchema(BaseModel):
     role: str
     content: str
-    citations: str | None
+    citations: str | None = None
+    truncated: bool | None = None
     created_at: datetime
 
     class Config:
@@ -29,21 +31,42 @@ class MessageSchema(BaseModel):
 
 @router.get("/conversations", response_model=List[ConversationSchema])
 def list_conversations(
+    response: Response,
+    page: Tuple[int, Optional[str]] = Depends(page_params(50)),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    return db.query(Conversation).filter(Conversation.user_id == current_user.id).order_by(Conversation.created_at.desc()).all()
+    """Newest conversations first; older pages via the X-Next-Cursor header."""
+    limit, cursor = page
+    query = db.query(Conversation.id, Conversation.title, Conversation.created_at).filter(
+        Conversation.user_id == current_user.id
+    )
+    return keyset_page(query, Conversation.id, limit, cursor, response, sort_column=Conversation.created_at)
 
 @router.get("/conversations/{conv_id}/messages", response_model=List[MessageSchema])
 def get_messages(
     conv_id: int,
+    response: Response,
+    page: Tuple[int, Optional[str]] = Depends(page_params(100)),
+    include_citations: bool = False,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    conv = db.query(Conversation).filter(Conversation.id == conv_id, Conversation.user_id == current_user.id).first()
-    if not conv:
+    """The latest messages of a conversation, oldest first.
+
+    The X-Next-Cursor header fetches the page before this one. Citations
+    JSON is only read from the database when `include_citations` is set.
+    """
+    limit, cursor = page
+    conv_id = db.query(Conversation.id).filter(Conversation.id == conv_id, Conversation.user_id == current_user.id).scalar()
+    if conv_id is None:
         raise HTTPException(status_code=404, detail="Conversation not found")
-    return conv.messages
+    columns = [DBMessage.id, DBMessage.role, DBMessage.content, DBMessage.truncated, DBMessage.created_at]
+    if include_citations:
+        columns.append(DBMessage.citations)
+    query = db.query(*columns).filter(DBMessage.conversation_id == conv_id)
+    rows = keyset_page(query, DBMessage.id, limit, cursor, response, sort_column=DBMessage.created_at)
+    return rows[::-1]
 
 @router.post("/conversations")
 def create_conversation(
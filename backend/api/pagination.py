@@ -0,0 +1,69 @@
+"""Keyset (cursor) pagination for list endpoints.
+
+Pages are selected with `WHERE (sort_key, id) < cursor ORDER BY sort_key
+DESC, id DESC LIMIT n`, which an index on the sort key serves directly, so
+page 1000 costs the same as page 1 (OFFSET would scan every skipped row).
+Responses stay plain JSON lists; the cursor for the next (older) page is
+sent in the `X-Next-Cursor` header and is absent on the last page.
+"""
+import base64
+import datetime
+from typing import Any, List, Optional, Tuple
+
+from fastapi import HTTPException, Query, Response
+from sqlalchemy import and_, or_
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+MAX_PAGE_SIZE = 500
+
+def encode_cursor(sort_value: Any, row_id: int) -> str:
+    if isinstance(sort_value, datetime.datetime):
+        sort_value = sort_value.isoformat()
+    raw = f"{sort_value}|{row_id}" if sort_value is not None else str(row_id)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, datetime_key: bool) -> Tuple[Any, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        if not datetime_key:
+            return None, int(raw)
+        sort_value, row_id = raw.rsplit("|", 1)
+        return datetime.datetime.fromisoformat(sort_value), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def page_params(default: int):
+    """Query parameters shared by paginated endpoints."""
+    def params(
+        limit: int = Query(default, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[str] = Query(None, description="Value of a previous page's X-Next-Cursor header"),
+    ) -> Tuple[int, Optional[str]]:
+        return limit, cursor
+    return params
+
+def keyset_page(query, id_column, limit: int, cursor: Optional[str], response: Response,
+                sort_column=None) -> List[Any]:
+    """Returns one page of `query`, newest first, and sets the next cursor.
+
+    Rows are ordered by `sort_column` (a timestamp) with `id_column` as the
+    tie-breaker, or by `id_column` alone. Selected rows must expose the
+    sort and id columns as attributes.
+    """
+    if cursor:
+        sort_value, row_id = decode_cursor(cursor, datetime_key=sort_column is not None)
+        if sort_column is None:
+            query = query.filter(id_column < row_id)
+        else:
+            query = query.filter(or_(
+                sort_column < sort_value,
+                and_(sort_column == sort_value, id_column < row_id),
+            ))
+    order = [id_column.desc()] if sort_column is None else [sort_column.desc(), id_column.desc()]
+    # One extra row tells us whether another page exists without a COUNT
+    rows = query.order_by(*order).limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        sort_value = getattr(last, sort_column.key) if sort_column is not None else None
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(sort_value, getattr(last, id_column.key))
+    return rows
@@ -0,0 +1,108 @@
+"""Load test for the authentication hot path against a running server.
+
+Phases:
+  baseline  - unauthenticated GET / (framework + network floor)
+  authed    - authenticated GET of an empty conversation list; the gap to
+              baseline is the per-request auth overhead
+  logins    - a login storm, reporting logins/s
+  contended - the authed phase again while the login storm runs, showing
+              whether bcrypt starves regular requests
+
+To compare before/after, run it against a server on the previous commit and
+then on this one (or with AUTH_CACHE_TTL=0 to isolate the token/user cache):
+    uvicorn main:app --port 8000
+    python -m benchmarks.bench_auth --url http://localhost:8000 --label after
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import uuid
+
+import httpx
+
+async def register_and_login(client: httpx.AsyncClient, email: str, password: str) -> str:
+    await client.post("/api/auth/register", json={"email": email, "password": password})
+    res = await client.post("/api/auth/login", data={"username": email, "password": password})
+    res.raise_for_status()
+    return res.json()["access_token"]
+
+
+async def hammer(client, method, path, concurrency, duration, **kwargs):
+    """Issues requests from `concurrency` loops for `duration` seconds."""
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + duration
+
+    async def loop():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                res = await client.request(method, path, **kwargs)
+                if res.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(loop() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies), 2) if latencies else None,
+        "p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))], 2) if latencies else None,
+    }
+
+
+async def run(args):
+    limits = httpx.Limits(max_connections=args.concurrency + args.login_concurrency + 4)
+    async with httpx.AsyncClient(base_url=args.url, timeout=60, limits=limits) as client:
+        email, password = f"bench-{uuid.uuid4().hex[:8]}@example.com", "bench-password"
+        token = await register_and_login(client, email, password)
+        authed = {"headers": {"Authorization": f"Bearer {token}"}, "params": {"limit": 1}}
+
+        results = {"label": args.label}
+        results["baseline"] = await hammer(client, "GET", "/", args.concurrency, args.duration)
+        results["authed"] = await hammer(client, "GET", "/api/history/conversations", args.concurrency, args.duration, **authed)
+        results["auth_overhead_p50_ms"] = round(results["authed"]["p50_ms"] - results["baseline"]["p50_ms"], 2)
+
+        login = {"data": {"username": email, "password": password}}
+        results["logins"] = await hammer(client, "POST", "/api/auth/login", args.login_concurrency, args.duration, **login)
+
+        storm = asyncio.create_task(
+            hammer(client, "POST", "/api/auth/login", args.login_concurrency, args.duration, **login)
+        )
+        results["contended"] = await hammer(client, "GET", "/api/history/conversations", args.concurrency, args.duration, **authed)
+        await storm
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent authenticated clients")
+    parser.add_argument("--login-concurrency", type=int, default=32, help="concurrent clients in the login storm")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per phase")
+    parser.add_argument("--label", default="run")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"[{results['label']}]")
+    print(f"{'phase':<10} {'req':>7} {'err':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    for phase in ("baseline", "authed", "logins", "contended"):
+        row = results[phase]
+        print(f"{phase:<10} {row['requests']:>7} {row['errors']:>5} {row['rps']:>8} {row['p50_ms']:>8} {row['p95_ms']:>8}")
+    print(f"auth overhead (p50): {results['auth_overhead_p50_ms']} ms")
+
+
+if __name__ == "__main__":
+    main()
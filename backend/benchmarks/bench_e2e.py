@@ -0,0 +1,427 @@
+"""End-to-end benchmark: ingestion and concurrent chat against a fake LLM.
+
+Starts benchmarks.fake_llm and the API (uvicorn main:app) on free ports,
+with the database, uploads and vector store in a scratch directory. It then
+generates a synthetic PDF corpus and measures:
+  ingestion - concurrent uploads until every ingestion job has finished
+              (documents/s and pages/s)
+  chat      - concurrent authenticated /api/chat/query SSE sessions
+              (TTFT = first chunk event, total = [DONE]; p50/p95/p99, q/s)
+Server-side stage timings are collected from the `timings` events of the
+chat responses (include_timings).
+
+The fake LLM's TTFT and token rate are fixed and seeded, so results are
+comparable across commits. Save a run and compare later ones to it:
+    python -m benchmarks.bench_e2e --out baseline.json
+    python -m benchmarks.bench_e2e --compare baseline.json --tolerance 0.15
+--compare exits with status 1 when a tracked metric regresses by more than
+the tolerance. Settings not overridden here (LLM_MAX_CONCURRENCY,
+EMBEDDING_BACKEND, ...) are inherited from the environment. With --url the
+app is not started and an existing server (and its LLM) is measured.
+
+Run from backend/:
+    python -m benchmarks.bench_e2e --docs 20 --pages 10 --queries 200 --concurrency 16
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TOPICS = {
+    "expenses": ["expense reports", "receipts", "reimbursement", "per diem", "corporate card"],
+    "security": ["VPN sessions", "password rotation", "multi-factor authentication", "laptop encryption", "phishing"],
+    "leave": ["annual leave", "sick leave", "parental leave", "public holidays", "carry-over days"],
+    "travel": ["flight bookings", "hotel limits", "travel insurance", "visa support", "rail travel"],
+    "onboarding": ["equipment requests", "buddy program", "first-week training", "badge access", "payroll setup"],
+}
+VERBS = ["must be approved by", "is reviewed every quarter by", "is handled through", "requires sign-off from",
+         "is documented by", "is escalated to"]
+OWNERS = ["the finance team", "IT security", "people operations", "the travel desk", "line managers",
+          "the compliance office"]
+FILLER = ["This applies to all full-time and contract staff.", "Exceptions are recorded in the audit log.",
+          "The policy was last revised in the spring review.", "Questions go to the internal help desk.",
+          "Regional variations are listed in the appendix."]
+
+# Metrics tracked by --compare, and whether higher is better
+TRACKED = [
+    ("chat.ttft_ms.p50", False), ("chat.ttft_ms.p95", False), ("chat.total_ms.p95", False),
+    ("chat.queries_per_s", True), ("ingestion.pages_per_s", True),
+]
+
+# --- Corpus -----------------------------------------------------------------
+
+def make_corpus(directory: str, docs: int, pages: int, seed: int) -> List[str]:
+    """Writes `docs` seeded policy-like PDFs of `pages` pages each."""
+    import fitz  # PyMuPDF, already required by ingestion
+
+    rng = random.Random(seed)
+    paths = []
+    for d in range(docs):
+        topic = rng.choice(list(TOPICS))
+        pdf = fitz.open()
+        for p in range(pages):
+            lines = [f"{topic.title()} policy {d}, section {p + 1}"]
+            for _ in range(18):
+                subject = rng.choice(TOPICS[topic])
+                lines.append(f"{subject.capitalize()} {rng.choice(VERBS)} {rng.choice(OWNERS)} "
+                             f"within {rng.randint(2, 60)} days. {rng.choice(FILLER)}")
+            page = pdf.new_page()
+            page.insert_textbox(fitz.Rect(50, 50, 545, 792), "\n".join(lines), fontsize=9)
+        path = os.path.join(directory, f"bench_{seed}_{d:04d}.pdf")
+        pdf.save(path)
+        pdf.close()
+        paths.append(path)
+    return paths
+
+
+def make_queries(count: int, seed: int) -> List[str]:
+    rng = random.Random(seed + 1)
+    queries = []
+    for i in range(count):
+        topic = rng.choice(list(TOPICS))
+        subject = rng.choice(TOPICS[topic])
+        # The index keeps queries distinct, so the answer cache can't serve them
+        queries.append(f"Who handles {subject} under the {topic} policy? (#{i})")
+    return queries
+
+# --- Processes --------------------------------------------------------------
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def spawn(args: List[str], env: Dict[str, str], cwd: str, log_path: str) -> subprocess.Popen:
+    log = open(log_path, "wb")
+    return subprocess.Popen([sys.executable, *args], env=env, cwd=cwd, stdout=log, stderr=subprocess.STDOUT)
+
+
+def stop(proc: Optional[subprocess.Popen]):
+    if proc is None or proc.poll() is not None:
+        return
+    proc.terminate()
+    try:
+        proc.wait(timeout=20)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+async def wait_until(url: str, timeout: float, proc: Optional[subprocess.Popen] = None):
+    """Polls `url` until it answers 200 (e.g. /ready once models are warm)."""
+    deadline = time.perf_counter() + timeout
+    async with httpx.AsyncClient(timeout=5) as client:
+        while time.perf_counter() < deadline:
+            if proc is not None and proc.poll() is not None:
+                raise RuntimeError(f"process exited with {proc.returncode} while waiting for {url}")
+            try:
+                if (await client.get(url)).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.5)
+    raise TimeoutError(f"{url} not ready after {timeout:.0f}s")
+
+# --- Measurements -----------------------------------------------------------
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "mean": None}
+    ordered = sorted(values)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 2)
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "mean": round(statistics.fmean(ordered), 2)}
+
+
+async def login(client: httpx.AsyncClient) -> Dict[str, str]:
+    email, password = f"bench-{uuid.uuid4().hex[:8]}@example.com", "bench-password"
+    (await client.post("/api/auth/register", json={"email": email, "password": password})).raise_for_status()
+    res = await client.post("/api/auth/login", data={"username": email, "password": password})
+    res.raise_for_status()
+    return {"Authorization": f"Bearer {res.json()['access_token']}"}
+
+
+async def run_ingestion(client, headers, paths: List[str], pages: int, concurrency: int, timeout: float):
+    semaphore = asyncio.Semaphore(concurrency)
+    upload_ms, job_ids, errors = [], [], 0
+
+    async def upload(path):
+        nonlocal errors
+        async with semaphore:
+            with open(path, "rb") as f:
+                data = f.read()
+            started = time.perf_counter()
+            res = await client.post("/api/documents/upload", headers=headers,
+                                    files={"file": (os.path.basename(path), data, "application/pdf")})
+            upload_ms.append((time.perf_counter() - started) * 1000)
+            if res.status_code != 200 or "job_id" not in res.json():
+                errors += 1
+                return
+            job_ids.append(res.json()["job_id"])
+
+    started = time.perf_counter()
+    await asyncio.gather(*(upload(p) for p in paths))
+    pending, statuses = set(job_ids), {}
+    deadline = started + timeout
+    while pending and time.perf_counter() < deadline:
+        for job_id in list(pending):
+            job = (await client.get(f"/api/documents/jobs/{job_id}", headers=headers)).json()
+            if job["status"] not in ("pending", "running"):
+                statuses[job["status"]] = statuses.get(job["status"], 0) + 1
+                pending.discard(job_id)
+        if pending:
+            await asyncio.sleep(0.25)
+    elapsed = time.perf_counter() - started
+    completed = statuses.get("completed", 0)
+    return {
+        "documents": len(paths),
+        "pages": len(paths) * pages,
+        "upload_errors": errors,
+        "jobs": statuses,
+        "timed_out": len(pending),
+        "wall_s": round(elapsed, 2),
+        "docs_per_s": round(completed / elapsed, 3),
+        "pages_per_s": round(completed * pages / elapsed, 2),
+        "upload_ms": percentiles(upload_ms),
+    }
+
+
+async def one_query(client, headers, query: str, use_cache: bool) -> Dict[str, Any]:
+    body = {"query": query, "use_cache": use_cache, "include_timings": True, "request_id": uuid.uuid4().hex}
+    started = time.perf_counter()
+    result: Dict[str, Any] = {"ttft_ms": None, "error": None, "timings": None, "chars": 0}
+    async with client.stream("POST", "/api/chat/query", headers=headers, json=body) as res:
+        if res.status_code != 200:
+            result["error"] = f"HTTP {res.status_code}"
+            return result
+        async for line in res.aiter_lines():
+            if not line.startswith("data: "):
+                continue
+            data = line[6:]
+            if data == "[DONE]":
+                break
+            event = json.loads(data)
+            if "error" in event:
+                result["error"] = event["error"]
+            elif event.get("type") == "chunk":
+                if result["ttft_ms"] is None:
+                    result["ttft_ms"] = (time.perf_counter() - started) * 1000
+                result["chars"] += len(event["text"])
+            elif event.get("type") == "timings":
+                result["timings"] = event["timings"]
+    result["total_ms"] = (time.perf_counter() - started) * 1000
+    return result
+
+
+async def run_chat(client, headers, queries: List[str], concurrency: int, use_cache: bool):
+    pending = iter(queries)
+    results: List[Dict[str, Any]] = []
+
+    async def worker():
+        for query in pending:
+            try:
+                results.append(await one_query(client, headers, query, use_cache))
+            except httpx.HTTPError as e:
+                results.append({"ttft_ms": None, "error": repr(e), "timings": None, "chars": 0})
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    ok = [r for r in results if not r["error"]]
+    errors: Dict[str, int] = {}
+    for r in results:
+        if r["error"]:
+            errors[r["error"]] = errors.get(r["error"], 0) + 1
+    stages: Dict[str, List[float]] = {}
+    for r in ok:
+        for stage, ms in (r["timings"] or {}).items():
+            stages.setdefault(stage, []).append(ms)
+    return {
+        "queries": len(results),
+        "concurrency": concurrency,
+        "errors": errors,
+        "wall_s": round(elapsed, 2),
+        "queries_per_s": round(len(ok) / elapsed, 2),
+        "ttft_ms": percentiles([r["ttft_ms"] for r in ok if r["ttft_ms"] is not None]),
+        "total_ms": percentiles([r["total_ms"] for r in ok]),
+        "server_stages_ms": {stage: percentiles(values) for stage, values in sorted(stages.items())},
+    }
+
+# --- Orchestration ----------------------------------------------------------
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+async def run(args, workdir: str):
+    procs = []
+    try:
+        url = args.url
+        llm_url = None
+        if not url:
+            llm_port, app_port = free_port(), free_port()
+            llm_url, url = f"http://127.0.0.1:{llm_port}", f"http://127.0.0.1:{app_port}"
+            procs.append(spawn(["-m", "benchmarks.fake_llm", "--port", str(llm_port), "--ttft-ms", str(args.ttft_ms),
+                                "--rate", str(args.rate), "--tokens", str(args.tokens)],
+                               dict(os.environ), BACKEND_DIR, os.path.join(workdir, "fake_llm.log")))
+            await wait_until(f"{llm_url}/stats", 30, procs[-1])
+
+            env = dict(os.environ)
+            env.update({
+                "LLM_PROVIDER": "nvidia",
+                "NVIDIA_BASE_URL": f"{llm_url}/v1",
+                "NVIDIA_API_KEY": "bench",
+                "LLM_RATE_LIMIT_PER_MIN": "0",  # No provider quota to respect
+                "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+                "VECTOR_DB_PATH": os.path.join(workdir, "vector_db"),
+                "PYTHONPATH": BACKEND_DIR,
+            })
+            env.pop("ASYNC_DATABASE_URL", None)
+            # cwd is the scratch directory so ./uploads lands there too
+            procs.append(spawn(["-m", "uvicorn", "main:app", "--app-dir", BACKEND_DIR, "--port", str(app_port),
+                                "--log-level", "warning"], env, workdir, os.path.join(workdir, "app.log")))
+        await wait_until(f"{url}/ready", args.startup_timeout, procs[-1] if procs else None)
+
+        results: Dict[str, Any] = {
+            "meta": {
+                "commit": git_commit(),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "cpus": os.cpu_count(),
+                "args": {k: v for k, v in vars(args).items() if k not in ("out", "compare", "json")},
+            },
+        }
+        limits = httpx.Limits(max_connections=max(args.concurrency, args.upload_concurrency) + 4)
+        async with httpx.AsyncClient(base_url=url, timeout=args.request_timeout, limits=limits) as client:
+            headers = await login(client)
+            if args.docs:
+                paths = make_corpus(workdir, args.docs, args.pages, args.seed)
+                results["ingestion"] = await run_ingestion(client, headers, paths, args.pages,
+                                                           args.upload_concurrency, args.ingest_timeout)
+            if args.queries:
+                if args.warmup:
+                    await run_chat(client, headers, make_queries(args.warmup, args.seed + 7), args.concurrency, False)
+                results["chat"] = await run_chat(client, headers, make_queries(args.queries, args.seed),
+                                                 args.concurrency, args.use_cache)
+            if llm_url:
+                results["fake_llm"] = (await client.get(f"{llm_url}/stats")).json()
+        return results
+    finally:
+        for proc in reversed(procs):
+            stop(proc)
+
+# --- Comparison -------------------------------------------------------------
+
+def lookup(results: Dict[str, Any], path: str) -> Optional[float]:
+    value: Any = results
+    for key in path.split("."):
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[Dict[str, Any]]:
+    rows = []
+    for path, higher_is_better in TRACKED:
+        now, before = lookup(current, path), lookup(baseline, path)
+        if now is None or not before:
+            continue
+        change = (now - before) / before
+        regressed = change < -tolerance if higher_is_better else change > tolerance
+        rows.append({"metric": path, "baseline": before, "current": now,
+                     "change_pct": round(change * 100, 1), "regressed": regressed})
+    return rows
+
+
+def print_report(results: Dict[str, Any]):
+    meta = results["meta"]
+    print(f"[{meta['commit']}] {meta['timestamp']}")
+    if "ingestion" in results:
+        ing = results["ingestion"]
+        print(f"ingestion: {ing['documents']} docs / {ing['pages']} pages in {ing['wall_s']} s -> "
+              f"{ing['pages_per_s']} pages/s, jobs {ing['jobs']}")
+    if "chat" in results:
+        chat = results["chat"]
+        print(f"chat: {chat['queries']} queries x{chat['concurrency']} in {chat['wall_s']} s -> "
+              f"{chat['queries_per_s']} q/s, errors {chat['errors'] or 0}")
+        print(f"{'':<16} {'p50':>9} {'p95':>9} {'p99':>9}")
+        for name, row in [("ttft ms", chat["ttft_ms"]), ("total ms", chat["total_ms"])] + [
+                (f"  {stage}", row) for stage, row in chat["server_stages_ms"].items()]:
+            print(f"{name:<16} {row['p50']!s:>9} {row['p95']!s:>9} {row['p99']!s:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="benchmark an already running server instead of starting one")
+    parser.add_argument("--docs", type=int, default=20, help="synthetic PDFs to ingest (0 = skip)")
+    parser.add_argument("--pages", type=int, default=10, help="pages per PDF")
+    parser.add_argument("--upload-concurrency", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=200, help="chat queries (0 = skip)")
+    parser.add_argument("--warmup", type=int, default=10, help="unmeasured queries before the chat phase")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent chat sessions")
+    parser.add_argument("--use-cache", action="store_true", help="allow the semantic answer cache")
+    parser.add_argument("--ttft-ms", type=float, default=300.0, help="fake LLM time to first token")
+    parser.add_argument("--rate", type=float, default=60.0, help="fake LLM tokens/s per answer")
+    parser.add_argument("--tokens", type=int, default=200, help="fake LLM tokens per answer")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--startup-timeout", type=float, default=300.0, help="seconds to wait for /ready")
+    parser.add_argument("--ingest-timeout", type=float, default=1800.0)
+    parser.add_argument("--request-timeout", type=float, default=120.0)
+    parser.add_argument("--workdir", help="keep the database, uploads and logs here (default: temp dir)")
+    parser.add_argument("--out", help="write the JSON results to this file")
+    parser.add_argument("--compare", help="baseline JSON from an earlier run")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative regression")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    if args.workdir:
+        os.makedirs(args.workdir, exist_ok=True)
+        results = asyncio.run(run(args, os.path.abspath(args.workdir)))
+    else:
+        with tempfile.TemporaryDirectory(prefix="auramind-bench-") as workdir:
+            results = asyncio.run(run(args, workdir))
+
+    regressions = []
+    if args.compare:
+        with open(args.compare) as f:
+            results["comparison"] = compare(results, json.load(f), args.tolerance)
+        regressions = [row for row in results["comparison"] if row["regressed"]]
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_report(results)
+        for row in results.get("comparison", []):
+            flag = "REGRESSED" if row["regressed"] else "ok"
+            print(f"{row['metric']:<24} {row['baseline']!s:>10} -> {row['current']!s:>10} "
+                  f"({row['change_pct']:+}%) {flag}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
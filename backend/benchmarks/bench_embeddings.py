@@ -0,0 +1,136 @@
+"""Embedding backend benchmark: torch fp32 vs ONNX Runtime fp32 vs ONNX int8.
+
+Each variant runs in its own subprocess so its resident memory is measured in
+isolation. For every variant the benchmark reports load time, encode
+throughput (sentences/sec), peak RSS, and cosine agreement of its vectors with
+the torch fp32 baseline on the same fixed corpus.
+
+Run from backend/ (the first ONNX run exports the model to EMBEDDING_ONNX_DIR):
+    python -m benchmarks.bench_embeddings --sentences 2000 --threads 4
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+VARIANTS = {
+    "torch-fp32": {"backend": "torch", "quantize": False},
+    "onnx-fp32": {"backend": "onnx", "quantize": False},
+    "onnx-int8": {"backend": "onnx", "quantize": True},
+}
+
+_SUBJECTS = ["The VPN gateway", "Every contractor", "The on-call engineer", "Error code E4021", "The backup job",
+             "Access to the HR portal", "The quarterly audit", "Each laptop", "The payroll export", "Policy 7.2"]
+_VERBS = ["must be reviewed", "is rotated", "requires approval", "is logged", "fails", "is encrypted",
+          "is escalated", "gets archived", "is restricted", "is reported"]
+_TAILS = ["every 90 days.", "by the security team before go-live.", "when the certificate expires.",
+          "according to the retention schedule in section 4.", "if the upstream service times out.",
+          "unless an exception is filed with IT.", "within one business day.", "on the first Monday of each month."]
+
+def fixed_corpus(n: int, seed: int = 1234):
+    """Deterministic mix of short queries and chunk-sized passages."""
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(n):
+        sentences = [f"{rng.choice(_SUBJECTS)} {rng.choice(_VERBS)} {rng.choice(_TAILS)}"
+                     for _ in range(1 if i % 3 == 0 else rng.randint(3, 8))]
+        corpus.append(" ".join(sentences))
+    return corpus
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def run_worker(args):
+    """Runs one variant in this process and writes vectors + stats to disk."""
+    from services.embedding_backends import load_embedding_backend
+
+    variant = VARIANTS[args.worker]
+    corpus = fixed_corpus(args.sentences)
+    baseline_rss = peak_rss_mb()
+    started = time.perf_counter()
+    backend = load_embedding_backend(args.model, backend=variant["backend"], quantize=variant["quantize"], threads=args.threads)
+    load_s = time.perf_counter() - started
+
+    backend.encode(corpus[:32])  # warm-up
+    started = time.perf_counter()
+    vectors = np.asarray(backend.encode(corpus), dtype=np.float32)
+    encode_s = time.perf_counter() - started
+
+    np.save(os.path.join(args.out, f"{args.worker}.npy"), vectors)
+    with open(os.path.join(args.out, f"{args.worker}.json"), "w") as f:
+        json.dump({
+            "variant": args.worker,
+            "load_s": round(load_s, 2),
+            "sentences_per_s": round(len(corpus) / encode_s, 1),
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+            "model_rss_mb": round(peak_rss_mb() - baseline_rss, 1),
+        }, f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2"))
+    parser.add_argument("--sentences", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=int(os.getenv("EMBEDDING_THREADS", "0")))
+    parser.add_argument("--variants", default=",".join(VARIANTS))
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    variants = [v for v in args.variants.split(",") if v]
+    if "torch-fp32" not in variants:
+        variants.insert(0, "torch-fp32")  # the agreement baseline
+    rows = []
+    with tempfile.TemporaryDirectory() as out:
+        for variant in variants:
+            cmd = [sys.executable, "-m", "benchmarks.bench_embeddings", "--worker", variant, "--out", out,
+                   "--model", args.model, "--sentences", str(args.sentences), "--threads", str(args.threads)]
+            result = subprocess.run(cmd)
+            if result.returncode != 0:
+                print(f"{variant}: failed (exit {result.returncode})", file=sys.stderr)
+                continue
+            with open(os.path.join(out, f"{variant}.json")) as f:
+                rows.append(json.load(f))
+
+        baseline = np.load(os.path.join(out, "torch-fp32.npy")) if os.path.exists(os.path.join(out, "torch-fp32.npy")) else None
+        for row in rows:
+            if baseline is None:
+                continue
+            vectors = np.load(os.path.join(out, f"{row['variant']}.npy"))
+            a = baseline / np.linalg.norm(baseline, axis=1, keepdims=True)
+            b = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+            cosine = (a * b).sum(axis=1)
+            row["cosine_mean"] = round(float(cosine.mean()), 5)
+            row["cosine_min"] = round(float(cosine.min()), 5)
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    print(f"{args.sentences} sentences, model {args.model}, threads {args.threads or 'default'}")
+    print(f"{'variant':<12} {'load s':>7} {'sent/s':>9} {'peak MB':>8} {'model MB':>9} {'cos mean':>9} {'cos min':>8}")
+    for row in rows:
+        print(f"{row['variant']:<12} {row['load_s']:>7} {row['sentences_per_s']:>9} {row['peak_rss_mb']:>8} "
+              f"{row['model_rss_mb']:>9} {row.get('cosine_mean', '-'):>9} {row.get('cosine_min', '-'):>8}")
+
+
+if __name__ == "__main__":
+    main()
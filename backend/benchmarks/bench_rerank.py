@@ -0,0 +1,109 @@
+"""End-to-end latency and prompt-size benchmark: with vs without reranking.
+
+Runs each query against the local index twice:
+  baseline  - top-5 dense/hybrid retrieval straight into the prompt
+  rerank    - top-RERANK_CANDIDATES retrieval, cross-encoder keeps RERANK_TOP_K
+and reports retrieval(+rerank) latency and prompt size. With --generate it
+also streams each prompt through the configured LLM provider and reports
+time-to-first-token and total latency.
+
+Run from backend/ against an already-indexed corpus:
+    python -m benchmarks.bench_rerank --queries queries.txt --generate
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from services.embedding_service import EmbeddingService
+from services.llm_service import get_llm_client
+from services.reranker import Reranker, RERANK_CANDIDATES, RERANK_TOP_K
+from services.vector_service import VectorService
+
+DEFAULT_QUERIES = [
+    "What is the VPN policy?",
+    "How often must passwords be rotated?",
+    "What does error code E4021 mean?",
+    "Who do I contact for access requests?",
+]
+
+
+async def run_variant(name, queries, vector_service, reranker, llm_client, generate):
+    embedding_service = EmbeddingService()
+    rows = []
+    for query in queries:
+        started = time.perf_counter()
+        if reranker:
+            results = await vector_service.search(query, n_results=RERANK_CANDIDATES)
+            results = await reranker.rerank(query, results, top_k=RERANK_TOP_K)
+        else:
+            results = await vector_service.search(query, n_results=5)
+        retrieval_ms = (time.perf_counter() - started) * 1000
+
+        contexts = [r["content"] for r in results]
+        context_str = "\n\n".join(contexts)
+        row = {
+            "query": query,
+            "chunks": len(contexts),
+            "retrieval_ms": retrieval_ms,
+            "prompt_chars": len(context_str),
+            # Embedding-model tokens; a close proxy for the LLM's prompt tokens
+            "prompt_tokens": embedding_service.count_tokens(context_str),
+        }
+        if generate:
+            first = None
+            async for _ in llm_client.generate_stream(query, context=contexts):
+                if first is None:
+                    first = time.perf_counter()
+            done = time.perf_counter()
+            row["ttft_ms"] = ((first or done) - started) * 1000
+            row["total_ms"] = (done - started) * 1000
+        rows.append(row)
+
+    summary = {"variant": name}
+    for field in ("retrieval_ms", "prompt_chars", "prompt_tokens", "ttft_ms", "total_ms"):
+        values = [r[field] for r in rows if field in r]
+        if values:
+            summary[field] = round(statistics.mean(values), 1)
+    return summary, rows
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", help="File with one query per line")
+    parser.add_argument("--generate", action="store_true", help="Also stream answers from the LLM")
+    parser.add_argument("--budget-ms", type=float, default=10000, help="Rerank budget (generous, to measure cost)")
+    parser.add_argument("--json", action="store_true", help="Print machine-readable results")
+    args = parser.parse_args()
+
+    queries = DEFAULT_QUERIES
+    if args.queries:
+        with open(args.queries) as f:
+            queries = [line.strip() for line in f if line.strip()]
+
+    vector_service = VectorService()
+    reranker = Reranker("cross-encoder/ms-marco-MiniLM-L-6-v2", budget_ms=args.budget_ms)
+    reranker.warm()
+    llm_client = get_llm_client() if args.generate else None
+    # Warm the embedding model and index so neither variant pays cold-start
+    await vector_service.search(queries[0], n_results=RERANK_CANDIDATES)
+
+    results = {}
+    for name, rr in (("baseline", None), ("rerank", reranker)):
+        summary, rows = await run_variant(name, queries, vector_service, rr, llm_client, args.generate)
+        results[name] = {"summary": summary, "queries": rows}
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for name, data in results.items():
+        print("  ".join(f"{k}={v}" for k, v in data["summary"].items()))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,127 @@
+"""SSE streaming benchmark: per-token frames vs encoded/coalesced frames.
+
+Simulates many concurrent answers streamed from a fake LLM (tokens arrive
+at --rate tokens/s, in small bursts like a real provider's network reads)
+and writes every frame to a socket, as Starlette does per yielded frame.
+Variants:
+  source     - consume tokens only (floor: fake LLM + event loop cost)
+  legacy     - json.dumps per token, full_answer += token
+  framed     - precomputed chunk framing and list accumulation, 1 frame/token
+  coalesceN  - framed, with deltas coalesced over an N ms window
+Reports CPU ms per streamed answer (process CPU time, including the socket
+writes and the reading side) and frames/sec.
+
+Run from backend/:
+    python -m benchmarks.bench_sse --streams 300 --tokens 400 --windows 10,30,60
+"""
+import argparse
+import asyncio
+import json
+import random
+import socket
+import time
+
+from services.sse import TokenCoalescer, chunk_frame
+
+WORDS = ["the", " policy", " requires", " that", " all", " VPN", " sessions", " are", " closed",
+         " after", " 30", " minutes", ",", " and", " credentials", " rotated", " quarterly", "."]
+
+async def fake_llm(tokens: int, rate: float, burst: int, rng: random.Random):
+    pause = burst / rate
+    for i in range(tokens):
+        if i % burst == 0:
+            await asyncio.sleep(pause * rng.uniform(0.5, 1.5))
+        yield rng.choice(WORDS)
+
+
+async def drain(reader: asyncio.StreamReader):
+    while await reader.read(65536):
+        pass
+
+
+async def stream_one(variant: str, window_ms: float, args, seed: int):
+    rng = random.Random(seed)
+    source = fake_llm(args.tokens, args.rate, args.burst, rng)
+    if variant == "source":
+        async for _ in source:
+            pass
+        return 0
+
+    a, b = socket.socketpair()
+    reader, reader_side = await asyncio.open_connection(sock=a)
+    _, writer = await asyncio.open_connection(sock=b)
+    reading = asyncio.create_task(drain(reader))
+    frames = 0
+    try:
+        if variant == "legacy":
+            full_answer = ""
+            async for chunk in source:
+                full_answer += chunk
+                writer.write(f"data: {json.dumps({'type': 'chunk', 'text': chunk})}\n\n".encode())
+                await writer.drain()
+                frames += 1
+        else:
+            parts = []
+
+            async def deltas():
+                async for chunk in source:
+                    parts.append(chunk)
+                    yield chunk
+
+            async for text in TokenCoalescer(window_ms=window_ms).coalesce(deltas()):
+                writer.write(chunk_frame(text).encode())
+                await writer.drain()
+                frames += 1
+            full_answer = "".join(parts)
+        writer.write(b"data: [DONE]\n\n")
+        await writer.drain()
+    finally:
+        writer.close()
+        await reading
+        reader_side.close()
+    return frames
+
+
+async def run_variant(name: str, mode: str, window_ms: float, args):
+    cpu_started, wall_started = time.process_time(), time.perf_counter()
+    frames = await asyncio.gather(*(stream_one(mode, window_ms, args, seed) for seed in range(args.streams)))
+    cpu, wall = time.process_time() - cpu_started, time.perf_counter() - wall_started
+    total_frames = sum(frames)
+    return {
+        "variant": name,
+        "cpu_ms_per_answer": round(cpu * 1000 / args.streams, 2),
+        "frames_per_answer": round(total_frames / args.streams, 1),
+        "frames_per_s": round(total_frames / wall, 1),
+        "wall_s": round(wall, 2),
+    }
+
+
+async def run(args):
+    variants = [("source", "source", 0), ("legacy", "legacy", 0), ("framed", "framed", 0)]
+    variants += [(f"coalesce{w}", "framed", float(w)) for w in args.windows.split(",") if w]
+    return [await run_variant(name, mode, window, args) for name, mode, window in variants]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--streams", type=int, default=300, help="concurrent answers")
+    parser.add_argument("--tokens", type=int, default=400, help="tokens per answer")
+    parser.add_argument("--rate", type=float, default=80.0, help="tokens/s per stream")
+    parser.add_argument("--burst", type=int, default=2, help="tokens per simulated network read")
+    parser.add_argument("--windows", default="10,30,60", help="coalescing windows (ms) to compare")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    rows = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    print(f"{args.streams} streams x {args.tokens} tokens at {args.rate} tok/s")
+    print(f"{'variant':<12} {'CPU ms/answer':>14} {'frames/answer':>14} {'frames/s':>10} {'wall s':>8}")
+    for row in rows:
+        print(f"{row['variant']:<12} {row['cpu_ms_per_answer']:>14} {row['frames_per_answer']:>14} "
+              f"{row['frames_per_s']:>10} {row['wall_s']:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Vector store benchmark: Chroma vs the memory-mapped NumPy backend.
+
+Loads the same synthetic, clustered unit vectors (384-dim, like MiniLM) into
+a fresh Chroma collection and a fresh NumPy collection, then reports insert
+time, query latency (p50/p95) and recall@k against exact brute-force ground
+truth. Sizes at or above VECTOR_IVF_THRESHOLD exercise the NumPy IVF path.
+
+Run from backend/:
+    python -m benchmarks.bench_vector_store --sizes 10000,200000 --queries 200
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+def synthetic(n: int, dim: int, clusters: int, rng) -> np.ndarray:
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, n)] + 0.35 * rng.normal(size=(n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def dir_size_mb(path: str) -> float:
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+    return total / (1024 * 1024)
+
+
+def run_backend(name, collection, vectors, queries, truth, k, batch):
+    ids = [f"chunk-{i}" for i in range(len(vectors))]
+    started = time.perf_counter()
+    for i in range(0, len(vectors), batch):
+        collection.add(
+            ids=ids[i:i + batch],
+            embeddings=vectors[i:i + batch].tolist(),
+            documents=[f"chunk text {j}" for j in range(i, min(i + batch, len(vectors)))],
+            metadatas=[{"document_id": str(j // 50), "pages": "[1]"} for j in range(i, min(i + batch, len(vectors)))],
+        )
+    insert_s = time.perf_counter() - started
+    if hasattr(collection, "_training"):
+        while collection._training:  # Let IVF training finish before timing queries
+            time.sleep(0.1)
+
+    latencies, recalls = [], []
+    for q, expected in zip(queries, truth):
+        started = time.perf_counter()
+        result = collection.query(query_embeddings=[q.tolist()], n_results=k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        found = {int(chunk_id.split("-")[1]) for chunk_id in result["ids"][0]}
+        recalls.append(len(found & set(expected)) / k)
+    latencies.sort()
+    return {
+        "backend": name,
+        "insert_s": round(insert_s, 2),
+        "query_p50_ms": round(statistics.median(latencies), 2),
+        "query_p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))], 2),
+        f"recall@{k}": round(float(np.mean(recalls)), 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--batch", type=int, default=1000)
+    parser.add_argument("--backends", default="chroma,numpy")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    from services.numpy_vector_store import NumpyVectorStore
+
+    rows = []
+    for n in [int(s) for s in args.sizes.split(",")]:
+        rng = np.random.default_rng(n)
+        vectors = synthetic(n, args.dim, clusters=max(n // 500, 10), rng=rng)
+        queries = synthetic(args.queries, args.dim, clusters=max(n // 500, 10), rng=np.random.default_rng(n))
+        queries = queries + 0.05 * rng.normal(size=queries.shape).astype(np.float32)
+        truth = np.argsort(-(queries @ vectors.T), axis=1)[:, :args.k].tolist()
+
+        for backend in args.backends.split(","):
+            path = tempfile.mkdtemp(prefix=f"bench_{backend}_")
+            try:
+                if backend == "chroma":
+                    import chromadb
+                    client = chromadb.PersistentClient(path=path)
+                    # Cosine space so both backends rank by the same similarity
+                    collection = client.get_or_create_collection("bench", metadata={"hnsw:space": "cosine"})
+                else:
+                    collection = NumpyVectorStore(path).get_or_create_collection("bench")
+                row = run_backend(backend, collection, vectors, queries, truth, args.k, args.batch)
+                row.update({"chunks": n, "disk_mb": round(dir_size_mb(path), 1)})
+                rows.append(row)
+            finally:
+                shutil.rmtree(path, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    recall = f"recall@{args.k}"
+    print(f"{'chunks':>8} {'backend':<8} {'insert s':>9} {'p50 ms':>8} {'p95 ms':>8} {recall:>10} {'disk MB':>8}")
+    for row in rows:
+        print(f"{row['chunks']:>8} {row['backend']:<8} {row['insert_s']:>9} {row['query_p50_ms']:>8} "
+              f"{row['query_p95_ms']:>8} {row[recall]:>10} {row['disk_mb']:>8}")
+
+
+if __name__ == "__main__":
+    main()
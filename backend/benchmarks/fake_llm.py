@@ -0,0 +1,117 @@
+"""Local stand-in for the LLM provider, for benchmarks without an API key.
+
+Speaks both protocols the app uses:
+  POST /v1/chat/completions  - OpenAI-compatible streaming (LLM_PROVIDER=nvidia
+                               with NVIDIA_BASE_URL=http://host:port/v1)
+  POST /api/generate         - Ollama NDJSON streaming (LLM_PROVIDER=ollama
+                               with OLLAMA_BASE_URL=http://host:port)
+Every answer waits --ttft-ms before its first token, then streams --tokens
+tokens at --rate tokens/s with a little seeded jitter, so runs are
+repeatable. GET /stats reports requests served and peak concurrency.
+
+Run from backend/:
+    python -m benchmarks.fake_llm --port 9100 --ttft-ms 300 --rate 60 --tokens 200
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+WORDS = ["According", " to", " the", " handbook", ",", " employees", " must", " submit", " expense",
+         " reports", " within", " 30", " days", " and", " keep", " receipts", " for", " audits", "."]
+
+class FakeLLM:
+    def __init__(self, ttft_ms: float, rate: float, tokens: int, jitter: float = 0.2):
+        self.ttft = ttft_ms / 1000.0
+        self.rate = rate
+        self.tokens = tokens
+        self.jitter = jitter
+        self.requests = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    async def tokens_for(self, prompt: str):
+        rng = random.Random(prompt)  # Same prompt, same answer and timing
+        self.requests += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.ttft * rng.uniform(1 - self.jitter, 1 + self.jitter))
+            started = time.perf_counter()
+            for i in range(self.tokens):
+                if i and self.rate > 0:
+                    # Sleep to a schedule so the rate doesn't drift under load
+                    delay = started + i / self.rate - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                yield rng.choice(WORDS)
+        finally:
+            self.in_flight -= 1
+
+
+def create_app(llm: FakeLLM) -> FastAPI:
+    app = FastAPI(title="Fake LLM")
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        prompt = "".join(m.get("content") or "" for m in body.get("messages", []))
+        model = body.get("model", "fake")
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+
+        def chunk(delta, finish_reason=None):
+            return "data: " + json.dumps({
+                "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }) + "\n\n"
+
+        async def stream():
+            yield chunk({"role": "assistant", "content": ""})
+            async for token in llm.tokens_for(prompt):
+                yield chunk({"content": token})
+            yield chunk({}, "stop")
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    @app.post("/api/generate")
+    async def generate(request: Request):
+        body = await request.json()
+        model = body.get("model", "fake")
+
+        async def stream():
+            async for token in llm.tokens_for(body.get("prompt", "")):
+                yield json.dumps({"model": model, "response": token, "done": False}) + "\n"
+            yield json.dumps({"model": model, "response": "", "done": True}) + "\n"
+
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+    @app.get("/stats")
+    def stats():
+        return {"requests": llm.requests, "in_flight": llm.in_flight, "peak_in_flight": llm.peak_in_flight}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--ttft-ms", type=float, default=300.0, help="delay before the first token")
+    parser.add_argument("--rate", type=float, default=60.0, help="tokens/s per answer (0 = as fast as possible)")
+    parser.add_argument("--tokens", type=int, default=200, help="tokens per answer")
+    args = parser.parse_args()
+
+    import uvicorn
+    uvicorn.run(create_app(FakeLLM(args.ttft_ms, args.rate, args.tokens)), host=args.host, port=args.port,
+                log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Short-lived caches for the per-request authentication path.
+
+Every authenticated request decodes its bearer token and loads the caller's
+User row. Both results are cached for AUTH_CACHE_TTL seconds (0 disables):
+tokens by their exact string (an entry never outlives the token's own
+`exp`), users by email as detached instances. Any ORM update or delete of a
+User in this process evicts its entry, so role changes and deletions take
+effect on the next request; other processes see them within the TTL.
+"""
+import os
+import time
+from typing import Any, Dict, Optional
+
+from sqlalchemy import event, inspect
+
+from core.security import decode_access_token
+from models.database import User
+from services.cache import LRUCache
+
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "30"))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+
+_tokens = LRUCache(max_size=AUTH_CACHE_SIZE if AUTH_CACHE_TTL else 0, ttl=AUTH_CACHE_TTL)
+_users = LRUCache(max_size=AUTH_CACHE_SIZE if AUTH_CACHE_TTL else 0, ttl=AUTH_CACHE_TTL)
+
+def decode_token_cached(token: str) -> Optional[Dict[str, Any]]:
+    payload = _tokens.get(token)
+    if payload is not None:
+        if payload["exp"] >= time.time():
+            return payload
+        _tokens.pop(token)
+        return None
+    payload = decode_access_token(token)
+    if payload:
+        _tokens.set(token, payload)
+    return payload
+
+def get_cached_user(email: str) -> Optional[User]:
+    return _users.get(email)
+
+def cache_user(user: User):
+    """Caches a User that is no longer attached to a session."""
+    _users.set(user.email, user)
+
+def invalidate_user(email: str):
+    _users.pop(email)
+
+def stats() -> Dict[str, Any]:
+    return {"tokens": _tokens.stats(), "users": _users.stats()}
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _evict_user(mapper, connection, target):
+    invalidate_user(target.email)
+    # An email change leaves the old address cached as well
+    for email in inspect(target).attrs.email.history.deleted:
+        if email:
+            invalidate_user(email)
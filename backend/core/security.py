@@ -1,8 +1,11 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional, Union, Any
 from jose import jwt
 from passlib.context import CryptContext
+import asyncio
 import os
+import time
 
 # Configuration
 SECRET_KEY = os.getenv("SECRET_KEY", "default-dev-key-change-this")
@@ -17,6 +20,73 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+class PasswordHasherBusy(Exception):
+    """Raised when too many hash/verify calls are already waiting."""
+
+
+class PasswordHasher:
+    """Runs bcrypt on a small dedicated executor.
+
+    bcrypt is deliberately slow (~100-300 ms of CPU per call). On the shared
+    threadpool a burst of logins occupies every worker and stalls unrelated
+    sync endpoints; here at most `workers` hashes run at once, and once
+    `max_pending` calls are queued further ones fail fast instead of piling up.
+    """
+
+    def __init__(self, workers: int = 2, max_pending: int = 64):
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self.workers = workers
+        self.pending = 0
+        self.calls = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+
+    async def _run(self, fn, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise PasswordHasherBusy()
+        self.pending += 1
+        queued = time.perf_counter()
+
+        def timed_call():
+            self.total_wait += time.perf_counter() - queued
+            return fn(*args)
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, timed_call)
+        finally:
+            self.pending -= 1
+            self.calls += 1
+
+    async def verify(self, plain_password, hashed_password) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    async def hash(self, password) -> str:
+        return await self._run(get_password_hash, password)
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "calls": self.calls,
+            "rejected": self.rejected,
+            "avg_queue_wait_ms": round(self.total_wait / self.calls * 1000, 2) if self.calls else 0.0,
+        }
+
+
+_password_hasher: Optional[PasswordHasher] = None
+
+def get_password_hasher() -> PasswordHasher:
+    global _password_hasher
+    if _password_hasher is None:
+        _password_hasher = PasswordHasher(
+            workers=int(os.getenv("PASSWORD_HASH_WORKERS", "2")),
+            max_pending=int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64")),
+        )
+    return _password_hasher
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
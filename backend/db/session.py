@@ -1,17 +1,102 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, literal, text
 from sqlalchemy.orm import sessionmaker
 from models.database import Base
 import os
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./rag_app.db")
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+
+# WAL lets readers proceed while a write commits, and synchronous=NORMAL only
+# fsyncs at checkpoints (safe against corruption; a power cut can lose the
+# last commits). busy_timeout makes concurrent writers wait instead of failing.
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "cache_size": -int(os.getenv("SQLITE_CACHE_KB", "20000")),
+    "temp_store": "MEMORY",
+    "mmap_size": int(os.getenv("SQLITE_MMAP_BYTES", str(256 * 1024 * 1024))),
+}
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
 
 engine = create_engine(
-    DATABASE_URL, connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {}
+    DATABASE_URL, connect_args={"check_same_thread": False} if IS_SQLITE else {}
 )
+if IS_SQLITE:
+    event.listen(engine, "connect", _apply_sqlite_pragmas)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+def _async_url(url: str) -> str:
+    for sync, driver in (("sqlite:", "sqlite+aiosqlite:"), ("postgresql:", "postgresql+asyncpg:")):
+        if url.startswith(sync):
+            return driver + url[len(sync):]
+    return url
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", _async_url(DATABASE_URL))
+_async_engine = None
+_async_sessionmaker = None
+
+def get_async_engine():
+    """The async engine (created on first use, so its driver is only needed then)."""
+    global _async_engine, _async_sessionmaker
+    if _async_engine is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+        _async_engine = create_async_engine(ASYNC_DATABASE_URL)
+        if IS_SQLITE:
+            event.listen(_async_engine.sync_engine, "connect", _apply_sqlite_pragmas)
+        _async_sessionmaker = async_sessionmaker(_async_engine, expire_on_commit=False)
+    return _async_engine
+
+def AsyncSessionLocal():
+    get_async_engine()
+    return _async_sessionmaker()
+
+def _migrate():
+    """Adds columns and indexes introduced after a table was first created.
+
+    create_all only creates missing tables, so existing databases get new
+    (nullable or defaulted) columns and new indexes added in place here.
+    """
+    inspector = inspect(engine)
+    created_indexes = False
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                col_type = column.type.compile(dialect=engine.dialect)
+                ddl = f'ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}'
+                if column.default is not None and column.default.is_scalar:
+                    # ORM defaults only apply to new rows; a server default
+                    # also fills the existing ones instead of leaving NULL
+                    value = literal(column.default.arg, type_=column.type).compile(
+                        dialect=engine.dialect, compile_kwargs={"literal_binds": True}
+                    )
+                    ddl += f' DEFAULT {value}'
+                conn.execute(text(ddl))
+                print(f"Migrated: added {table.name}.{column.name}")
+            existing_indexes = {i["name"] for i in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name in existing_indexes:
+                    continue
+                index.create(bind=conn, checkfirst=True)
+                created_indexes = True
+                print(f"Migrated: created index {index.name}")
+        # Refresh planner statistics so SQLite picks up the new indexes
+        if created_indexes and IS_SQLITE:
+            conn.execute(text("ANALYZE"))
+
 def init_db():
     Base.metadata.create_all(bind=engine)
+    _migrate()
 
 def get_db():
     db = SessionLocal()
@@ -19,3 +104,13 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def dispose_async_engine():
+    global _async_engine
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
@@ -0,0 +1,148 @@
+import asyncio
+import datetime
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import insert
+
+from db.session import AsyncSessionLocal
+from models.database import Message
+from services.metrics import observe_stage
+
+class MessageWriter:
+    """Write-behind queue for chat history.
+
+    Streams hand their finished messages to `submit` and return immediately;
+    a single background task inserts everything queued (across all
+    conversations) in one transaction per batch, so the event loop never
+    waits on a commit and many chats share one fsync. `aclose` drains the
+    queue, so a clean shutdown never drops history.
+    """
+
+    def __init__(self, max_batch: int = 500, flush_interval_ms: float = 50.0, max_retries: int = 3):
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.max_retries = max_retries
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop = None
+        self.peak_depth = 0
+        self.batches = 0
+        self.rows = 0
+        self.failed_rows = 0
+        self.last_flush_ms = 0.0
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+
+    def submit(self, rows: List[Dict[str, Any]]):
+        """Queues message rows (column -> value dicts) for insertion.
+
+        Safe to call from any thread: off the event loop, the rows are handed
+        to the loop the writer runs on.
+        """
+        now = datetime.datetime.utcnow()
+        for n, row in enumerate(rows):
+            # Stamped now, not at flush, so history keeps conversation order
+            row.setdefault("created_at", now + datetime.timedelta(microseconds=n))
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            if self._loop is None or self._loop.is_closed():
+                raise RuntimeError("MessageWriter has no event loop to write on")
+            self._loop.call_soon_threadsafe(self._enqueue, rows)
+            return
+        self._enqueue(rows)
+
+    def _enqueue(self, rows: List[Dict[str, Any]]):
+        self._ensure_worker()
+        for row in rows:
+            self._queue.put_nowait(row)
+        self.peak_depth = max(self.peak_depth, self._queue.qsize())
+
+    async def _collect(self) -> List[Dict[str, Any]]:
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.flush_interval
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _write(self, batch: List[Dict[str, Any]]):
+        for attempt in range(1, self.max_retries + 1):
+            started = time.perf_counter()
+            try:
+                async with AsyncSessionLocal() as db:
+                    await db.execute(insert(Message), batch)
+                    await db.commit()
+            except Exception as e:
+                if attempt == self.max_retries:
+                    self.failed_rows += len(batch)
+                    print(f"MessageWriter: dropped {len(batch)} message(s) after {attempt} attempts: {e}")
+                    return
+                await asyncio.sleep(0.1 * 2 ** attempt)
+                continue
+            elapsed = time.perf_counter() - started
+            observe_stage("history_commit", elapsed)
+            self.last_flush_ms = elapsed * 1000
+            self.batches += 1
+            self.rows += len(batch)
+            return
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            try:
+                await self._write(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def flush(self):
+        """Waits until everything submitted so far is committed."""
+        if self._queue is not None and self._worker is not None and not self._worker.done():
+            await self._queue.join()
+
+    async def aclose(self):
+        await self.flush()
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "depth": self._queue.qsize() if self._queue else 0,
+            "peak_depth": self.peak_depth,
+            "batches": self.batches,
+            "rows": self.rows,
+            "avg_batch_size": round(self.rows / self.batches, 2) if self.batches else 0.0,
+            "failed_rows": self.failed_rows,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+        }
+
+
+_writer: Optional[MessageWriter] = None
+
+def get_message_writer() -> MessageWriter:
+    global _writer
+    if _writer is None:
+        _writer = MessageWriter(
+            max_batch=int(os.getenv("HISTORY_WRITE_BATCH", "500")),
+            flush_interval_ms=float(os.getenv("HISTORY_WRITE_INTERVAL_MS", "50")),
+        )
+    return _writer
@@ -1,13 +1,16 @@
+from dotenv import load_dotenv
+
+# Load .env before importing the app modules: they read their settings from
+# the environment at import time.
+load_dotenv()
+
 from fastapi import FastAPI, Depends, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
 from db.session import init_db, get_db
 from api import auth, documents, chat, admin, history
-from dotenv import load_dotenv
 import os
 
-load_dotenv()
-
 app = FastAPI(title="Internal AI Knowledge Assistant (RAG)")
 
 # CORS middleware for Next.js frontend
@@ -18,12 +21,46 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Initialize database
 @app.on_event("startup")
-def on_startup():
-    init_db()
+async def on_startup():
+    from services.warmup import timed, start_warm_up
+    with timed("database"):
+        init_db()
+    # Resumes interrupted ingestion jobs and starts the worker pool
+    from services.ingestion import get_ingestion_worker
+    with timed("ingestion_worker"):
+        get_ingestion_worker().start()
+    # Batch jobs run in-process, so none survive a restart
+    from services.batch_query import get_batch_job_manager
+    from db.session import SessionLocal
+    db = SessionLocal()
+    try:
+        get_batch_job_manager().recover(db)
+    finally:
+        db.close()
+    # Models, vector store and the LLM connection pool load in the background;
+    # /ready reports when they are warm
+    start_warm_up()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    from services.ingestion import get_ingestion_worker
+    from services.embedding_batcher import get_embedding_batcher
+    from services.vector_service import flush_lexical_indexes
+    from services.llm_service import get_llm_client
+    get_ingestion_worker().stop()
+    await get_embedding_batcher().aclose()
+    flush_lexical_indexes(force=True)
+    await get_llm_client().aclose()
+    # Drain queued chat history before the engine goes away
+    from db.write_behind import get_message_writer
+    from db.session import dispose_async_engine
+    await get_message_writer().aclose()
+    await dispose_async_engine()
 
 # Include routers
 app.include_router(auth.router, prefix="/api/auth", tags=["Authentication"])
@@ -35,3 +72,10 @@ app.include_router(admin.router, prefix="/api/admin", tags=["Admin"])
 @app.get("/")
 def read_root():
     return {"message": "Internal AI Knowledge Assistant API is running"}
+
+@app.get("/ready")
+def ready():
+    from fastapi.responses import JSONResponse
+    from services.warmup import readiness
+    report = readiness()
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
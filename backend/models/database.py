@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text, Enum
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text, Enum, Float, Boolean, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 import datetime
@@ -10,6 +10,13 @@ class UserRole(enum.Enum):
     ADMIN = "admin"
     USER = "user"
 
+class JobStatus(enum.Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
 class User(Base):
     __tablename__ = "users"
 
@@ -18,6 +25,7 @@ class User(Base):
     hashed_password = Column(String, nullable=False)
     role = Column(Enum(UserRole), default=UserRole.USER)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    answer_cache_opt_out = Column(Boolean, default=False) # Never serve or store cached answers
 
 class Document(Base):
     __tablename__ = "documents"
@@ -26,6 +34,9 @@ class Document(Base):
     filename = Column(String, nullable=False)
     upload_date = Column(DateTime, default=datetime.datetime.utcnow)
     processed = Column(Integer, default=0) # 0: pending, 1: processed, -1: error
+    content_hash = Column(String(64), nullable=True, index=True) # sha256 of the uploaded file
+    file_path = Column(String, nullable=True)
+    index_config = Column(String, nullable=True) # Chunking/model config the live index was built with
     uploader_id = Column(Integer, ForeignKey("users.id"))
 
     uploader = relationship("User")
@@ -39,7 +50,10 @@ class Conversation(Base):
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
 
     user = relationship("User")
-    messages = relationship("Message", back_populates="conversation", cascade="all, delete-orphan")
+    messages = relationship("Message", back_populates="conversation", cascade="all, delete-orphan", order_by="Message.created_at")
+
+    # Serves the sidebar listing: equality on user_id, ordered by created_at
+    __table_args__ = (Index("ix_conversations_user_created", "user_id", "created_at"),)
 
 class Message(Base):
     __tablename__ = "messages"
@@ -48,7 +62,48 @@ class Message(Base):
     role = Column(String, nullable=False) # 'user' or 'bot'
     content = Column(Text, nullable=False)
     citations = Column(Text, nullable=True) # JSON string
+    truncated = Column(Boolean, default=False) # Answer stopped or disconnected mid-stream
     conversation_id = Column(Integer, ForeignKey("conversations.id"))
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
 
     conversation = relationship("Conversation", back_populates="messages")
+
+    __table_args__ = (Index("ix_messages_conversation_created", "conversation_id", "created_at"),)
+
+class IngestionJob(Base):
+    __tablename__ = "ingestion_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), index=True)
+    file_path = Column(String, nullable=False)
+    status = Column(Enum(JobStatus), default=JobStatus.PENDING, index=True)
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=3)
+    progress = Column(Float, default=0.0) # 0-100
+    target_collection = Column(String, nullable=True) # Set when part of a full reindex
+    error = Column(Text, nullable=True)
+    owner = Column(String, nullable=True) # Worker process that claimed the job
+    lease_expires_at = Column(DateTime, nullable=True) # Renewed while the owner is alive
+    cancel_requested = Column(Boolean, default=False) # Seen by the owner when it renews the lease
+    available_at = Column(DateTime, default=datetime.datetime.utcnow) # Retry backoff
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    document = relationship("Document")
+
+class BatchJob(Base):
+    __tablename__ = "batch_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    status = Column(Enum(JobStatus), default=JobStatus.PENDING, index=True)
+    total = Column(Integer, nullable=False)
+    completed = Column(Integer, default=0)
+    failed = Column(Integer, default=0) # Items finished with an error
+    result_path = Column(String, nullable=True) # NDJSON, one line per finished item
+    error = Column(Text, nullable=True)
+    owner = Column(String, nullable=True) # API worker running the job
+    lease_expires_at = Column(DateTime, nullable=True) # Renewed while the owner is alive
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
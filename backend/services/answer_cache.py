@@ -0,0 +1,122 @@
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+import os
+import threading
+import time
+
+import numpy as np
+
+class AnswerCache:
+    """Semantic cache of generated answers.
+
+    A lookup hits when a cached query's embedding has cosine similarity of at
+    least `threshold` with the new query and the entry was produced against
+    the current corpus version; any change to the index makes older entries
+    unreachable. Bounded in size (LRU) with an optional TTL.
+    """
+
+    def __init__(self, max_size: int = 512, threshold: float = 0.95, ttl: Optional[float] = None):
+        self.max_size = max_size
+        self.threshold = threshold
+        self.ttl = ttl or None
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._matrix: Optional[np.ndarray] = None  # Stacked unit vectors, rebuilt lazily
+        self._keys: List[int] = []
+        self._next_key = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _unit(embedding) -> np.ndarray:
+        v = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(v)
+        return v / norm if norm else v
+
+    def _drop(self, key: int):
+        del self._entries[key]
+        self._matrix = None
+
+    def _purge(self, corpus_version: int):
+        now = time.monotonic()
+        stale = [
+            k for k, e in self._entries.items()
+            if e["corpus_version"] != corpus_version or (self.ttl and e["created"] + self.ttl <= now)
+        ]
+        for k in stale:
+            self._drop(k)
+        self.invalidations += len(stale)
+
+    def lookup(self, embedding, corpus_version: int) -> Optional[Dict[str, Any]]:
+        if self.max_size <= 0:
+            return None
+        query = self._unit(embedding)
+        with self._lock:
+            self._purge(corpus_version)
+            if not self._entries:
+                self.misses += 1
+                return None
+            if self._matrix is None:
+                self._keys = list(self._entries)
+                self._matrix = np.stack([self._entries[k]["embedding"] for k in self._keys])
+            scores = self._matrix @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+            key = self._keys[best]
+            self._entries.move_to_end(key)
+            self.hits += 1
+            entry = self._entries[key]
+            return {
+                "query": entry["query"],
+                "answer": entry["answer"],
+                "citations": entry["citations"],
+                "similarity": float(scores[best]),
+            }
+
+    def store(self, embedding, corpus_version: int, query: str, answer: str, citations: List[Dict[str, Any]]):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[self._next_key] = {
+                "embedding": self._unit(embedding),
+                "corpus_version": corpus_version,
+                "query": query,
+                "answer": answer,
+                "citations": citations,
+                "created": time.monotonic(),
+            }
+            self._next_key += 1
+            self._matrix = None
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            self.stores += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+_answer_cache: Optional[AnswerCache] = None
+
+def get_answer_cache() -> AnswerCache:
+    global _answer_cache
+    if _answer_cache is None:
+        _answer_cache = AnswerCache(
+            max_size=int(os.getenv("ANSWER_CACHE_SIZE", "512")),
+            threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95")),
+            ttl=float(os.getenv("ANSWER_CACHE_TTL", "86400")),
+        )
+    return _answer_cache
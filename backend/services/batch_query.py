@@ -0,0 +1,363 @@
+"""Batch questions: many queries answered in one request.
+
+Questions are processed in groups of BATCH_GROUP_SIZE: each group is
+embedded with one encode call and retrieved with one multi-vector Chroma
+query, then every question is reranked, packed and answered on its own
+task. Generation goes through the LLM scheduler like interactive chat (so
+batches get a fair share, not the whole model) and at most `concurrency`
+answers of a batch are generated at once. Retrieval of the next group
+overlaps generation of the current one, bounded so a large set is never
+retrieved far ahead of its answers.
+
+Results come back in completion order, one dict per question, followed by
+a summary. `BatchJobManager` runs the same pipeline as a background job
+that appends results to an NDJSON file, under a lease its worker renews so
+other workers can tell a running job from one whose worker died.
+"""
+import asyncio
+import datetime
+import json
+import os
+import socket
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import or_, update
+
+from db.session import AsyncSessionLocal
+from models.database import BatchJob, JobStatus
+from services.answer_cache import get_answer_cache
+from services.context_packer import citations_for, get_context_packer
+from services.llm_scheduler import get_llm_scheduler
+from services.llm_service import LLMErrorMessage, get_llm_client
+from services.metrics import observe_stage
+from services.reranker import RERANK_CANDIDATES, RERANK_TOP_K, get_reranker
+from services.vector_service import get_vector_service
+
+# Questions per /api/chat/batch request; larger sets go through a job
+BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", "100"))
+BATCH_JOB_MAX_QUERIES = int(os.getenv("BATCH_JOB_MAX_QUERIES", "10000"))
+# Answers of one batch generated at once (each also needs a scheduler slot)
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+# Questions embedded and retrieved together
+BATCH_GROUP_SIZE = int(os.getenv("BATCH_GROUP_SIZE", "64"))
+BATCH_RESULTS_DIR = os.getenv("BATCH_RESULTS_DIR", "./batch_results")
+# A job whose worker hasn't renewed it for this long is marked failed
+BATCH_JOB_LEASE_SECONDS = float(os.getenv("BATCH_JOB_LEASE_SECONDS", "60"))
+
+def _retrieval(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [{
+        "rank": rank,
+        "id": r["id"],
+        "document_id": r["metadata"].get("document_id"),
+        "document_name": r["metadata"].get("filename", "Unknown"),
+        "pages": r["metadata"].get("pages", "Unknown"),
+    } for rank, r in enumerate(results)]
+
+
+class BatchRun:
+    def __init__(self, queries: List[str], user_id: int, generate: bool = True, use_cache: bool = True,
+                 vector_weight: Optional[float] = None, lexical_weight: Optional[float] = None,
+                 concurrency: int = BATCH_CONCURRENCY):
+        self.queries = queries
+        self.user_id = user_id
+        self.generate = generate
+        # Cached answers were retrieved with the default weights
+        self.use_cache = use_cache and vector_weight is None and lexical_weight is None
+        self.vector_weight = vector_weight
+        self.lexical_weight = lexical_weight
+        self.concurrency = max(1, concurrency)
+        self.counts = {"answered": 0, "cached": 0, "errors": 0}
+        self.started: Optional[float] = None
+        self._done: asyncio.Queue = asyncio.Queue()
+        self._generation = asyncio.Semaphore(self.concurrency)
+        # Questions retrieved but not yet answered
+        self._ahead = asyncio.Semaphore(BATCH_GROUP_SIZE * 2)
+        self._tasks: Set[asyncio.Task] = set()
+        self._producer: Optional[asyncio.Task] = None
+
+    async def results(self) -> AsyncIterator[Dict[str, Any]]:
+        """Yields one result per query, in completion order."""
+        self.started = time.perf_counter()
+        self._producer = asyncio.get_running_loop().create_task(self._produce())
+        try:
+            for _ in self.queries:
+                item = await self._done.get()
+                if item["error"]:
+                    self.counts["errors"] += 1
+                elif item["cached"]:
+                    self.counts["cached"] += 1
+                else:
+                    self.counts["answered"] += 1
+                yield item
+        finally:
+            self.close()
+
+    def close(self):
+        """Stops retrieval and generation (e.g. the client went away)."""
+        if self._producer is not None:
+            self._producer.cancel()
+        for task in list(self._tasks):
+            task.cancel()
+
+    async def aclose(self):
+        """`close` for Starlette background tasks, which run plain callables
+        in the threadpool; tasks must be cancelled on the loop."""
+        self.close()
+
+    def summary(self) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - self.started if self.started else 0.0
+        return {
+            "count": len(self.queries),
+            **self.counts,
+            "total_ms": round(elapsed * 1000, 1),
+            "queries_per_s": round(len(self.queries) / elapsed, 2) if elapsed else None,
+        }
+
+    async def _produce(self):
+        vector_service = get_vector_service()
+        loop = asyncio.get_running_loop()
+        for offset in range(0, len(self.queries), BATCH_GROUP_SIZE):
+            group = self.queries[offset:offset + BATCH_GROUP_SIZE]
+            for _ in group:
+                await self._ahead.acquire()
+            try:
+                started = time.perf_counter()
+                embeddings = await vector_service.embed_queries(group)
+                embedded = time.perf_counter()
+                corpus_version = vector_service.corpus_version
+                results = await vector_service.search_many(
+                    group,
+                    n_results=RERANK_CANDIDATES if get_reranker() else 5,
+                    query_embeddings=embeddings,
+                    vector_weight=self.vector_weight,
+                    lexical_weight=self.lexical_weight,
+                )
+                shared = {"batch_embed": embedded - started, "batch_retrieve": time.perf_counter() - embedded}
+                observe_stage("batch_embed", shared["batch_embed"])
+                observe_stage("batch_retrieve", shared["batch_retrieve"])
+            except Exception as e:
+                print(f"Batch retrieval failed: {e!r}")
+                for i, query in enumerate(group):
+                    self._finish(self._item(offset + i, query), {}, "Retrieval failed.")
+                continue
+            for i, (query, embedding, hits) in enumerate(zip(group, embeddings, results)):
+                task = loop.create_task(self._answer(offset + i, query, embedding, hits, corpus_version, shared))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+    def _item(self, index: int, query: str) -> Dict[str, Any]:
+        return {"index": index, "query": query, "answer": None, "cached": False, "citations": [],
+                "context": None, "retrieval": [], "error": None}
+
+    def _finish(self, item: Dict[str, Any], stages: Dict[str, float], error: Optional[str] = None):
+        item["error"] = item["error"] or error
+        item["timings"] = {stage: round(seconds * 1000, 1) for stage, seconds in stages.items()}
+        self._ahead.release()
+        self._done.put_nowait(item)
+
+    async def _answer(self, index, query, embedding, hits, corpus_version, shared):
+        item = self._item(index, query)
+        item["retrieval"] = _retrieval(hits)
+        stages = dict(shared)
+        started = time.perf_counter()
+        try:
+            await self._answer_one(item, query, embedding, hits, corpus_version, stages)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Batch question {index} failed: {e!r}")
+            item["error"] = "Something went wrong while answering."
+        stages["total"] = time.perf_counter() - started + shared["batch_embed"] + shared["batch_retrieve"]
+        self._finish(item, stages)
+
+    async def _answer_one(self, item, query, embedding, hits, corpus_version, stages):
+        answer_cache = get_answer_cache()
+        cached = answer_cache.lookup(embedding, corpus_version) if self.use_cache else None
+        if cached and self.generate:
+            item.update(answer=cached["answer"], citations=cached["citations"], cached=True)
+            return
+
+        reranker = get_reranker()
+        if reranker:
+            started = time.perf_counter()
+            hits = await reranker.rerank(query, hits, top_k=RERANK_TOP_K)
+            stages["rerank"] = time.perf_counter() - started
+        if not hits:
+            item["error"] = "No relevant context found."
+            return
+        started = time.perf_counter()
+        # Tokenizer-bound, so off the event loop
+        contexts, packed, packing = await run_in_threadpool(get_context_packer().pack, hits)
+        stages["pack"] = time.perf_counter() - started
+        item["citations"] = citations_for(packed)
+        item["context"] = packing
+        if not self.generate:
+            return
+
+        scheduler = get_llm_scheduler()
+        async with self._generation:
+            # No queue deadline: a batch waits for its fair share of slots
+            ticket = scheduler.enqueue(self.user_id)
+            try:
+                while not ticket.granted:
+                    await scheduler.wait(ticket, timeout=1.0)
+                stages["llm_queue_wait"] = ticket.granted_at - ticket.enqueued_at
+                observe_stage("llm_queue_wait", stages["llm_queue_wait"])
+                parts: List[str] = []
+                started = time.perf_counter()
+                async for chunk in get_llm_client().generate_stream(query, context=contexts):
+                    if isinstance(chunk, LLMErrorMessage):
+                        item["error"] = str(chunk)
+                        return
+                    if not parts:
+                        stages["ttft"] = time.perf_counter() - started
+                    parts.append(chunk)
+                stages["generate"] = time.perf_counter() - started
+            finally:
+                scheduler.release(ticket)
+        item["answer"] = "".join(parts)
+        if self.use_cache and item["answer"]:
+            answer_cache.store(embedding, corpus_version, query, item["answer"], item["citations"])
+
+
+def _write_lines(out, lines: List[str]):
+    out.writelines(lines)
+    out.flush()
+
+def _write_and_close(out, lines: List[str]):
+    try:
+        out.writelines(lines)
+    finally:
+        out.close()
+
+
+def _expire_stale_jobs(now: datetime.datetime):
+    """Fails unfinished jobs whose worker stopped renewing their lease.
+
+    Rows from before leases existed have none and are expired too.
+    """
+    return update(BatchJob).where(
+        BatchJob.status.in_([JobStatus.PENDING, JobStatus.RUNNING]),
+        or_(BatchJob.lease_expires_at.is_(None), BatchJob.lease_expires_at < now),
+    ).values(status=JobStatus.FAILED, error="Interrupted: the worker running it stopped", finished_at=now)
+
+
+class BatchJobManager:
+    """Runs large batches in the background, writing results to NDJSON files.
+
+    Jobs run on the event loop of the worker that accepted them; progress
+    and status are persisted so any worker can report them. While a worker
+    has jobs it renews their leases, and fails other workers' expired ones.
+    """
+
+    def __init__(self, results_dir: str = BATCH_RESULTS_DIR):
+        self.results_dir = results_dir
+        # Identifies this worker's jobs in the table
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._runs: Dict[int, asyncio.Task] = {}
+        self._heartbeat: Optional[asyncio.Task] = None
+
+    def _lease_deadline(self) -> datetime.datetime:
+        return datetime.datetime.utcnow() + datetime.timedelta(seconds=BATCH_JOB_LEASE_SECONDS)
+
+    async def _update(self, job_id: int, **values):
+        async with AsyncSessionLocal() as db:
+            await db.execute(update(BatchJob).where(BatchJob.id == job_id).values(**values))
+            await db.commit()
+
+    async def submit(self, run: BatchRun) -> BatchJob:
+        await run_in_threadpool(os.makedirs, self.results_dir, exist_ok=True)
+        async with AsyncSessionLocal() as db:
+            job = BatchJob(user_id=run.user_id, total=len(run.queries), owner=self.owner,
+                           lease_expires_at=self._lease_deadline())
+            db.add(job)
+            await db.commit()
+            job.result_path = os.path.join(self.results_dir, f"batch_{job.id}.ndjson")
+            await db.commit()
+        loop = asyncio.get_running_loop()
+        task = loop.create_task(self._execute(job.id, job.result_path, run))
+        self._runs[job.id] = task
+        task.add_done_callback(lambda _: self._runs.pop(job.id, None))
+        if self._heartbeat is None or self._heartbeat.done():
+            self._heartbeat = loop.create_task(self._renew_leases())
+        return job
+
+    async def _renew_leases(self):
+        # Runs while this worker has jobs; a third of the lease between renewals
+        while self._runs:
+            await asyncio.sleep(BATCH_JOB_LEASE_SECONDS / 3)
+            try:
+                async with AsyncSessionLocal() as db:
+                    await db.execute(
+                        update(BatchJob)
+                        .where(BatchJob.id.in_(list(self._runs)), BatchJob.owner == self.owner)
+                        .values(lease_expires_at=self._lease_deadline())
+                    )
+                    await db.execute(_expire_stale_jobs(datetime.datetime.utcnow()))
+                    await db.commit()
+            except Exception as e:
+                print(f"Batch job lease renewal failed: {e!r}")
+
+    async def _execute(self, job_id: int, path: str, run: BatchRun):
+        completed = failed = 0
+        last_update = time.monotonic()
+        try:
+            await self._update(job_id, status=JobStatus.RUNNING)
+            # File I/O runs in the threadpool; lines are buffered between
+            # the once-a-second flushes
+            out = await run_in_threadpool(open, path, "w")
+            pending: List[str] = []
+            try:
+                async for item in run.results():
+                    pending.append(json.dumps(item) + "\n")
+                    completed += 1
+                    failed += bool(item["error"])
+                    if time.monotonic() - last_update >= 1.0:
+                        # Progress at most once a second, not per question
+                        await run_in_threadpool(_write_lines, out, pending)
+                        pending = []
+                        await self._update(job_id, completed=completed, failed=failed)
+                        last_update = time.monotonic()
+                pending.append(json.dumps({"summary": run.summary()}) + "\n")
+            finally:
+                # Also keeps what finished before a cancel or error
+                await run_in_threadpool(_write_and_close, out, pending)
+            status, error = JobStatus.COMPLETED, None
+        except asyncio.CancelledError:
+            status, error = JobStatus.CANCELLED, None
+        except Exception as e:
+            print(f"Batch job {job_id} failed: {e!r}")
+            status, error = JobStatus.FAILED, repr(e)
+        await self._update(job_id, status=status, error=error, completed=completed, failed=failed,
+                           finished_at=datetime.datetime.utcnow())
+
+    def cancel(self, job_id: int) -> bool:
+        """Cancels a job running in this worker."""
+        task = self._runs.get(job_id)
+        if task is None:
+            return False
+        task.cancel()
+        return True
+
+    def recover(self, db):
+        """Marks jobs whose worker is gone (expired lease) as failed.
+
+        Jobs that other live workers are running keep their status.
+        """
+        db.execute(_expire_stale_jobs(datetime.datetime.utcnow()))
+        db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"owner": self.owner, "running": len(self._runs)}
+
+
+_job_manager: Optional[BatchJobManager] = None
+
+def get_batch_job_manager() -> BatchJobManager:
+    global _job_manager
+    if _job_manager is None:
+        _job_manager = BatchJobManager()
+    return _job_manager
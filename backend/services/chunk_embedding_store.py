@@ -0,0 +1,77 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Tuple
+
+import numpy as np
+
+# SQLite caps the number of bound parameters per statement
+_MAX_PARAMS = 500
+
+class ChunkEmbeddingStore:
+    """Persistent, content-addressed cache of chunk embeddings.
+
+    Rows are keyed by (sha256 of the chunk text, model key), where the model
+    key covers model name, backend and quantization, so re-uploading or
+    reindexing a document only embeds chunks whose text actually changed.
+    Lives in its own SQLite file (WAL mode) so ingestion processes can read
+    and write it without contending on the app database.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or os.getenv("CHUNK_EMBEDDING_CACHE_PATH", "./embedding_cache.db")
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunk_embeddings ("
+                " chunk_hash TEXT NOT NULL,"
+                " model TEXT NOT NULL,"
+                " embedding BLOB NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " PRIMARY KEY (chunk_hash, model)"
+                ") WITHOUT ROWID"
+            )
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def hash_text(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get_many(self, hashes: Iterable[str], model: str) -> Dict[str, np.ndarray]:
+        hashes = list(hashes)
+        found = {}
+        conn = self._conn()
+        for i in range(0, len(hashes), _MAX_PARAMS):
+            part = hashes[i:i + _MAX_PARAMS]
+            placeholders = ",".join("?" * len(part))
+            rows = conn.execute(
+                f"SELECT chunk_hash, embedding FROM chunk_embeddings WHERE model = ? AND chunk_hash IN ({placeholders})",
+                [model, *part],
+            )
+            for chunk_hash, blob in rows:
+                found[chunk_hash] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, items: Iterable[Tuple[str, np.ndarray]], model: str):
+        now = time.time()
+        rows = [(h, model, np.asarray(v, dtype=np.float32).tobytes(), now) for h, v in items]
+        if not rows:
+            return
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO chunk_embeddings (chunk_hash, model, embedding, created_at) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+
+    def count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM chunk_embeddings").fetchone()[0]
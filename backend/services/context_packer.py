@@ -0,0 +1,204 @@
+import os
+import re
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from services.cache import LRUCache
+
+# Ingestion stores chunks as "Source: <filename>\nContent: <text>"
+_PREFIX = re.compile(r"\ASource: [^\n]*\nContent: ", re.S)
+SPAN_SEPARATOR = "\n[...]\n"
+MAX_MERGE_GAP = 2
+
+def _body(content: str) -> str:
+    match = _PREFIX.match(content)
+    return content[match.end():] if match else content
+
+def _text_overlap(left: str, right: str, max_overlap: int, min_overlap: int = 20) -> int:
+    """Length of the longest suffix of `left` that is a prefix of `right`."""
+    for size in range(min(max_overlap, len(left), len(right)), min_overlap - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def citations_for(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Citation entries for packed results, as sent to the client."""
+    return [{
+        "content": r['content'][:200] + "...",
+        "pages": r['metadata'].get('pages', 'Unknown'),
+        "document_name": r['metadata'].get('filename', 'Unknown'),
+        "document_id": r['metadata'].get('document_id')
+    } for r in results]
+
+
+class ContextPacker:
+    """Assembles retrieved chunks into the prompt context.
+
+    Chunks of the same document that overlap or touch are merged into one
+    span (using the character offsets stored at ingestion, or the text
+    overlap for chunks indexed before offsets were), spans are grouped under
+    a single `Source:` header per document, and the best-scoring spans are
+    packed greedily into a token budget.
+    """
+
+    def __init__(self, token_budget: int, count_tokens: Callable[[str], int], max_text_overlap: int = 200,
+                 token_cache_size: int = 10000):
+        self.token_budget = token_budget
+        self.count_tokens = count_tokens
+        # Popular chunks are packed again and again; count their tokens once
+        self.token_counts = LRUCache(max_size=token_cache_size)
+        self.max_text_overlap = max_text_overlap
+        self._stats_lock = threading.Lock()  # pack() runs on threadpool threads
+        self.requests = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self.chunks_dropped = 0
+
+    def _count_tokens(self, text: str) -> int:
+        n = self.token_counts.get(text)
+        if n is None:
+            n = self.count_tokens(text)
+            self.token_counts.set(text, n)
+        return n
+
+    def _spans(self, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Merges each document's chunks into contiguous spans.
+
+        `results` are in relevance order; a span scores as its best chunk.
+        """
+        by_document: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        for rank, r in enumerate(results):
+            metadata = r.get("metadata") or {}
+            key = (metadata.get("document_id") or r["id"], metadata.get("ingest_run", ""))
+            by_document.setdefault(key, []).append({
+                "rank": rank,
+                "ranks": [rank],
+                "text": _body(r["content"]),
+                "start": metadata.get("start"),
+                "end": metadata.get("end"),
+                "filename": metadata.get("filename", "Unknown"),
+                "document_id": key[0],
+            })
+
+        spans = []
+        for pieces in by_document.values():
+            if all(p["start"] is not None for p in pieces):
+                pieces.sort(key=lambda p: p["start"])
+                merged = [pieces[0]]
+                for p in pieces[1:]:
+                    cur = merged[-1]
+                    gap = p["start"] - cur["end"]
+                    if gap <= MAX_MERGE_GAP:
+                        # Overlapping, or separated only by the whitespace trimmed off chunk ends
+                        if p["end"] > cur["end"]:
+                            cur["text"] += " " + p["text"] if gap > 0 else p["text"][-gap:]
+                            cur["end"] = p["end"]
+                        cur["rank"] = min(cur["rank"], p["rank"])
+                        cur["ranks"] += p["ranks"]
+                    else:
+                        merged.append(p)
+                spans.extend(merged)
+                continue
+
+            # No offsets: chain chunks whose text continues another's
+            merged = []
+            for p in pieces:
+                for cur in merged:
+                    if p["text"] in cur["text"]:
+                        overlap = len(p["text"])
+                    else:
+                        overlap = _text_overlap(cur["text"], p["text"], self.max_text_overlap)
+                    if overlap:
+                        cur["text"] += p["text"][overlap:]
+                        cur["ranks"] += p["ranks"]
+                        break
+                else:
+                    merged.append(p)
+            spans.extend(merged)
+        return spans
+
+    def pack(self, results: List[Dict[str, Any]]) -> Tuple[List[str], List[Dict[str, Any]], Dict[str, int]]:
+        """Returns (contexts, packed results, report) for a list of retrieved chunks.
+
+        Packed results are the input chunks that made it into the prompt, in
+        relevance order, for use as citations.
+        """
+        if not results:
+            return [], [], {"chunks": 0, "spans": 0, "tokens": 0, "tokens_saved": 0, "dropped": 0}
+        tokens_in = sum(self._count_tokens(r["content"]) for r in results)
+
+        spans = sorted(self._spans(results), key=lambda s: s["rank"])
+        headers: Dict[str, int] = {}
+        selected: List[Dict[str, Any]] = []
+        used = 0
+        for span in spans:
+            header_cost = 0
+            if span["document_id"] not in headers:
+                header_cost = self._count_tokens(f"Source: {span['filename']}\nContent: ")
+            cost = self._count_tokens(span["text"]) + header_cost
+            if used + cost > self.token_budget:
+                if selected:
+                    continue
+                # Never send an empty context: cut the best span to fit
+                keep = max(self.token_budget - header_cost, 0) / max(cost - header_cost, 1)
+                span["text"] = span["text"][:int(len(span["text"]) * keep)]
+                cost = self._count_tokens(span["text"]) + header_cost
+            headers.setdefault(span["document_id"], span["rank"])
+            selected.append(span)
+            used += cost
+
+        # One block per document, best document first, spans in reading order
+        contexts = []
+        for document_id in sorted(headers, key=headers.get):
+            doc_spans = [s for s in selected if s["document_id"] == document_id]
+            if doc_spans[0]["start"] is not None:
+                doc_spans.sort(key=lambda s: s["start"])
+            body = SPAN_SEPARATOR.join(s["text"] for s in doc_spans)
+            contexts.append(f"Source: {doc_spans[0]['filename']}\nContent: {body}")
+
+        packed_ranks = sorted(rank for s in selected for rank in s["ranks"])
+        tokens_out = sum(self._count_tokens(c) for c in contexts)
+        report = {
+            "chunks": len(packed_ranks),
+            "spans": len(selected),
+            "tokens": tokens_out,
+            "tokens_saved": max(tokens_in - tokens_out, 0),
+            "dropped": len(results) - len(packed_ranks),
+        }
+        with self._stats_lock:
+            self.requests += 1
+            self.tokens_in += tokens_in
+            self.tokens_out += tokens_out
+            self.chunks_dropped += report["dropped"]
+        return contexts, [results[i] for i in packed_ranks], report
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "token_budget": self.token_budget,
+            "requests": self.requests,
+            "tokens_in": self.tokens_in,
+            "tokens_out": self.tokens_out,
+            "tokens_saved": self.tokens_in - self.tokens_out,
+            "avg_tokens_saved": round((self.tokens_in - self.tokens_out) / self.requests, 1) if self.requests else 0.0,
+            "chunks_dropped": self.chunks_dropped,
+            "token_cache": self.token_counts.stats(),
+        }
+
+
+_context_packer: Optional[ContextPacker] = None
+
+def get_context_packer() -> ContextPacker:
+    global _context_packer
+    if _context_packer is None:
+        from services.embedding_service import EmbeddingService
+        # The local embedding tokenizer stands in for the LLM's; both are
+        # subword tokenizers, so counts are close enough for budgeting.
+        _context_packer = ContextPacker(
+            token_budget=int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500")),
+            count_tokens=lambda text: EmbeddingService().count_tokens(text),
+            # Legacy chunks overlap by about CHUNK_OVERLAP characters
+            max_text_overlap=2 * int(os.getenv("CHUNK_OVERLAP", "50")),
+            token_cache_size=int(os.getenv("CONTEXT_TOKEN_CACHE_SIZE", "10000")),
+        )
+    return _context_packer
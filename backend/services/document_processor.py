@@ -1,54 +1,192 @@
-import fitz  # PyMuPDF
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Callable
+from bisect import bisect_left, bisect_right
+import os
 import re
 
+# A sentence ends at ., ! or ? (optionally followed by closing quotes/brackets)
+# and whitespace, or at a blank line.
+_SENTENCE_END = re.compile(r"[.!?][\"')\]]*\s|\n\s*\n")
+_WHITESPACE = re.compile(r"\s")
+
+# MiniLM truncates input at 256 tokens, including [CLS]/[SEP]. Chunks are
+# embedded without their "Source: filename" header, but keep the headroom it
+# once needed so existing documents chunk the same way.
+DEFAULT_MAX_TOKENS = 224
+# Upper-bound estimate used to size the first candidate window in token mode;
+# the window is then shrunk until the real token count fits.
+_CHARS_PER_TOKEN_ESTIMATE = 5
+
 class DocumentProcessor:
-    def __init__(self, chunk_size: int = 500, chunk_overlap: int = 50):
+    def __init__(
+        self,
+        chunk_size: int = 500,
+        chunk_overlap: int = 50,
+        chunk_mode: str = "chars",
+        max_tokens: int = DEFAULT_MAX_TOKENS,
+    ):
+        """
+        chunk_mode="chars" cuts chunks of at most `chunk_size` characters.
+        chunk_mode="tokens" cuts chunks of at most `max_tokens` model tokens, as
+        measured by the `token_counter` passed to `iter_chunks`.
+        `chunk_overlap` is in characters in both modes.
+        """
+        if chunk_mode not in ("chars", "tokens"):
+            raise ValueError(f"Unknown chunk_mode: {chunk_mode}")
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        self.chunk_mode = chunk_mode
+        self.max_tokens = max_tokens
+
+    def count_pages(self, file_path: str) -> int:
+        """Returns the number of pages in a PDF without extracting any text."""
+        import fitz  # PyMuPDF; imported on first use, only ingestion needs it
+        with fitz.open(file_path) as doc:
+            return doc.page_count
+
+    def iter_pages(self, file_path: str) -> Iterator[Dict[str, Any]]:
+        """Yields page contents one at a time so only a single page is held in memory."""
+        import fitz
+        with fitz.open(file_path) as doc:
+            for page_num in range(doc.page_count):
+                page = doc.load_page(page_num)
+                text = page.get_text("text")
+                yield {
+                    "page_num": page_num + 1,
+                    "content": text
+                }
 
     def extract_text(self, file_path: str) -> List[Dict[str, Any]]:
         """Extracts text from PDF and returns a list of page contents."""
-        doc = fitz.open(file_path)
-        pages = []
-        for page_num in range(len(doc)):
-            page = doc.load_page(page_num)
-            text = page.get_text("text")
-            pages.append({
-                "page_num": page_num + 1,
-                "content": text
-            })
-        return pages
-
-    def chunk_text(self, pages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Chunks text across pages with overlap."""
-        chunks = []
-        all_text = ""
-        page_mappings = [] # To keep track of which page a char belongs to
-        
+        return list(self.iter_pages(file_path))
+
+    def _snap_end(self, text: str, start: int, hi: int) -> int:
+        """Moves a cut at `hi` back to the nearest sentence end, else whitespace.
+
+        The cut never moves back past the middle of the chunk; if no boundary
+        exists there the chunk is cut hard at `hi`.
+        """
+        lo = start + max((hi - start) // 2, self.chunk_overlap + 1)
+        if lo >= hi:
+            return hi
+        cut = -1
+        for m in _SENTENCE_END.finditer(text, lo, hi):
+            cut = m.end()
+        if cut > 0:
+            return cut
+        cut = max(text.rfind(" ", lo, hi), text.rfind("\n", lo, hi), text.rfind("\t", lo, hi))
+        return cut + 1 if cut >= 0 else hi
+
+    def _next_start(self, text: str, start: int, end: int) -> int:
+        """Backs off `chunk_overlap` characters from `end`, aligned to a word start."""
+        nxt = max(end - self.chunk_overlap, start + 1)
+        if nxt < end and not text[nxt - 1].isspace():
+            m = _WHITESPACE.search(text, nxt, end)
+            nxt = m.end() if m else end
+        return nxt
+
+    def iter_chunks(
+        self,
+        pages: Iterable[Dict[str, Any]],
+        token_counter: Optional[Callable[[str], int]] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """Chunks a stream of pages with overlap, yielding chunks as soon as they are complete.
+
+        Chunk ends are snapped back to a sentence or word boundary. Page
+        membership is found by binary search over page start offsets, and only
+        the text a future chunk can still reach is buffered, so the whole pass
+        is linear in document length with memory bounded by about one page plus
+        one chunk.
+
+        Each chunk carries its `start`/`end` character offsets in the
+        concatenated document text.
+        """
+        token_mode = self.chunk_mode == "tokens"
+        if token_mode and token_counter is None:
+            raise ValueError("chunk_mode='tokens' requires a token_counter")
+        window = self.max_tokens * _CHARS_PER_TOKEN_ESTIMATE if token_mode else self.chunk_size
+
+        buffer = ""
+        buffer_start = 0   # Absolute offset of buffer[0] in the concatenated text
+        page_starts = []   # Absolute start offset of each buffered page, ascending
+        page_nums = []
+        start = 0          # Absolute offset of the next chunk
+
+        def cut_chunk(final: bool):
+            """Returns (chunk, next_start) for the chunk beginning at `start`."""
+            text_end = buffer_start + len(buffer)
+            s = start - buffer_start
+            # Never start a chunk on whitespace
+            while s < len(buffer) and buffer[s].isspace():
+                s += 1
+            if s >= len(buffer):
+                return None, text_end
+            hi = min(s + window, len(buffer))
+            e = hi if (final and hi == len(buffer)) else self._snap_end(buffer, s, hi)
+
+            if token_mode:
+                count = token_counter(buffer[s:e])
+                while count > self.max_tokens and e - s > 1:
+                    hi = s + max(int((e - s) * self.max_tokens / count * 0.95), 1)
+                    e = self._snap_end(buffer, s, hi)
+                    count = token_counter(buffer[s:e])
+
+            content_end = e
+            while content_end > s and buffer[content_end - 1].isspace():
+                content_end -= 1
+
+            abs_s, abs_e = buffer_start + s, buffer_start + content_end
+            chunk = None
+            if content_end > s:
+                first = bisect_right(page_starts, abs_s) - 1
+                last = bisect_left(page_starts, abs_e)
+                chunk = {
+                    "content": buffer[s:content_end],
+                    "pages": page_nums[max(first, 0):last],
+                    "start": abs_s,
+                    "end": abs_e,
+                }
+
+            nxt = text_end if (final and e >= len(buffer)) else buffer_start + self._next_start(buffer, s, e)
+            return chunk, nxt
+
         for p in pages:
-            start_idx = len(all_text)
-            all_text += p['content'] + "\n"
-            end_idx = len(all_text)
-            page_mappings.append({"start": start_idx, "end": end_idx, "page": p['page_num']})
-
-        # Simple overlap chunking
-        start = 0
-        while start < len(all_text):
-            end = start + self.chunk_size
-            chunk_content = all_text[start:end]
-            
-            # Find which page(s) this chunk belongs to
-            chunk_pages = []
-            for m in page_mappings:
-                if not (end <= m['start'] or start >= m['end']):
-                    chunk_pages.append(m['page'])
-            
-            chunks.append({
-                "content": chunk_content,
-                "pages": list(set(chunk_pages))
-            })
-            
-            start += (self.chunk_size - self.chunk_overlap)
-            
-        return chunks
+            page_starts.append(buffer_start + len(buffer))
+            page_nums.append(p['page_num'])
+            buffer += p['content'] + "\n"
+
+            # Emit every chunk whose full window is already buffered
+            while start + window < buffer_start + len(buffer):
+                chunk, start = cut_chunk(final=False)
+                if chunk:
+                    yield chunk
+
+            # Drop text and pages that no future chunk can reach
+            buffer = buffer[start - buffer_start:]
+            buffer_start = start
+            first = bisect_right(page_starts, start) - 1
+            if first > 0:
+                del page_starts[:first]
+                del page_nums[:first]
+
+        while start < buffer_start + len(buffer):
+            chunk, start = cut_chunk(final=True)
+            if chunk:
+                yield chunk
+
+    def chunk_text(
+        self,
+        pages: List[Dict[str, Any]],
+        token_counter: Optional[Callable[[str], int]] = None,
+    ) -> List[Dict[str, Any]]:
+        """Chunks text across pages with overlap."""
+        return list(self.iter_chunks(pages, token_counter=token_counter))
+
+
+def get_document_processor() -> DocumentProcessor:
+    """Factory: a DocumentProcessor configured from the CHUNK_* env vars."""
+    return DocumentProcessor(
+        chunk_size=int(os.getenv("CHUNK_SIZE", "500")),
+        chunk_overlap=int(os.getenv("CHUNK_OVERLAP", "50")),
+        chunk_mode=os.getenv("CHUNK_MODE", "chars"),
+        max_tokens=int(os.getenv("CHUNK_MAX_TOKENS", str(DEFAULT_MAX_TOKENS))),
+    )
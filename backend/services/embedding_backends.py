@@ -0,0 +1,199 @@
+import json
+import os
+from typing import List, Union
+
+import numpy as np
+
+class TorchBackend:
+    """The reference backend: a PyTorch SentenceTransformer in fp32."""
+
+    name = "torch"
+    variant = "torch-fp32"
+
+    def __init__(self, model_name: str, threads: int = 0):
+        import torch
+        from sentence_transformers import SentenceTransformer
+        if threads > 0:
+            torch.set_num_threads(threads)
+        # Use CPU for lightweight operations, but use GPU if available
+        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.model = SentenceTransformer(model_name, device=self.device)
+        self.tokenizer = self.model.tokenizer
+
+    @property
+    def description(self) -> str:
+        return f"torch on {self.device}"
+
+    def encode(self, texts: Union[str, List[str]]) -> np.ndarray:
+        return self.model.encode(texts)
+
+
+class OnnxBackend:
+    """ONNX Runtime inference of an exported SentenceTransformer.
+
+    The transformer is exported once (optionally with dynamic int8 weight
+    quantization) into `export_dir`, together with its tokenizer and pooling
+    settings; after that neither torch nor the network is needed. Pooling and
+    normalization are reimplemented in NumPy to match the original model.
+    """
+
+    name = "onnx"
+    CONFIG_FILE = "embedding_config.json"
+
+    def __init__(self, model_name: str, export_dir: str, quantize: bool = False, threads: int = 0, batch_size: int = 32):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise RuntimeError("EMBEDDING_BACKEND=onnx requires the onnxruntime package") from e
+        from transformers import AutoTokenizer
+
+        self.quantize = quantize
+        self.batch_size = batch_size
+        model_file = "model.int8.onnx" if quantize else "model.onnx"
+        if not all(os.path.exists(os.path.join(export_dir, f)) for f in (model_file, self.CONFIG_FILE)):
+            export_onnx(model_name, export_dir, quantize=quantize)
+
+        with open(os.path.join(export_dir, self.CONFIG_FILE)) as f:
+            config = json.load(f)
+        self.pooling = config["pooling"]
+        self.normalize = config["normalize"]
+        self.max_seq_length = config["max_seq_length"]
+        self.input_names = config["input_names"]
+        self.dim = config["dim"]
+        self.tokenizer = AutoTokenizer.from_pretrained(export_dir)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(
+            os.path.join(export_dir, model_file), options, providers=["CPUExecutionProvider"]
+        )
+
+    @property
+    def variant(self) -> str:
+        return f"onnx-{'int8' if self.quantize else 'fp32'}"
+
+    @property
+    def description(self) -> str:
+        return f"onnx ({'int8' if self.quantize else 'fp32'}) on cpu"
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encoded = self.tokenizer(
+            texts, padding=True, truncation=True, max_length=self.max_seq_length, return_tensors="np"
+        )
+        mask = encoded["attention_mask"].astype(np.int64)
+        feeds = {}
+        for name in self.input_names:
+            value = encoded.get(name)
+            feeds[name] = (value if value is not None else np.zeros_like(mask)).astype(np.int64)
+        hidden = self.session.run(None, feeds)[0]
+
+        if self.pooling == "cls":
+            embeddings = hidden[:, 0]
+        else:
+            weights = mask[..., None].astype(np.float32)
+            embeddings = (hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+        if self.normalize:
+            embeddings = embeddings / np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings.astype(np.float32)
+
+    def encode(self, texts: Union[str, List[str]]) -> np.ndarray:
+        single = isinstance(texts, str)
+        if single:
+            texts = [texts]
+        out = np.empty((len(texts), self.dim), dtype=np.float32)
+        # Batch texts of similar length together so little compute goes to padding
+        order = np.argsort([-len(t) for t in texts], kind="stable")
+        for i in range(0, len(texts), self.batch_size):
+            idx = order[i:i + self.batch_size]
+            out[idx] = self._encode_batch([texts[j] for j in idx])
+        return out[0] if single else out
+
+
+def export_onnx(model_name: str, export_dir: str, quantize: bool = False):
+    """Exports a SentenceTransformer's transformer to ONNX (and int8) in `export_dir`."""
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    os.makedirs(export_dir, exist_ok=True)
+    fp32_path = os.path.join(export_dir, "model.onnx")
+    # The config is written last, so its presence marks a complete export
+    if not os.path.exists(os.path.join(export_dir, OnnxBackend.CONFIG_FILE)):
+        st = SentenceTransformer(model_name, device="cpu")
+        transformer = st[0]
+        hf_model = transformer.auto_model.eval()
+        modules = [type(m).__name__ for m in st]
+        pooling = next((m for m in st if type(m).__name__ == "Pooling"), None)
+
+        class _Encoder(torch.nn.Module):
+            def __init__(self, model):
+                super().__init__()
+                self.model = model
+
+            def forward(self, input_ids, attention_mask, token_type_ids=None):
+                kwargs = {"input_ids": input_ids, "attention_mask": attention_mask}
+                if token_type_ids is not None:
+                    kwargs["token_type_ids"] = token_type_ids
+                return self.model(**kwargs)[0]
+
+        dummy = transformer.tokenizer(["An example sentence."], return_tensors="pt")
+        input_names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in dummy]
+        dynamic_axes = {n: {0: "batch", 1: "sequence"} for n in input_names}
+        dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+        with torch.no_grad():
+            torch.onnx.export(
+                _Encoder(hf_model),
+                tuple(dummy[n] for n in input_names),
+                fp32_path,
+                input_names=input_names,
+                output_names=["last_hidden_state"],
+                dynamic_axes=dynamic_axes,
+                opset_version=14,
+            )
+        transformer.tokenizer.save_pretrained(export_dir)
+        config = {
+            "model_name": model_name,
+            "pooling": "cls" if pooling is not None and pooling.pooling_mode_cls_token else "mean",
+            "normalize": "Normalize" in modules,
+            "max_seq_length": st.max_seq_length,
+            "input_names": input_names,
+            "dim": st.get_sentence_embedding_dimension(),
+        }
+        with open(os.path.join(export_dir, OnnxBackend.CONFIG_FILE), "w") as f:
+            json.dump(config, f, indent=2)
+        print(f"Exported {model_name} to {fp32_path}")
+
+    int8_path = os.path.join(export_dir, "model.int8.onnx")
+    if quantize and not os.path.exists(int8_path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+        print(f"Quantized {model_name} to {int8_path}")
+
+
+def load_embedding_backend(model_name: str, backend: str = None, quantize: bool = None, threads: int = None):
+    """Builds the encoder selected by EMBEDDING_BACKEND (torch | onnx).
+
+    With EMBEDDING_SERVER_SOCKET set (and no explicit `backend`), returns a
+    client of the shared embedding server instead, which owns the encoder.
+    """
+    socket_path = os.getenv("EMBEDDING_SERVER_SOCKET")
+    if backend is None and socket_path:
+        from services.embedding_server import RemoteBackend
+        return RemoteBackend(
+            model_name,
+            socket_path,
+            autostart=os.getenv("EMBEDDING_SERVER_AUTOSTART", "false").lower() in ("1", "true", "yes"),
+        )
+    backend = (backend or os.getenv("EMBEDDING_BACKEND", "torch")).lower()
+    if threads is None:
+        threads = int(os.getenv("EMBEDDING_THREADS", "0"))
+    if backend == "torch":
+        return TorchBackend(model_name, threads=threads)
+    if backend == "onnx":
+        if quantize is None:
+            quantize = os.getenv("EMBEDDING_QUANTIZE", "false").lower() in ("1", "true", "yes")
+        export_dir = os.path.join(os.getenv("EMBEDDING_ONNX_DIR", "./onnx_models"), model_name.replace("/", "__"))
+        return OnnxBackend(model_name, export_dir, quantize=quantize, threads=threads)
+    raise ValueError(f"Unknown EMBEDDING_BACKEND: {backend}")
@@ -0,0 +1,130 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+class EmbeddingBatcher:
+    """Coalesces concurrent query embeddings into batched `encode` calls.
+
+    Queries arriving within `max_wait_ms` of each other (up to
+    `max_batch_size`) are encoded together on a dedicated executor, so a burst
+    of N users costs one forward pass instead of N and never competes with the
+    anyio thread pool used by sync endpoints. Each caller gets its own vector.
+    """
+
+    def __init__(self, embedding_service=None, max_batch_size: int = 32, max_wait_ms: float = 5.0, workers: int = 1):
+        self._embedding_service = embedding_service
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="embed-batch")
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop = None
+        self.batches = 0
+        self.items = 0
+
+    @property
+    def embedding_service(self):
+        # Resolved on first use; that is on the batch executor, so loading the
+        # model never blocks the event loop
+        if self._embedding_service is None:
+            from services.embedding_service import EmbeddingService
+            self._embedding_service = EmbeddingService()
+        return self._embedding_service
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+
+    async def embed(self, text: str) -> List[float]:
+        # Cache hits are answered inline without waiting for a batch window
+        if self._embedding_service is not None:
+            cached = self._embedding_service.lookup_cached(text)
+            if cached is not None:
+                return cached
+        self._ensure_worker()
+        future = self._loop.create_future()
+        self._queue.put_nowait((text, future))
+        return await future
+
+    async def embed_many(self, texts: List[str]) -> List[List[float]]:
+        """Encodes a caller's own batch in one call, on the same executor."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._encode, texts)
+
+    async def _collect(self):
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def _encode(self, texts: List[str]) -> List[List[float]]:
+        return self.embedding_service.get_batch_embeddings(texts)
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            # Callers that disconnected while queued don't need a vector
+            batch = [(text, fut) for text, fut in batch if not fut.done()]
+            if not batch:
+                continue
+            texts = [text for text, _ in batch]
+            try:
+                vectors = await self._loop.run_in_executor(self._executor, self._encode, texts)
+            except Exception as e:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            self.batches += 1
+            self.items += len(batch)
+            for (_, fut), vector in zip(batch, vectors):
+                if not fut.done():
+                    fut.set_result(vector)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "queued": self._queue.qsize() if self._queue else 0,
+        }
+
+    async def aclose(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        self._executor.shutdown(wait=False)
+
+
+_batcher: Optional[EmbeddingBatcher] = None
+
+def get_embedding_batcher() -> EmbeddingBatcher:
+    """Process-wide batcher in front of the EmbeddingService singleton."""
+    global _batcher
+    if _batcher is None:
+        _batcher = EmbeddingBatcher(
+            max_batch_size=int(os.getenv("EMBED_BATCH_MAX_SIZE", "32")),
+            max_wait_ms=float(os.getenv("EMBED_BATCH_WAIT_MS", "5")),
+            workers=int(os.getenv("EMBED_BATCH_WORKERS", "1")),
+        )
+    return _batcher
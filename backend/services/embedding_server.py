@@ -0,0 +1,428 @@
+"""Shared embedding sidecar for multi-worker deployments.
+
+With EMBEDDING_SERVER_SOCKET set, every API worker (and ingestion process)
+uses `RemoteBackend` instead of loading torch and the model itself: one
+sidecar process owns the model and serves encode requests over a Unix
+socket, so memory stays flat as workers are added and concurrent queries
+from all workers share forward passes.
+
+Protocol: length-prefixed JSON messages over the socket. Vectors do not go
+through the socket: each client connection owns a shared memory segment,
+tells the server its name, and the server writes the float32 result rows
+straight into it. Interactive (query) requests are batched together and
+always run before the next slice of a bulk (ingestion) request.
+
+Run the sidecar from backend/ (or set EMBEDDING_SERVER_AUTOSTART=true and
+the first worker that needs it starts it):
+    python -m services.embedding_server
+"""
+import asyncio
+import atexit
+import json
+import os
+import queue
+import socket
+import struct
+import subprocess
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import shared_memory
+from typing import Any, Deque, Dict, List, Optional, Union
+
+import numpy as np
+
+_HEADER = struct.Struct(">I")
+_MIN_SEGMENT = 1 << 20
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def tokenizer_dir(socket_path: str) -> str:
+    """Where the server saves the model's tokenizer for its clients."""
+    return os.path.splitext(os.path.abspath(socket_path))[0] + "_tokenizer"
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """Attaches to a client's segment without taking ownership of it."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        # Otherwise this process's resource tracker would unlink the
+        # client's segment when the server exits
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+# --- Server -----------------------------------------------------------------
+
+class _Job:
+    __slots__ = ("texts", "future", "done", "parts")
+
+    def __init__(self, texts: List[str], future: asyncio.Future):
+        self.texts = texts
+        self.future = future
+        self.done = 0
+        self.parts: List[np.ndarray] = []
+
+
+class EmbeddingServer:
+    def __init__(self, backend, model_name: str, socket_path: str, max_batch: int = 64, max_wait_ms: float = 2.0):
+        self.backend = backend
+        self.model_name = model_name
+        self.socket_path = os.path.abspath(socket_path)
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        # One forward pass at a time; the backend parallelizes internally
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed-server")
+        self._interactive: Deque[_Job] = deque()
+        self._bulk: Deque[_Job] = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self.dim = int(np.asarray(backend.encode(["warm-up"])).shape[-1])
+        self.tokenizer_dir = tokenizer_dir(self.socket_path)
+        backend.tokenizer.save_pretrained(self.tokenizer_dir)
+        self.connections = 0
+        self.requests = {"interactive": 0, "bulk": 0}
+        self.batches = 0
+        self.texts = 0
+
+    def _submit(self, texts: List[str], bulk: bool) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        (self._bulk if bulk else self._interactive).append(_Job(texts, future))
+        self.requests["bulk" if bulk else "interactive"] += 1
+        self._wakeup.set()
+        return future
+
+    async def _encode(self, texts: List[str]) -> np.ndarray:
+        vectors = await asyncio.get_running_loop().run_in_executor(self._executor, self.backend.encode, texts)
+        self.batches += 1
+        self.texts += len(texts)
+        return np.asarray(vectors, dtype=np.float32).reshape(len(texts), self.dim)
+
+    async def _run(self):
+        while True:
+            if not self._interactive and not self._bulk:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            if self._interactive:
+                if self.max_wait > 0 and sum(len(j.texts) for j in self._interactive) < self.max_batch:
+                    # Let queries from other workers join this forward pass
+                    await asyncio.sleep(self.max_wait)
+                jobs, size = [], 0
+                while self._interactive and size < self.max_batch:
+                    job = self._interactive.popleft()
+                    if not job.future.done():
+                        jobs.append(job)
+                        size += len(job.texts)
+                if not jobs:
+                    continue
+                try:
+                    vectors = await self._encode([t for job in jobs for t in job.texts])
+                except Exception as e:
+                    for job in jobs:
+                        if not job.future.done():
+                            job.future.set_exception(e)
+                    continue
+                offset = 0
+                for job in jobs:
+                    if not job.future.done():
+                        job.future.set_result(vectors[offset:offset + len(job.texts)])
+                    offset += len(job.texts)
+            else:
+                # Bulk requests go one slice at a time, so a query arriving
+                # mid-document waits for at most one slice
+                job = self._bulk[0]
+                if job.future.done():
+                    self._bulk.popleft()
+                    continue
+                try:
+                    job.parts.append(await self._encode(job.texts[job.done:job.done + self.max_batch]))
+                except Exception as e:
+                    self._bulk.popleft()
+                    if not job.future.done():
+                        job.future.set_exception(e)
+                    continue
+                job.done += self.max_batch
+                if job.done >= len(job.texts):
+                    self._bulk.popleft()
+                    if not job.future.done():
+                        job.future.set_result(np.concatenate(job.parts))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "model": self.model_name,
+            "backend": self.backend.description,
+            "connections": self.connections,
+            "requests": dict(self.requests),
+            "batches": self.batches,
+            "texts": self.texts,
+            "avg_batch_size": round(self.texts / self.batches, 2) if self.batches else 0.0,
+            "queued": {"interactive": len(self._interactive), "bulk": len(self._bulk)},
+        }
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        shm: Optional[shared_memory.SharedMemory] = None
+        try:
+            while True:
+                try:
+                    (length,) = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+                    request = json.loads(await reader.readexactly(length))
+                except asyncio.IncompleteReadError:
+                    break
+                op = request.get("op")
+                if op == "encode":
+                    if request.get("shm"):
+                        if shm is not None:
+                            shm.close()
+                        shm = _attach(request["shm"])
+                    texts = request["texts"]
+                    if shm is None or len(texts) * self.dim * 4 > shm.size:
+                        response = {"error": "shared memory segment missing or too small"}
+                    else:
+                        try:
+                            vectors = await self._submit(texts, request.get("priority") == "bulk")
+                            view = np.ndarray((len(texts), self.dim), dtype=np.float32, buffer=shm.buf)
+                            view[:] = vectors
+                            del view  # The segment can't be closed while a view exists
+                            response = {"n": len(texts)}
+                        except Exception as e:
+                            response = {"error": repr(e)}
+                elif op == "hello":
+                    response = {"model": self.model_name, "dim": self.dim, "variant": self.backend.variant,
+                                "description": self.backend.description, "tokenizer_dir": self.tokenizer_dir}
+                elif op == "stats":
+                    response = self.stats()
+                else:
+                    response = {"error": f"unknown op {op!r}"}
+                body = json.dumps(response).encode()
+                writer.write(_HEADER.pack(len(body)) + body)
+                await writer.drain()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self.connections -= 1
+            if shm is not None:
+                shm.close()
+            writer.close()
+
+    async def serve(self):
+        self._wakeup = asyncio.Event()
+        if os.path.exists(self.socket_path):
+            # A live server means a second sidecar was started by mistake;
+            # otherwise it's a stale socket from a crash
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.socket_path)
+                raise RuntimeError(f"An embedding server is already listening on {self.socket_path}")
+            except (ConnectionRefusedError, FileNotFoundError):
+                os.unlink(self.socket_path)
+            finally:
+                probe.close()
+        server = await asyncio.start_unix_server(self._handle, path=self.socket_path)
+        worker = asyncio.get_running_loop().create_task(self._run())
+        print(f"Embedding server ready on {self.socket_path} ({self.model_name}, {self.backend.description}, dim {self.dim})")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            worker.cancel()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+
+# --- Client -----------------------------------------------------------------
+
+class EmbeddingServerError(RuntimeError):
+    """The embedding server rejected a request or could not be reached."""
+
+
+class _Connection:
+    def __init__(self, socket_path: str, timeout: float):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(socket_path)
+        self.shm: Optional[shared_memory.SharedMemory] = None
+
+    def request(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        body = json.dumps(message).encode()
+        self.sock.sendall(_HEADER.pack(len(body)) + body)
+        (length,) = _HEADER.unpack(self._recv(_HEADER.size))
+        response = json.loads(self._recv(length))
+        if "error" in response:
+            raise EmbeddingServerError(response["error"])
+        return response
+
+    def _recv(self, size: int) -> bytes:
+        data = bytearray()
+        while len(data) < size:
+            chunk = self.sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("embedding server closed the connection")
+            data.extend(chunk)
+        return bytes(data)
+
+    def encode(self, texts: List[str], dim: int, priority: str) -> np.ndarray:
+        message = {"op": "encode", "texts": texts, "priority": priority}
+        needed = len(texts) * dim * 4
+        if self.shm is None or self.shm.size < needed:
+            self._release_segment()
+            size = max(_MIN_SEGMENT, 1 << (needed - 1).bit_length())
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            message["shm"] = self.shm.name
+        n = self.request(message)["n"]
+        # Copy out: the segment is reused by the next request
+        return np.ndarray((n, dim), dtype=np.float32, buffer=self.shm.buf).copy()
+
+    def _release_segment(self):
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def close(self):
+        self.sock.close()
+        self._release_segment()
+
+
+class RemoteBackend:
+    """Embedding backend that delegates encoding to the sidecar.
+
+    Same interface as TorchBackend/OnnxBackend. The tokenizer (for token
+    counting and case folding) is loaded locally from the copy the server
+    saves, which needs neither torch nor the model weights.
+    """
+
+    name = "remote"
+
+    def __init__(self, model_name: str, socket_path: str, autostart: bool = False, timeout: float = 60.0,
+                 start_timeout: float = 300.0):
+        self.socket_path = os.path.abspath(socket_path)
+        self.autostart = autostart
+        self.timeout = timeout
+        self.start_timeout = start_timeout
+        # Ingestion processes mark their requests as bulk so queries go first
+        self.priority = os.getenv("EMBEDDING_SERVER_PRIORITY", "interactive")
+        self._idle: "queue.SimpleQueue[_Connection]" = queue.SimpleQueue()
+        self._connections: List[_Connection] = []
+
+        info = self._call(lambda conn: conn.request({"op": "hello"}))
+        if info["model"] != model_name:
+            self.close()
+            raise EmbeddingServerError(
+                f"Embedding server at {self.socket_path} serves {info['model']}, but EMBEDDING_MODEL is {model_name}"
+            )
+        self.dim = info["dim"]
+        self.server_description = info["description"]
+        # The server's encoder decides what the vectors are
+        self.variant = info["variant"]
+        from transformers import AutoTokenizer
+        self.tokenizer = AutoTokenizer.from_pretrained(info["tokenizer_dir"])
+        atexit.register(self.close)
+
+    @property
+    def description(self) -> str:
+        return f"{self.server_description} via {self.socket_path}"
+
+    def _connect(self) -> _Connection:
+        try:
+            return _Connection(self.socket_path, self.timeout)
+        except (FileNotFoundError, ConnectionRefusedError):
+            if not self.autostart:
+                raise EmbeddingServerError(
+                    f"No embedding server on {self.socket_path}; start one with `python -m services.embedding_server`"
+                )
+        return self._start_server()
+
+    def _start_server(self) -> _Connection:
+        # POSIX only, like the autostart itself; importing it lazily keeps
+        # this module importable on Windows
+        import fcntl
+        # Workers starting together race here; the lock lets one of them
+        # spawn the server while the others wait for its socket
+        with open(self.socket_path + ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                return _Connection(self.socket_path, self.timeout)
+            except (FileNotFoundError, ConnectionRefusedError):
+                pass
+            print(f"Starting embedding server on {self.socket_path}")
+            env = dict(os.environ, EMBEDDING_SERVER_SOCKET=self.socket_path)
+            process = subprocess.Popen([sys.executable, "-m", "services.embedding_server"], cwd=BACKEND_DIR,
+                                       env=env, start_new_session=True)
+            deadline = time.monotonic() + self.start_timeout
+            while time.monotonic() < deadline:
+                if process.poll() is not None:
+                    raise EmbeddingServerError(f"Embedding server exited with status {process.returncode}")
+                try:
+                    return _Connection(self.socket_path, self.timeout)
+                except (FileNotFoundError, ConnectionRefusedError):
+                    time.sleep(0.2)
+            raise EmbeddingServerError(f"Embedding server did not start within {self.start_timeout:.0f}s")
+
+    def _call(self, fn):
+        """Runs `fn` on a pooled connection, reconnecting once if the server restarted."""
+        for attempt in range(2):
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._connect()
+                self._connections.append(conn)
+            reuse = False
+            try:
+                result = fn(conn)
+                reuse = True
+            except (ConnectionError, OSError) as e:
+                if attempt:
+                    raise EmbeddingServerError(f"Embedding server connection failed: {e!r}") from e
+                continue
+            finally:
+                if reuse:
+                    self._idle.put(conn)
+                else:
+                    # Any failure (including an error reply) retires the
+                    # connection and its shared memory segment
+                    conn.close()
+                    self._connections.remove(conn)
+            return result
+
+    def encode(self, texts: Union[str, List[str]]) -> np.ndarray:
+        single = isinstance(texts, str)
+        batch = [texts] if single else list(texts)
+        if not batch:
+            return np.empty((0, self.dim), dtype=np.float32)
+        vectors = self._call(lambda conn: conn.encode(batch, self.dim, self.priority))
+        return vectors[0] if single else vectors
+
+    def server_stats(self) -> Dict[str, Any]:
+        return self._call(lambda conn: conn.request({"op": "stats"}))
+
+    def close(self):
+        for conn in self._connections:
+            conn.close()
+        self._connections.clear()
+
+
+def main():
+    from dotenv import load_dotenv
+    load_dotenv()
+    from services.embedding_backends import load_embedding_backend
+
+    model_name = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+    # The backend is named explicitly: the server itself must not be a client
+    backend = load_embedding_backend(model_name, backend=os.getenv("EMBEDDING_BACKEND", "torch"))
+    server = EmbeddingServer(
+        backend,
+        model_name,
+        os.getenv("EMBEDDING_SERVER_SOCKET") or "./embedding.sock",
+        max_batch=int(os.getenv("EMBEDDING_SERVER_BATCH", "64")),
+        max_wait_ms=float(os.getenv("EMBEDDING_SERVER_WAIT_MS", "2")),
+    )
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,153 @@
-from sentence_transformers import SentenceTransformer
-import torch
 import numpy as np
-from typing import List
+from typing import List, Optional, Tuple
+import os
+import re
+import threading
+import time
+import unicodedata
+from services.cache import LRUCache
+from services.embedding_backends import load_embedding_backend
+from services.metrics import timed_stage
+
+_WHITESPACE_RUN = re.compile(r"\s+")
 
 class EmbeddingService:
     _instance = None
+    # The warm-up thread and a first request may race to load the model
+    _init_lock = threading.Lock()
 
     def __new__(cls, *args, **kwargs):
         if not cls._instance:
-            cls._instance = super(EmbeddingService, cls).__new__(cls)
-            cls._instance._initialized = False
+            with cls._init_lock:
+                if not cls._instance:
+                    instance = super(EmbeddingService, cls).__new__(cls)
+                    instance._initialized = False
+                    cls._instance = instance
         return cls._instance
 
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
+    def __init__(self, model_name: str = None):
         if self._initialized:
             return
-        # Use CPU for lightweight operations, but use GPU if available
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.model = SentenceTransformer(model_name, device=self.device)
+        with self._init_lock:
+            if not self._initialized:
+                self._load(model_name)
+
+    def _load(self, model_name: str = None):
+        started = time.perf_counter()
+        self.model_name = model_name or os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+        # torch (reference fp32) or onnx (optionally int8), per EMBEDDING_BACKEND
+        self.model = load_embedding_backend(self.model_name)
+        # Backend and quantization change the vectors too, so stored chunk
+        # embeddings and index configs are keyed on all three
+        self.model_key = f"{self.model_name}|{self.model.variant}"
+        # Uncased models (MiniLM) embed "VPN Policy" and "vpn policy" identically,
+        # so case can be folded out of the cache key for them.
+        self._lowercase = bool(getattr(self.model.tokenizer, "do_lower_case", False))
+        # Repeated queries are common; cache their vectors (as compact float32
+        # arrays) so a repeat skips the model forward pass entirely.
+        self.cache = LRUCache(
+            max_size=int(os.getenv("EMBEDDING_CACHE_SIZE", "4096")),
+            ttl=float(os.getenv("EMBEDDING_CACHE_TTL", "3600")),
+        )
         self._initialized = True
-        print(f"EmbeddingService initialized with model: {model_name} on {self.device}")
+        print(f"EmbeddingService initialized with model: {self.model_name} ({self.model.description}) in {time.perf_counter() - started:.2f}s")
+
+    def _normalize(self, text: str) -> str:
+        text = unicodedata.normalize("NFKC", text)
+        text = _WHITESPACE_RUN.sub(" ", text).strip()
+        return text.lower() if self._lowercase else text
+
+    def _cache_key(self, normalized: str):
+        return (self.model_name, normalized)
+
+    def _store(self, key, embedding: np.ndarray):
+        vector = np.asarray(embedding, dtype=np.float32)
+        vector.setflags(write=False)
+        self.cache.set(key, vector)
+
+    def lookup_cached(self, text: str) -> Optional[List[float]]:
+        """Returns the cached embedding for `text`, or None without encoding."""
+        cached = self.cache.get(self._cache_key(self._normalize(text)), count_miss=False)
+        return cached.tolist() if cached is not None else None
 
     def get_embeddings(self, text: str) -> List[float]:
         """Generate embedding for a single string."""
-        embedding = self.model.encode(text)
+        normalized = self._normalize(text)
+        key = self._cache_key(normalized)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached.tolist()
+        with timed_stage("embed_encode"):
+            embedding = self.model.encode(normalized)
+        self._store(key, embedding)
         return embedding.tolist()
 
-    def get_batch_embeddings(self, texts: List[str]) -> List[List[float]]:
-        """Generate embeddings for a list of strings."""
-        embeddings = self.model.encode(texts)
-        return embeddings.tolist()
+    def get_batch_embeddings(self, texts: List[str], use_cache: bool = True) -> List[List[float]]:
+        """Generate embeddings for a list of strings.
+
+        With `use_cache`, cached vectors are reused and only misses are encoded.
+        Bulk ingestion passes `use_cache=False` so document chunks do not evict
+        hot query vectors.
+        """
+        if not use_cache:
+            with timed_stage("embed_encode"):
+                return self.model.encode(texts).tolist()
+
+        normalized = [self._normalize(t) for t in texts]
+        results = [None] * len(texts)
+        missing = {}  # normalized text -> indices needing it
+        for i, n in enumerate(normalized):
+            cached = self.cache.get(self._cache_key(n))
+            if cached is not None:
+                results[i] = cached
+            else:
+                missing.setdefault(n, []).append(i)
+
+        if missing:
+            to_encode = list(missing)
+            with timed_stage("embed_encode"):
+                embeddings = self.model.encode(to_encode)
+            for n, embedding in zip(to_encode, embeddings):
+                self._store(self._cache_key(n), embedding)
+                for i in missing[n]:
+                    results[i] = embedding
+
+        return [np.asarray(r).tolist() for r in results]
+
+    @property
+    def chunk_store(self):
+        if getattr(self, "_chunk_store", None) is None:
+            from services.chunk_embedding_store import ChunkEmbeddingStore
+            self._chunk_store = ChunkEmbeddingStore()
+        return self._chunk_store
+
+    def get_chunk_embeddings(self, texts: List[str]) -> Tuple[List[List[float]], int]:
+        """Embeds document chunks through the persistent content-addressed store.
+
+        Only chunks whose exact text has not been embedded by this model and
+        backend before are encoded. Returns the embeddings and how many were
+        reused.
+        """
+        from services.chunk_embedding_store import ChunkEmbeddingStore
+        hashes = [ChunkEmbeddingStore.hash_text(t) for t in texts]
+        found = self.chunk_store.get_many(set(hashes), self.model_key)
+
+        missing = {}
+        for h, t in zip(hashes, texts):
+            if h not in found:
+                missing.setdefault(h, t)
+        if missing:
+            encoded = self.model.encode(list(missing.values()))
+            new = dict(zip(missing, encoded))
+            self.chunk_store.put_many(new.items(), self.model_key)
+            found.update(new)
+
+        reused = sum(1 for h in hashes if h not in missing)
+        return [np.asarray(found[h], dtype=np.float32).tolist() for h in hashes], reused
+
+    def cache_stats(self):
+        return {"model": self.model_name, **self.cache.stats()}
+
+    def count_tokens(self, text: str) -> int:
+        """Number of model tokens in `text`, excluding special tokens."""
+        return len(self.model.tokenizer(text, add_special_tokens=False)["input_ids"])
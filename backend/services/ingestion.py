@@ -0,0 +1,680 @@
+"""Durable document-ingestion queue.
+
+Jobs live in the `ingestion_jobs` table, so they survive restarts. A dispatcher
+thread in the API process claims pending jobs and runs extraction, chunking and
+embedding in a process pool (off the API process's GIL, at lower CPU priority).
+Worker processes stream embedded batches back over a queue; a collector thread
+writes them to the vector store and records progress, since Chroma's
+persistent client must only be written from a single process.
+
+Several API workers may share the table: a job is claimed with a
+conditional update and held under a lease the owner keeps renewing, so only
+jobs of a worker that died are ever taken over.
+"""
+import datetime
+import multiprocessing
+import os
+import queue
+import socket
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Optional
+
+import numpy as np
+from sqlalchemy import or_
+
+from db.session import SessionLocal
+from models.database import Document, IngestionJob, JobStatus
+from services.metrics import INGEST_CHUNKS, INGEST_CHUNKS_PER_SECOND, INGEST_PAGES, INGEST_PAGES_PER_SECOND, observe_stage, timed_stage
+
+# Size of the ingestion process pool (concurrent documents)
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "1"))
+# Attempts per job before it is marked failed; retries back off exponentially
+INGEST_MAX_ATTEMPTS = int(os.getenv("INGEST_MAX_ATTEMPTS", "3"))
+INGEST_RETRY_BACKOFF = float(os.getenv("INGEST_RETRY_BACKOFF", "10"))
+INGEST_POLL_INTERVAL = float(os.getenv("INGEST_POLL_INTERVAL", "2"))
+# A claimed job whose owner hasn't renewed it for this long is taken over
+INGEST_LEASE_SECONDS = float(os.getenv("INGEST_LEASE_SECONDS", "60"))
+# Niceness and embedding threads of pool processes, so ingestion yields to chat
+INGEST_NICE = int(os.getenv("INGEST_NICE", "10"))
+INGEST_TORCH_THREADS = int(os.getenv("INGEST_TORCH_THREADS", "2"))
+# Number of chunks embedded and written to the vector store at a time. Bounds
+# peak memory during ingestion and makes each batch searchable immediately.
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+# What a chunk's vector is computed from; part of the index config so vectors
+# of the old "Source: filename" text are picked up by a reindex
+EMBEDDED_TEXT = "content"
+
+
+def current_index_config() -> str:
+    """Signature of the settings that determine a document's chunks and vectors."""
+    from services.document_processor import get_document_processor
+    from services.embedding_service import EmbeddingService
+    p = get_document_processor()
+    # Model, backend and quantization
+    model = EmbeddingService().model_key
+    return f"{model}|{EMBEDDED_TEXT}|{p.chunk_mode}|{p.chunk_size}|{p.chunk_overlap}|{p.max_tokens}"
+
+
+# --- Pool-process side ------------------------------------------------------
+
+def _init_process():
+    try:
+        os.nice(INGEST_NICE)
+    except (AttributeError, OSError):
+        pass  # Not supported on this platform
+    if INGEST_TORCH_THREADS > 0:
+        # Read by the embedding backend (torch or onnx) when it loads
+        os.environ["EMBEDDING_THREADS"] = str(INGEST_TORCH_THREADS)
+    # With the shared embedding server, queries are served before our chunks
+    os.environ["EMBEDDING_SERVER_PRIORITY"] = "bulk"
+
+def _iter_batches(items, batch_size: int):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def run_ingestion(job_id: int, doc_id: int, file_path: str, filename: str, run_tag: str, results, cancelled):
+    """Extracts, chunks and embeds one document inside a pool process.
+
+    Every chunk is tagged with `run_tag`, so the previous version of the
+    document keeps serving until this run completes and replaces it.
+
+    Streams ("batch", ...) messages to `results` and always finishes with
+    exactly one of ("done", throughput), ("cancelled",) or ("error", message).
+    Throughput (pages, chunks, seconds) travels back in the message because
+    metrics recorded in a pool process would never reach /metrics.
+    """
+    started = time.perf_counter()
+    try:
+        from services.document_processor import get_document_processor
+        from services.embedding_service import EmbeddingService
+
+        processor = get_document_processor()
+        embedding_service = EmbeddingService()
+
+        # Streaming pipeline: pages -> chunks -> fixed-size embedding batches.
+        # Nothing holds more than one batch worth of chunks.
+        total_pages = max(processor.count_pages(file_path), 1)
+        # In token mode chunks are sized with the embedding model's own
+        # tokenizer so nothing is truncated at embed time.
+        token_counter = embedding_service.count_tokens if processor.chunk_mode == "tokens" else None
+        chunks = processor.iter_chunks(processor.iter_pages(file_path), token_counter=token_counter)
+
+        total_chunks = reused_chunks = 0
+        for batch in _iter_batches(chunks, EMBED_BATCH_SIZE):
+            if cancelled.get(job_id):
+                results.put(("cancelled", job_id))
+                return
+            # Prepend filename to each stored chunk for better LLM context recognition
+            vector_chunks = [f"Source: {filename}\nContent: {c['content']}" for c in batch]
+            metadatas = [
+                {
+                    "document_id": str(doc_id), "pages": str(c['pages']), "filename": filename, "ingest_run": run_tag,
+                    # Character offsets let context assembly merge neighbouring chunks
+                    "start": c['start'], "end": c['end'],
+                }
+                for c in batch
+            ]
+            # Vectors are of the chunk content alone (the filename is in the
+            # metadata), so unchanged chunks reuse their stored vectors even
+            # when re-uploaded under another name.
+            embeddings, reused = embedding_service.get_chunk_embeddings([c['content'] for c in batch])
+            total_chunks += len(batch)
+            reused_chunks += reused
+
+            last_page = max((pg for c in batch for pg in c['pages']), default=0)
+            progress = min(100.0 * last_page / total_pages, 99.0)
+            # float32 halves the pickling cost of shipping vectors to the API process
+            results.put(("batch", job_id, vector_chunks, metadatas, np.asarray(embeddings, dtype=np.float32), progress))
+
+        print(f"Document {doc_id}: {total_chunks} chunks, {reused_chunks} embeddings reused from cache")
+        throughput = {"pages": total_pages, "chunks": total_chunks, "seconds": time.perf_counter() - started}
+        results.put(("done", job_id, throughput))
+    except Exception as e:
+        traceback.print_exc()
+        results.put(("error", job_id, f"{type(e).__name__}: {e}"))
+
+
+# --- API-process side -------------------------------------------------------
+
+def _record_throughput(throughput: Dict[str, float]):
+    seconds = throughput["seconds"]
+    observe_stage("ingest_document", seconds)
+    INGEST_PAGES.inc(throughput["pages"])
+    INGEST_CHUNKS.inc(throughput["chunks"])
+    if seconds > 0:
+        INGEST_PAGES_PER_SECOND.observe(throughput["pages"] / seconds)
+        INGEST_CHUNKS_PER_SECOND.observe(throughput["chunks"] / seconds)
+
+class IngestionWorker:
+    def __init__(self, workers: int = INGEST_WORKERS):
+        self.workers = workers
+        # Identifies this worker's claims in the jobs table
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._ctx = None
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._manager = None
+        self._results = None
+        self._cancelled = None         # Shared dict: job_id -> True, polled by pool processes
+        self._active: Dict[int, Dict[str, Any]] = {}  # job_id -> future, doc_id, target, run_tag
+        self._cancel_requested = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+        self._vector_service = None
+        self.batches_written = 0
+        self.last_rebuild: Optional[Dict[str, Any]] = None  # Outcome of the latest full reindex
+
+    @property
+    def vector_service(self):
+        if self._vector_service is None:
+            from services.vector_service import get_vector_service
+            self._vector_service = get_vector_service()
+        return self._vector_service
+
+    def start(self):
+        if self._pool is not None:
+            return
+        self._recover()
+        # spawn, not fork: torch and the SQLAlchemy pool don't survive fork
+        self._ctx = multiprocessing.get_context("spawn")
+        self._manager = self._ctx.Manager()
+        self._results = self._manager.Queue()
+        self._cancelled = self._manager.dict()
+        self._pool = self._new_pool()
+        self._stopping.clear()
+        self._threads = [
+            threading.Thread(target=self._dispatch_loop, name="ingest-dispatch", daemon=True),
+            threading.Thread(target=self._collect_loop, name="ingest-collect", daemon=True),
+        ]
+        for t in self._threads:
+            t.start()
+        print(f"IngestionWorker started with {self.workers} process(es)")
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=self._ctx, initializer=_init_process)
+
+    def _restart_pool(self, broken: ProcessPoolExecutor):
+        """Replaces a pool left unusable by a dead process (OOM kill, segfault).
+
+        Its in-flight futures fail with BrokenProcessPool, so those jobs go
+        through the normal retry path.
+        """
+        with self._lock:
+            if self._pool is not broken or self._stopping.is_set():
+                return
+            print("IngestionWorker: a pool process died; starting a new pool")
+            self._pool = self._new_pool()
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def stop(self):
+        """Stops dispatching and interrupts running jobs at their next batch.
+
+        Interrupted jobs go back to PENDING and are picked up again by the
+        next start() (or by another worker).
+        """
+        if self._pool is None:
+            return
+        self._stopping.set()
+        self._wake.set()
+        with self._lock:
+            for job_id in self._active:
+                self._cancelled[job_id] = True
+            job_ids = list(self._active)
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        for t in self._threads:
+            t.join(timeout=5)
+        self._manager.shutdown()
+        self._pool = None
+        self._cancelled = None
+        self._active.clear()
+        if job_ids:
+            db = SessionLocal()
+            try:
+                db.query(IngestionJob).filter(
+                    IngestionJob.id.in_(job_ids),
+                    IngestionJob.owner == self.owner,
+                    IngestionJob.status == JobStatus.RUNNING,
+                ).update({
+                    IngestionJob.status: JobStatus.PENDING,
+                    IngestionJob.owner: None,
+                    IngestionJob.lease_expires_at: None,
+                    IngestionJob.available_at: datetime.datetime.utcnow(),
+                }, synchronize_session=False)
+                db.commit()
+            finally:
+                db.close()
+
+    def _lease_deadline(self) -> datetime.datetime:
+        return datetime.datetime.utcnow() + datetime.timedelta(seconds=INGEST_LEASE_SECONDS)
+
+    def _recover(self):
+        """Re-queues running jobs whose owner stopped renewing its lease.
+
+        Jobs of live workers (including ones in other processes) are left
+        alone; rows from before leases existed have none and are re-queued.
+        """
+        db = SessionLocal()
+        try:
+            now = datetime.datetime.utcnow()
+            expired = db.query(IngestionJob).filter(
+                IngestionJob.status == JobStatus.RUNNING,
+                or_(IngestionJob.lease_expires_at.is_(None), IngestionJob.lease_expires_at < now),
+            )
+            # A cancel its owner never got to act on still counts
+            for job in expired.filter(IngestionJob.cancel_requested.is_(True)).all():
+                self._mark_cancelled(db, job)
+            n = expired.update({
+                IngestionJob.status: JobStatus.PENDING,
+                IngestionJob.owner: None,
+                IngestionJob.lease_expires_at: None,
+                IngestionJob.available_at: now,
+            }, synchronize_session=False)
+            db.commit()
+            if n:
+                print(f"IngestionWorker: resuming {n} interrupted job(s)")
+        finally:
+            db.close()
+
+    def _renew_leases(self):
+        with self._lock:
+            job_ids = list(self._active)
+        if not job_ids:
+            return
+        db = SessionLocal()
+        try:
+            owned = db.query(IngestionJob).filter(IngestionJob.id.in_(job_ids), IngestionJob.owner == self.owner)
+            owned.update({IngestionJob.lease_expires_at: self._lease_deadline()}, synchronize_session=False)
+            db.commit()
+            # Cancels requested through another worker
+            cancelled = [job_id for (job_id,) in owned.filter(IngestionJob.cancel_requested.is_(True))
+                         .with_entities(IngestionJob.id)]
+        finally:
+            db.close()
+        if cancelled:
+            with self._lock:
+                for job_id in cancelled:
+                    if job_id in self._active and self._cancelled is not None:
+                        self._cancel_requested.add(job_id)
+                        self._cancelled[job_id] = True
+
+    # Public API (called from request handlers with their own session)
+
+    def enqueue(self, db, doc_id: int, file_path: str, target_collection: Optional[str] = None) -> IngestionJob:
+        """Creates a pending job for a document unless one is already active.
+
+        With `target_collection` the document is written only to that
+        collection (a full reindex being built) instead of the live one.
+        In-place jobs write only to the live collection, so while a full
+        reindex is building the document also gets a job for the new one.
+        """
+        building = self.vector_service.building_collection_name
+        if target_collection is None and building:
+            self._enqueue_one(db, doc_id, file_path, building)
+        return self._enqueue_one(db, doc_id, file_path, target_collection)
+
+    def _enqueue_one(self, db, doc_id: int, file_path: str, target_collection: Optional[str]) -> IngestionJob:
+        # One active job per document and destination collection
+        job = db.query(IngestionJob).filter(
+            IngestionJob.document_id == doc_id,
+            IngestionJob.target_collection.is_(None) if target_collection is None
+            else IngestionJob.target_collection == target_collection,
+            IngestionJob.status.in_([JobStatus.PENDING, JobStatus.RUNNING]),
+        ).first()
+        if job is None:
+            job = IngestionJob(
+                document_id=doc_id,
+                file_path=file_path,
+                target_collection=target_collection,
+                max_attempts=INGEST_MAX_ATTEMPTS,
+            )
+            db.add(job)
+            doc = db.query(Document).filter(Document.id == doc_id).first()
+            if doc:
+                doc.processed = 0
+            db.commit()
+            db.refresh(job)
+        self._wake.set()
+        return job
+
+    def cancel(self, db, job: IngestionJob, check_rebuild: bool = True) -> IngestionJob:
+        if job.status == JobStatus.PENDING:
+            self._mark_cancelled(db, job)
+            building = self.vector_service.building_collection_name
+            if check_rebuild and building:
+                self._maybe_promote(db, building)
+        elif job.status == JobStatus.RUNNING:
+            # The pool process stops at its next batch boundary and the
+            # collector finalizes the job when it acknowledges. A job owned
+            # by another worker is cancelled by that worker, which sees the
+            # flag when it next renews the lease.
+            job.cancel_requested = True
+            db.commit()
+            if job.owner == self.owner:
+                with self._lock:
+                    self._cancel_requested.add(job.id)
+                    if self._cancelled is not None:
+                        self._cancelled[job.id] = True
+        return job
+
+    def cancel_document(self, db, doc_id: int):
+        """Cancels any pending or running job for a document (e.g. on delete).
+
+        Does not settle a full reindex: the caller deletes the document and
+        then calls check_rebuild, so the cancelled job isn't counted as a
+        failure.
+        """
+        jobs = db.query(IngestionJob).filter(
+            IngestionJob.document_id == doc_id,
+            IngestionJob.status.in_([JobStatus.PENDING, JobStatus.RUNNING]),
+        ).all()
+        for job in jobs:
+            self.cancel(db, job, check_rebuild=False)
+
+    def stats(self) -> Dict[str, Any]:
+        db = SessionLocal()
+        try:
+            counts = {s.value: 0 for s in JobStatus}
+            from sqlalchemy import func
+            for status, n in db.query(IngestionJob.status, func.count()).group_by(IngestionJob.status):
+                counts[status.value] = n
+        finally:
+            db.close()
+        return {
+            "workers": self.workers,
+            "owner": self.owner,
+            "active": len(self._active),
+            "batches_written": self.batches_written,
+            "rebuild": self.last_rebuild,
+            "jobs": counts,
+        }
+
+    # Dispatcher
+
+    def _dispatch_loop(self):
+        while not self._stopping.is_set():
+            try:
+                # Poll interval is well under the lease, so our claims never lapse
+                self._renew_leases()
+                self._recover()
+                self._dispatch()
+            except Exception as e:
+                print(f"IngestionWorker dispatch error: {e}")
+            self._wake.wait(INGEST_POLL_INTERVAL)
+            self._wake.clear()
+
+    def _dispatch(self):
+        free = self.workers - len(self._active)
+        if free <= 0:
+            return
+        db = SessionLocal()
+        try:
+            now = datetime.datetime.utcnow()
+            unclaimed = or_(IngestionJob.owner.is_(None), IngestionJob.lease_expires_at < now)
+            jobs = db.query(IngestionJob).filter(
+                IngestionJob.status == JobStatus.PENDING,
+                IngestionJob.available_at <= now,
+                unclaimed,
+            ).order_by(IngestionJob.id).limit(free).all()
+            for job in jobs:
+                doc = db.query(Document).filter(Document.id == job.document_id).first()
+                if doc is None:
+                    job.status = JobStatus.CANCELLED
+                    job.finished_at = now
+                    db.commit()
+                    continue
+                # Claim: of several workers that selected this job, exactly
+                # one conditional update matches
+                claimed = db.query(IngestionJob).filter(
+                    IngestionJob.id == job.id, IngestionJob.status == JobStatus.PENDING, unclaimed,
+                ).update(
+                    {IngestionJob.owner: self.owner, IngestionJob.lease_expires_at: self._lease_deadline()},
+                    synchronize_session=False,
+                )
+                db.commit()
+                if claimed != 1:
+                    continue
+
+                job_id, attempts = job.id, (job.attempts or 0) + 1
+                run_tag = f"{job_id}.{attempts}"
+                pool = self._pool
+                try:
+                    # Registered before the process can report, under the
+                    # lock the collector takes to look jobs up
+                    with self._lock:
+                        future = pool.submit(
+                            run_ingestion, job_id, doc.id, job.file_path, doc.filename, run_tag,
+                            self._results, self._cancelled,
+                        )
+                        self._active[job_id] = {
+                            "future": future,
+                            "doc_id": doc.id,
+                            # In-place jobs write only to the collection serving
+                            # now; promotion waits for them, so it can't change
+                            "target": job.target_collection or self.vector_service.active_collection_name,
+                            "run_tag": run_tag,
+                        }
+                except RuntimeError as e:  # BrokenProcessPool, or shut down by stop()
+                    db.query(IngestionJob).filter(
+                        IngestionJob.id == job_id, IngestionJob.owner == self.owner,
+                    ).update({IngestionJob.owner: None, IngestionJob.lease_expires_at: None}, synchronize_session=False)
+                    db.commit()
+                    if isinstance(e, BrokenProcessPool):
+                        self._restart_pool(pool)
+                    return
+
+                # RUNNING only once a pool process has the job
+                started = db.query(IngestionJob).filter(
+                    IngestionJob.id == job_id, IngestionJob.status == JobStatus.PENDING,
+                    IngestionJob.owner == self.owner,
+                ).update({
+                    IngestionJob.status: JobStatus.RUNNING,
+                    IngestionJob.attempts: attempts,
+                    IngestionJob.progress: 0.0,
+                    IngestionJob.error: None,
+                    IngestionJob.started_at: now,
+                }, synchronize_session=False)
+                if started:
+                    doc.processed = 0
+                db.commit()
+                if not started:
+                    # Cancelled between the claim and the submit
+                    with self._lock:
+                        self._cancel_requested.add(job_id)
+                        self._cancelled[job_id] = True
+                future.add_done_callback(lambda f, job_id=job_id, pool=pool: self._on_future_done(job_id, f, pool))
+        finally:
+            db.close()
+
+    def _on_future_done(self, job_id: int, future, pool: ProcessPoolExecutor):
+        # run_ingestion reports its own outcome; only a crashed process
+        # (or an unpicklable task) surfaces here.
+        if future.cancelled() or self._stopping.is_set():
+            return
+        exc = future.exception()
+        if exc is not None:
+            if isinstance(exc, BrokenProcessPool):
+                self._restart_pool(pool)
+            self._results.put(("error", job_id, f"Worker process failed: {exc}"))
+
+    # Collector
+
+    def _collect_loop(self):
+        while not self._stopping.is_set():
+            try:
+                msg = self._results.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+            if self._stopping.is_set():
+                break
+            try:
+                self._handle(msg)
+            except Exception as e:
+                print(f"IngestionWorker: error handling {msg[0]} for job {msg[1]}: {e}")
+
+    def _handle(self, msg):
+        kind, job_id = msg[0], msg[1]
+        with self._lock:
+            active = self._active.get(job_id)
+            cancel_requested = job_id in self._cancel_requested
+        if active is None:
+            return
+        doc_id, target, run_tag = str(active["doc_id"]), active["target"], active["run_tag"]
+
+        if kind == "batch":
+            if cancel_requested:
+                return
+            _, _, chunks, metadatas, embeddings, progress = msg
+            with timed_stage("ingest_vector_add"):
+                self.vector_service.add_chunks(chunks, metadatas, embeddings=embeddings.tolist(), collection_name=target)
+            self.batches_written += 1
+            self._update(job_id, progress=progress)
+            return
+
+        db = SessionLocal()
+        try:
+            job = db.query(IngestionJob).filter(IngestionJob.id == job_id).first()
+            if job is None or job.owner != self.owner:
+                # Deleted, or taken over after our lease lapsed: this run's
+                # chunks are not the document's
+                self.vector_service.delete_by_document(doc_id, only_run=run_tag, collection_name=target)
+            elif kind == "cancelled" or cancel_requested:
+                self.vector_service.delete_by_document(doc_id, only_run=run_tag, collection_name=target)
+                self._mark_cancelled(db, job)
+            elif kind == "done":
+                # Swap the document to this run's chunks in one delete
+                self.vector_service.delete_by_document(doc_id, keep_run=run_tag, collection_name=target)
+                job.status = JobStatus.COMPLETED
+                job.progress = 100.0
+                job.finished_at = datetime.datetime.utcnow()
+                if job.document:
+                    job.document.processed = 1
+                    if not job.target_collection:
+                        # A rebuilt document's config is recorded on promotion
+                        job.document.index_config = current_index_config()
+                db.commit()
+                _record_throughput(msg[2])
+            elif kind == "error":
+                print(f"Error processing document {job.document_id} (job {job.id}, attempt {job.attempts}): {msg[2]}")
+                # Drop this run's partial chunks; any previous version keeps serving
+                self.vector_service.delete_by_document(doc_id, only_run=run_tag, collection_name=target)
+                self._handle_error(db, job, msg[2])
+            building = self.vector_service.building_collection_name
+            if building:
+                self._maybe_promote(db, building)
+            self.vector_service.flush_lexical()
+        finally:
+            db.close()
+            with self._lock:
+                self._active.pop(job_id, None)
+                self._cancel_requested.discard(job_id)
+                if self._cancelled is not None:
+                    self._cancelled.pop(job_id, None)
+            self._wake.set()
+
+    def _handle_error(self, db, job: IngestionJob, error: str):
+        job.error = error
+        if job.attempts < job.max_attempts:
+            delay = INGEST_RETRY_BACKOFF * (2 ** (job.attempts - 1))
+            job.status = JobStatus.PENDING
+            job.owner = None
+            job.lease_expires_at = None
+            job.available_at = datetime.datetime.utcnow() + datetime.timedelta(seconds=delay)
+        else:
+            job.status = JobStatus.FAILED
+            job.finished_at = datetime.datetime.utcnow()
+            self._settle_document(job)
+        db.commit()
+
+    def _mark_cancelled(self, db, job: IngestionJob):
+        job.status = JobStatus.CANCELLED
+        job.finished_at = datetime.datetime.utcnow()
+        self._settle_document(job)
+        db.commit()
+
+    def _settle_document(self, job: IngestionJob):
+        """Document state after a job ends without completing."""
+        doc = job.document
+        if doc is None:
+            return
+        # The previous version keeps serving (a failed rebuild job means the
+        # rebuild is not promoted); a document never indexed has nothing to serve.
+        doc.processed = 1 if doc.index_config else -1
+
+    def check_rebuild(self, db, target: str) -> Dict[str, Any]:
+        """Settles a full reindex once none of its jobs are outstanding.
+
+        Returns its state: "building", "promoted", or "abandoned" with the
+        documents whose rebuild job did not complete.
+        """
+        return self._maybe_promote(db, target)
+
+    def _maybe_promote(self, db, target: str) -> Dict[str, Any]:
+        if self.vector_service.building_collection_name != target:
+            if self.last_rebuild and self.last_rebuild["collection"] == target:
+                return self.last_rebuild
+            return {"collection": target, "state": "unknown"}
+        rebuild_jobs = db.query(IngestionJob).filter(IngestionJob.target_collection == target)
+        outstanding = rebuild_jobs.filter(IngestionJob.status.in_([JobStatus.PENDING, JobStatus.RUNNING])).count()
+        # In-place jobs write only to the live collection (their document
+        # has a rebuild job of its own); promoting mid-run would split them.
+        in_place = db.query(IngestionJob).filter(
+            IngestionJob.target_collection.is_(None),
+            IngestionJob.status.in_([JobStatus.PENDING, JobStatus.RUNNING]),
+        ).count()
+        if outstanding or in_place:
+            return {"collection": target, "state": "building", "outstanding": outstanding, "in_place": in_place}
+
+        # Documents (still existing) none of whose rebuild jobs completed
+        completed = {d for (d,) in rebuild_jobs.filter(IngestionJob.status == JobStatus.COMPLETED)
+                     .with_entities(IngestionJob.document_id)}
+        failed = sorted({
+            d for (d,) in rebuild_jobs.join(Document, Document.id == IngestionJob.document_id)
+            .filter(IngestionJob.status != JobStatus.COMPLETED).with_entities(IngestionJob.document_id)
+        } - completed)
+        if failed:
+            # The new collection is missing these documents: keep serving the
+            # old one, which still has every document
+            print(f"IngestionWorker: rebuild of {target} abandoned, {len(failed)} document(s) failed: {failed}")
+            self.vector_service.abandon_rebuild(target)
+            self.last_rebuild = {"collection": target, "state": "abandoned", "failed_documents": failed}
+            return self.last_rebuild
+
+        if completed:
+            db.query(Document).filter(Document.id.in_(completed)).update(
+                {Document.processed: 1, Document.index_config: current_index_config()}, synchronize_session=False,
+            )
+            db.commit()
+        self.vector_service.promote(target)
+        self.last_rebuild = {"collection": target, "state": "promoted", "documents": len(completed)}
+        return self.last_rebuild
+
+    def _update(self, job_id: int, **fields):
+        db = SessionLocal()
+        try:
+            db.query(IngestionJob).filter(IngestionJob.id == job_id).update(fields, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+
+_worker: Optional[IngestionWorker] = None
+
+def get_ingestion_worker() -> IngestionWorker:
+    global _worker
+    if _worker is None:
+        _worker = IngestionWorker()
+    return _worker
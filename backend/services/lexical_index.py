@@ -0,0 +1,239 @@
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+import math
+import os
+import pickle
+import re
+import threading
+
+import numpy as np
+
+# Keeps identifiers such as part numbers ("ABC-123"), versions ("v2.1") and
+# error codes ("E4021") intact as single tokens.
+_TOKEN = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+_STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have how i if in into is it its of on or "
+    "that the their there these this to was were what when where which who why will with "
+    "you your source content".split()
+)
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for tok in _TOKEN.findall(text.lower()):
+        if tok in _STOPWORDS:
+            continue
+        tokens.append(tok)
+        # Also index the parts of compound identifiers ("abc-123" -> "abc", "123")
+        if not tok.isalnum():
+            tokens.extend(p for p in re.split(r"[-_./]", tok) if p and p not in _STOPWORDS)
+    return tokens
+
+
+class BM25Index:
+    """In-process inverted index with Okapi BM25 scoring.
+
+    Postings are compact `array` buffers scored with NumPy, so a query costs
+    time proportional to the postings of its (non-stopword) terms rather than
+    to corpus size. Deletes are tombstones; postings are compacted once enough
+    of the index is dead. Persisted to a single pickle file.
+    """
+
+    def __init__(self, path: Optional[str] = None, k1: float = 1.5, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._save_lock = threading.Lock()  # One writer of the index file at a time
+        self._reset()
+        self.dirty = False
+        self.ready = True  # False while being rebuilt from the vector store
+
+    def _reset(self):
+        self._ids: List[Optional[str]] = []          # internal int -> chunk id
+        self._id_to_int: Dict[str, int] = {}
+        self._doc_len = array("I")
+        self._alive = bytearray()
+        self._postings: Dict[str, Tuple[array, array]] = {}  # term -> (internal ints, tfs)
+        self._n_alive = 0
+        self._total_len = 0
+
+    def __len__(self) -> int:
+        return self._n_alive
+
+    # Maintenance
+
+    def add(self, ids: Iterable[str], texts: Iterable[str]):
+        with self._lock:
+            for chunk_id, text in zip(ids, texts):
+                if chunk_id in self._id_to_int:
+                    continue
+                internal = len(self._ids)
+                tokens = tokenize(text)
+                counts: Dict[str, int] = {}
+                for tok in tokens:
+                    counts[tok] = counts.get(tok, 0) + 1
+                for term, tf in counts.items():
+                    postings = self._postings.get(term)
+                    if postings is None:
+                        postings = self._postings[term] = (array("I"), array("H"))
+                    postings[0].append(internal)
+                    postings[1].append(min(tf, 65535))
+                self._ids.append(chunk_id)
+                self._id_to_int[chunk_id] = internal
+                self._doc_len.append(len(tokens))
+                self._alive.append(1)
+                self._n_alive += 1
+                self._total_len += len(tokens)
+            self.dirty = True
+
+    def delete(self, ids: Iterable[str]):
+        with self._lock:
+            for chunk_id in ids:
+                internal = self._id_to_int.pop(chunk_id, None)
+                if internal is None or not self._alive[internal]:
+                    continue
+                self._alive[internal] = 0
+                self._ids[internal] = None
+                self._n_alive -= 1
+                self._total_len -= self._doc_len[internal]
+            self.dirty = True
+            if len(self._ids) > 1000 and self._n_alive < 0.8 * len(self._ids):
+                self._compact()
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+            self.dirty = True
+
+    def _compact(self):
+        """Rebuilds postings without tombstoned chunks, renumbering survivors."""
+        remap = np.full(len(self._ids), -1, dtype=np.int64)
+        alive = np.frombuffer(bytes(self._alive), dtype=np.uint8).astype(bool)
+        remap[alive] = np.arange(int(alive.sum()))
+
+        postings = {}
+        for term, (docs, tfs) in self._postings.items():
+            d = remap[np.frombuffer(docs, dtype=np.uint32)]
+            keep = d >= 0
+            if keep.any():
+                postings[term] = (
+                    array("I", d[keep].astype(np.uint32).tobytes()),
+                    array("H", np.frombuffer(tfs, dtype=np.uint16)[keep].tobytes()),
+                )
+
+        ids = [i for i in self._ids if i is not None]
+        doc_len = np.frombuffer(self._doc_len, dtype=np.uint32)[alive]
+        self._ids = ids
+        self._id_to_int = {chunk_id: n for n, chunk_id in enumerate(ids)}
+        self._doc_len = array("I", doc_len.tobytes())
+        self._alive = bytearray(b"\x01" * len(ids))
+        self._postings = postings
+
+    # Query
+
+    def search(self, query: str, k: int = 20) -> List[Tuple[str, float]]:
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        with self._lock:
+            # The NumPy views over the postings buffers must be released before
+            # the lock is, or a concurrent append could not resize them.
+            return self._search_locked(terms, k)
+
+    def _search_locked(self, terms, k: int) -> List[Tuple[str, float]]:
+        n = self._n_alive
+        if not n:
+            return []
+        avgdl = self._total_len / n
+        doc_len = np.frombuffer(self._doc_len, dtype=np.uint32)
+        alive = np.frombuffer(self._alive, dtype=np.uint8)
+
+        all_docs, all_scores = [], []
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            docs = np.frombuffer(postings[0], dtype=np.uint32)
+            tfs = np.frombuffer(postings[1], dtype=np.uint16)
+            # Tombstoned chunks stay in the postings until compaction; they
+            # must not count towards the term's document frequency
+            live = alive[docs].astype(bool)
+            docs, tfs = docs[live], tfs[live].astype(np.float32)
+            df = len(docs)
+            if not df:
+                continue
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * doc_len[docs] / avgdl)
+            all_docs.append(docs)
+            all_scores.append(idf * tfs * (self.k1 + 1) / (tfs + norm))
+        if not all_docs:
+            return []
+
+        docs = np.concatenate(all_docs)
+        scores = np.concatenate(all_scores)
+        if len(all_docs) > 1:
+            docs, inverse = np.unique(docs, return_inverse=True)
+            scores = np.bincount(inverse, weights=scores)
+        if len(docs) > k:
+            top = np.argpartition(-scores, k)[:k]
+            docs, scores = docs[top], scores[top]
+        order = np.argsort(-scores)
+        return [(self._ids[int(docs[i])], float(scores[i])) for i in order]
+
+    # Persistence
+
+    def save(self):
+        if not self.path:
+            return
+        with self._save_lock:
+            # Copy under the lock (memcpy of the buffers), pickle outside it,
+            # so searches and ingestion aren't blocked for the whole write
+            with self._lock:
+                state = {
+                    "ids": list(self._ids),
+                    "doc_len": array("I", self._doc_len),
+                    "alive": bytes(self._alive),
+                    "postings": {term: (array("I", docs), array("H", tfs)) for term, (docs, tfs) in self._postings.items()},
+                    "n_alive": self._n_alive,
+                    "total_len": self._total_len,
+                }
+                self.dirty = False
+            try:
+                tmp_path = self.path + ".tmp"
+                with open(tmp_path, "wb") as f:
+                    pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, self.path)
+            except Exception:
+                self.dirty = True
+                raise
+
+    def load(self) -> bool:
+        if not self.path or not os.path.exists(self.path):
+            return False
+        with open(self.path, "rb") as f:
+            state = pickle.load(f)
+        with self._lock:
+            self._ids = state["ids"]
+            self._id_to_int = {chunk_id: n for n, chunk_id in enumerate(self._ids) if chunk_id is not None}
+            self._doc_len = state["doc_len"]
+            self._alive = bytearray(state["alive"])
+            self._postings = state["postings"]
+            self._n_alive = state["n_alive"]
+            self._total_len = state["total_len"]
+            self.dirty = False
+        return True
+
+    def delete_file(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def reciprocal_rank_fusion(rankings: List[Tuple[List[str], float]], k: int = 60) -> List[Tuple[str, float]]:
+    """Fuses ranked id lists, each with a weight, by weighted reciprocal rank."""
+    scores: Dict[str, float] = {}
+    for ids, weight in rankings:
+        if weight <= 0:
+            continue
+        for rank, chunk_id in enumerate(ids):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + weight / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
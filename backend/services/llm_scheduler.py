@@ -0,0 +1,196 @@
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Hashable, Optional
+
+class AdmissionRejected(Exception):
+    """The request could not be served within the queue deadline."""
+
+    def __init__(self, estimated_wait: float):
+        self.estimated_wait = estimated_wait
+        self.retry_after = max(1, math.ceil(estimated_wait))
+        super().__init__(f"LLM queue wait of {estimated_wait:.0f}s exceeds the deadline")
+
+
+class Ticket:
+    def __init__(self, user_id: Hashable):
+        self.user_id = user_id
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.enqueued_at = time.monotonic()
+        self.granted_at: Optional[float] = None
+        self.released = False
+
+    @property
+    def granted(self) -> bool:
+        return self.granted_at is not None
+
+
+class LLMScheduler:
+    """Admission control and fair-share scheduling in front of the LLM.
+
+    Generation slots are limited by a token bucket (the provider's rate
+    limit) and a concurrency cap. Waiting requests are queued per user and
+    served round-robin across users, so one user's burst can't starve
+    everyone else. `check_admission` rejects requests whose estimated wait
+    exceeds the deadline before any retrieval work is spent on them.
+    """
+
+    def __init__(self, rate_per_minute: float, burst: int, max_concurrency: int, deadline: float):
+        self.rate = rate_per_minute / 60.0  # tokens/sec; 0 disables rate limiting
+        self.capacity = max(burst, 1)
+        self.tokens = float(self.capacity)
+        # At least one slot: with none nothing could be served (and the wait
+        # estimate would divide by zero)
+        self.max_concurrency = max(max_concurrency, 1)
+        self.deadline = deadline
+        self.active = 0
+        self._queues: "OrderedDict[Hashable, Deque[Ticket]]" = OrderedDict()  # Round-robin order
+        self._updated = time.monotonic()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # Moving average of how long a generation holds its slot
+        self._avg_service = float(os.getenv("LLM_EXPECTED_GENERATION_SECONDS", "10"))
+        self.admitted = 0
+        self.rejected = 0
+        self.granted = 0
+        self.total_wait = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate:
+            self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _ahead(self, user_id: Hashable, index: int) -> int:
+        """Requests served before the `index`-th (0-based) queued request of a user.
+
+        Under round-robin, every other user gets at most `index + 1` turns
+        before it.
+        """
+        turns = index + 1
+        return index + sum(min(len(q), turns) for uid, q in self._queues.items() if uid != user_id)
+
+    def _estimate(self, ahead: int) -> float:
+        self._refill()
+        rate_wait = max(0.0, ahead + 1 - self.tokens) / self.rate if self.rate else 0.0
+        free = self.max_concurrency - self.active
+        if ahead < free:
+            slot_wait = 0.0
+        else:
+            slot_wait = ((ahead - free) // self.max_concurrency + 1) * self._avg_service
+        return max(rate_wait, slot_wait)
+
+    def estimate_wait(self, user_id: Hashable) -> float:
+        queued = len(self._queues.get(user_id, ()))
+        return self._estimate(self._ahead(user_id, queued))
+
+    def check_admission(self, user_id: Hashable):
+        wait = self.estimate_wait(user_id)
+        if wait > self.deadline:
+            self.rejected += 1
+            raise AdmissionRejected(wait)
+
+    def enqueue(self, user_id: Hashable) -> Ticket:
+        ticket = Ticket(user_id)
+        self._queues.setdefault(user_id, deque()).append(ticket)
+        self.admitted += 1
+        self._dispatch()
+        return ticket
+
+    def position(self, ticket: Ticket) -> int:
+        """1-based queue position, or 0 once granted."""
+        if ticket.granted:
+            return 0
+        queue = self._queues.get(ticket.user_id)
+        if not queue or ticket not in queue:
+            return 0
+        return self._ahead(ticket.user_id, queue.index(ticket)) + 1
+
+    async def wait(self, ticket: Ticket, timeout: float) -> bool:
+        """Waits up to `timeout` seconds for the ticket to be granted."""
+        if ticket.granted:
+            return True
+        try:
+            await asyncio.wait_for(asyncio.shield(ticket.future), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return ticket.granted
+
+    def release(self, ticket: Ticket):
+        if ticket.released:
+            return
+        ticket.released = True
+        if ticket.granted:
+            self.active -= 1
+            held = time.monotonic() - ticket.granted_at
+            self._avg_service = 0.8 * self._avg_service + 0.2 * held
+        else:
+            queue = self._queues.get(ticket.user_id)
+            if queue and ticket in queue:
+                queue.remove(ticket)
+                if not queue:
+                    del self._queues[ticket.user_id]
+            if not ticket.future.done():
+                ticket.future.cancel()
+        self._dispatch()
+
+    def _dispatch(self):
+        self._refill()
+        while self._queues and self.active < self.max_concurrency:
+            if self.rate and self.tokens < 1:
+                # Come back when the bucket has a token again
+                if self._timer is None:
+                    delay = (1 - self.tokens) / self.rate
+                    self._timer = asyncio.get_running_loop().call_later(delay, self._on_timer)
+                return
+            user_id, queue = next(iter(self._queues.items()))
+            ticket = queue.popleft()
+            if queue:
+                self._queues.move_to_end(user_id)
+            else:
+                del self._queues[user_id]
+            if ticket.released or ticket.future.done():
+                continue
+            if self.rate:
+                self.tokens -= 1
+            self.active += 1
+            ticket.granted_at = time.monotonic()
+            self.granted += 1
+            self.total_wait += ticket.granted_at - ticket.enqueued_at
+            ticket.future.set_result(True)
+
+    def _on_timer(self):
+        self._timer = None
+        self._dispatch()
+
+    def stats(self) -> Dict[str, Any]:
+        self._refill()
+        return {
+            "rate_per_minute": self.rate * 60,
+            "tokens": round(self.tokens, 2),
+            "max_concurrency": self.max_concurrency,
+            "active": self.active,
+            "queued": sum(len(q) for q in self._queues.values()),
+            "queued_users": len(self._queues),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "avg_wait_s": round(self.total_wait / self.granted, 3) if self.granted else 0.0,
+            "avg_generation_s": round(self._avg_service, 2),
+        }
+
+
+_scheduler: Optional[LLMScheduler] = None
+
+def get_llm_scheduler() -> LLMScheduler:
+    global _scheduler
+    if _scheduler is None:
+        # NVIDIA's free tier allows 40 requests/min; local Ollama has no limit
+        default_rate = "40" if os.getenv("LLM_PROVIDER", "nvidia").lower() == "nvidia" else "0"
+        _scheduler = LLMScheduler(
+            rate_per_minute=float(os.getenv("LLM_RATE_LIMIT_PER_MIN", default_rate)),
+            burst=int(os.getenv("LLM_RATE_BURST", "5")),
+            max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+            deadline=float(os.getenv("LLM_QUEUE_DEADLINE", "30")),
+        )
+    return _scheduler
@@ -1,8 +1,11 @@
 from abc import ABC, abstractmethod
+import asyncio
 import os
 import httpx
 import json
+import time
 from typing import List, Dict, Any, Optional, AsyncGenerator
+from services.metrics import LLM_TOKENS, LLM_TOKENS_PER_SECOND, observe_stage
 
 # Shared default system prompt for grounded RAG answers.
 DEFAULT_SYSTEM_PROMPT = (
@@ -12,12 +15,123 @@ DEFAULT_SYSTEM_PROMPT = (
     "state that it is not found in the uploaded documents."
 )
 
+class LLMErrorMessage(str):
+    """A user-facing error streamed in place of an answer.
+
+    Behaves exactly like the text chunk it replaces, but lets callers tell a
+    provider failure apart from a real answer (e.g. so it is never cached).
+    """
+
+
+# Connection pool and timeout tuning shared by every provider. Each provider
+# keeps one long-lived pool for the life of the app instead of a new TCP/TLS
+# connection per question.
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "10"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+# Longest silence tolerated between streamed bytes once generation has started
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "60"))
+# Longest wait for the first token (covers queueing and prompt processing upstream)
+LLM_FIRST_TOKEN_TIMEOUT = float(os.getenv("LLM_FIRST_TOKEN_TIMEOUT", "30"))
+
+def _http_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_MAX_KEEPALIVE,
+        keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+    )
+
+def _http_timeout() -> httpx.Timeout:
+    return httpx.Timeout(
+        connect=LLM_CONNECT_TIMEOUT,
+        read=LLM_READ_TIMEOUT,
+        write=LLM_CONNECT_TIMEOUT,
+        pool=LLM_CONNECT_TIMEOUT,
+    )
+
+FIRST_TOKEN_TIMEOUT_MESSAGE = "The AI engine did not start answering in time. Please try again shortly."
+
+
 class LLMClient(ABC):
-    @abstractmethod
+    in_flight = 0
+    peak_in_flight = 0
+    requests = 0
+    first_token_timeouts = 0
+
     async def generate_stream(self, prompt: str, context: Optional[List[str]] = None) -> AsyncGenerator[str, None]:
-        """Stream responses from the LLM."""
+        """Stream responses from the LLM.
+
+        Enforces LLM_FIRST_TOKEN_TIMEOUT and tracks pool utilization,
+        time-to-first-token and tokens/s around the provider-specific
+        `_generate`.
+        """
+        self.requests += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        stream = self._generate(prompt, context)
+        started = time.perf_counter()
+        first_at = None
+        tokens = 0
+        try:
+            try:
+                first = await asyncio.wait_for(stream.__anext__(), timeout=LLM_FIRST_TOKEN_TIMEOUT)
+            except StopAsyncIteration:
+                return
+            except asyncio.TimeoutError:
+                self.first_token_timeouts += 1
+                yield LLMErrorMessage(FIRST_TOKEN_TIMEOUT_MESSAGE)
+                return
+            first_at = time.perf_counter()
+            observe_stage("llm_ttft", first_at - started)
+            tokens = 1
+            yield first
+            async for chunk in stream:
+                tokens += 1
+                yield chunk
+        finally:
+            self.in_flight -= 1
+            ended = time.perf_counter()
+            observe_stage("llm_generate", ended - started)
+            LLM_TOKENS.inc(tokens)
+            if first_at is not None and tokens > 1 and ended > first_at:
+                LLM_TOKENS_PER_SECOND.observe((tokens - 1) / (ended - first_at))
+            # Closes the upstream HTTP stream if the consumer stopped early
+            await stream.aclose()
+
+    @abstractmethod
+    def _generate(self, prompt: str, context: Optional[List[str]] = None) -> AsyncGenerator[str, None]:
+        """Provider-specific token stream."""
         pass
 
+    async def start(self):
+        """Opens the provider's connection pool (called at app startup)."""
+
+    async def aclose(self):
+        """Closes the provider's connection pool (called at app shutdown)."""
+
+    def _http_client(self) -> Optional[httpx.AsyncClient]:
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {
+            "provider": type(self).__name__,
+            "max_connections": LLM_MAX_CONNECTIONS,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "requests": self.requests,
+            "first_token_timeouts": self.first_token_timeouts,
+        }
+        client = self._http_client()
+        try:
+            # httpcore doesn't expose pool stats publicly; best effort
+            connections = client._transport._pool.connections
+            stats["open_connections"] = len(connections)
+            stats["idle_connections"] = sum(1 for c in connections if c.is_idle())
+        except Exception:
+            pass
+        return stats
+
     @abstractmethod
     async def get_embeddings(self, text: str) -> List[float]:
         """Generate embeddings for the given text."""
@@ -29,9 +143,28 @@ class OllamaClient(LLMClient):
         self.model = model
         self.embed_model = embed_model
         self.headers = {"Content-Type": "application/json"}
+        self._client: Optional[httpx.AsyncClient] = None
 
-    async def generate_stream(self, prompt: str, context: Optional[List[str]] = None) -> AsyncGenerator[str, None]:
-        url = f"{self.base_url}/api/generate"
+    def _http_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=self.headers,
+                limits=_http_limits(),
+                timeout=_http_timeout(),
+            )
+        return self._client
+
+    async def start(self):
+        self._http_client()
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _generate(self, prompt: str, context: Optional[List[str]] = None) -> AsyncGenerator[str, None]:
+        url = "/api/generate"
         system_prompt = os.getenv("SYSTEM_PROMPT", DEFAULT_SYSTEM_PROMPT)
         
         full_prompt = prompt
@@ -47,8 +180,8 @@ class OllamaClient(LLMClient):
             "options": {"temperature": 0.0}
         }
 
-        async with httpx.AsyncClient(timeout=None) as client:
-            async with client.stream("POST", url, json=payload) as response:
+        try:
+            async with self._http_client().stream("POST", url, json=payload) as response:
                 async for line in response.aiter_lines():
                     if not line:
                         continue
@@ -60,25 +193,29 @@ class OllamaClient(LLMClient):
                             break
                     except json.JSONDecodeError:
                         continue
+        except httpx.TimeoutException as e:
+            print(f"Ollama timeout: {e!r}")
+            yield LLMErrorMessage("The AI engine stopped responding. Please try again shortly.")
+        except httpx.HTTPError as e:
+            print(f"Ollama generation error: {e!r}")
+            yield LLMErrorMessage("Sorry, the AI engine returned an error. Please try again shortly.")
 
     async def get_embeddings(self, text: str) -> List[float]:
         """
         [DEPRECATED] Generate embeddings using Ollama.
         Project now uses local SentenceTransformers via EmbeddingService.
         """
-        url = f"{self.base_url}/api/embeddings"
         payload = {
             "model": self.embed_model,
             "prompt": text
         }
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            try:
-                response = await client.post(url, json=payload)
-                response.raise_for_status()
-                return response.json().get("embedding", [])
-            except Exception as e:
-                print(f"Error getting legacy embeddings: {e}")
-                return []
+        try:
+            response = await self._http_client().post("/api/embeddings", json=payload)
+            response.raise_for_status()
+            return response.json().get("embedding", [])
+        except Exception as e:
+            print(f"Error getting legacy embeddings: {e}")
+            return []
 
 
 class NvidiaClient(LLMClient):
@@ -98,15 +235,31 @@ class NvidiaClient(LLMClient):
         self.model = os.getenv("NVIDIA_MODEL", "minimaxai/minimax-m2.7")
         self.api_key = os.getenv("NVIDIA_API_KEY")
         self._client = None
+        self._http: Optional[httpx.AsyncClient] = None
         if self.api_key:
             # Import lazily so the app can still run with LLM_PROVIDER=ollama
             # (or without `openai` installed) when NVIDIA isn't in use.
             from openai import AsyncOpenAI
-            self._client = AsyncOpenAI(base_url=self.base_url, api_key=self.api_key)
+            # One pooled keep-alive transport for the life of the app
+            self._http = httpx.AsyncClient(limits=_http_limits(), timeout=_http_timeout())
+            self._client = AsyncOpenAI(
+                base_url=self.base_url,
+                api_key=self.api_key,
+                max_retries=int(os.getenv("LLM_MAX_RETRIES", "2")),
+                timeout=_http_timeout(),
+                http_client=self._http,
+            )
 
-    async def generate_stream(self, prompt: str, context: Optional[List[str]] = None) -> AsyncGenerator[str, None]:
+    def _http_client(self) -> Optional[httpx.AsyncClient]:
+        return self._http
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.close()
+
+    async def _generate(self, prompt: str, context: Optional[List[str]] = None) -> AsyncGenerator[str, None]:
         if not self._client:
-            yield (
+            yield LLMErrorMessage(
                 "Configuration error: NVIDIA_API_KEY is not set. Add it to backend/.env "
                 "(get a key at https://build.nvidia.com/settings/api-keys)."
             )
@@ -131,23 +284,24 @@ class NvidiaClient(LLMClient):
                 stream=True,
                 temperature=0.0,
             )
-            async for chunk in stream:
-                if not chunk.choices:
-                    continue
-                delta = chunk.choices[0].delta.content
-                if delta:
-                    yield delta
+            async with stream:
+                async for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        yield delta
         except Exception as e:
             # The OpenAI SDK attaches HTTP status on API errors; surface the
             # common ones (auth / rate limit) as a readable message.
             status = getattr(e, "status_code", None)
             if status == 401:
-                yield "Authentication failed: check your NVIDIA_API_KEY in backend/.env."
+                yield LLMErrorMessage("Authentication failed: check your NVIDIA_API_KEY in backend/.env.")
             elif status == 429:
-                yield "Rate limit reached (NVIDIA free tier allows 40 requests/min). Please wait a moment and retry."
+                yield LLMErrorMessage("Rate limit reached (NVIDIA free tier allows 40 requests/min). Please wait a moment and retry.")
             else:
                 print(f"NVIDIA generation error: {e}")
-                yield "Sorry, the AI engine returned an error. Please try again shortly."
+                yield LLMErrorMessage("Sorry, the AI engine returned an error. Please try again shortly.")
 
     async def get_embeddings(self, text: str) -> List[float]:
         raise NotImplementedError(
@@ -155,17 +309,25 @@ class NvidiaClient(LLMClient):
         )
 
 
+_llm_client: Optional[LLMClient] = None
+
 def get_llm_client() -> LLMClient:
     """Factory: pick the LLM provider from the LLM_PROVIDER env var.
 
     Defaults to NVIDIA NIM. Set LLM_PROVIDER=ollama to fall back to a local
     Ollama install. The rest of the app depends only on the LLMClient
     interface, so swapping providers needs no other code changes.
+
+    The client is app-scoped: every caller shares one connection pool.
     """
-    provider = os.getenv("LLM_PROVIDER", "nvidia").lower()
-    if provider == "ollama":
-        return OllamaClient(
-            base_url=os.getenv("OLLAMA_BASE_URL", "http://localhost:11434"),
-            model=os.getenv("LLM_MODEL", "llama3"),
-        )
-    return NvidiaClient()
+    global _llm_client
+    if _llm_client is None:
+        provider = os.getenv("LLM_PROVIDER", "nvidia").lower()
+        if provider == "ollama":
+            _llm_client = OllamaClient(
+                base_url=os.getenv("OLLAMA_BASE_URL", "http://localhost:11434"),
+                model=os.getenv("LLM_MODEL", "llama3"),
+            )
+        else:
+            _llm_client = NvidiaClient()
+    return _llm_client
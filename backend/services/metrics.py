@@ -0,0 +1,195 @@
+"""In-process metrics in the Prometheus text exposition format.
+
+A deliberately small implementation (no client library dependency): fixed
+bucket histograms and counters that cost a bisect and an increment under an
+uncontended lock per observation, plus gauges that are only evaluated when
+/api/admin/metrics is scraped. Cheap enough to leave on in production.
+
+Metrics are per process; with several API workers, scrape each one.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _fmt(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _HistogramChild:
+    __slots__ = ("_buckets", "_counts", "_sum", "_lock")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self._buckets = buckets
+        self._counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect_left(self._buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+
+    def snapshot(self) -> Tuple[List[int], float]:
+        with self._lock:
+            return list(self._counts), self._sum
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), buckets=LATENCY_BUCKETS):
+        self.name, self.help = name, help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._children: Dict[Tuple[str, ...], _HistogramChild] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def labels(self, *values: str) -> _HistogramChild:
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, _HistogramChild(self.buckets))
+        return child
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for values, child in sorted(self._children.items()):
+            counts, total = child.snapshot()
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{_fmt(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, values)} {_fmt(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, values)} {cumulative}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name, self.help = name, help
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter", f"{self.name} {_fmt(self.value)}"]
+
+
+class Gauge:
+    """A value read from `fn` at scrape time; `fn` returning None omits it."""
+
+    def __init__(self, name: str, help: str, fn: Callable[[], Optional[float]]):
+        self.name, self.help, self.fn = name, help, fn
+
+    def render(self) -> List[str]:
+        try:
+            value = self.fn()
+        except Exception:
+            value = None
+        if value is None:
+            return []
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {_fmt(value)}"]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        return self.register(Histogram(*args, **kwargs))
+
+    def counter(self, *args, **kwargs) -> Counter:
+        return self.register(Counter(*args, **kwargs))
+
+    def gauge(self, name: str, help: str):
+        """Decorator registering a scrape-time gauge."""
+        def decorator(fn):
+            self.register(Gauge(name, help, fn))
+            return fn
+        return decorator
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "auramind_stage_seconds", "Latency of hot-path stages.", labelnames=("stage",),
+)
+LLM_TOKENS = REGISTRY.counter("auramind_llm_tokens_total", "Streamed LLM deltas (~tokens).")
+LLM_TOKENS_PER_SECOND = REGISTRY.histogram(
+    "auramind_llm_tokens_per_second", "Per-answer generation speed after the first token.", buckets=RATE_BUCKETS,
+)
+INGEST_PAGES = REGISTRY.counter("auramind_ingest_pages_total", "Pages extracted by ingestion.")
+INGEST_CHUNKS = REGISTRY.counter("auramind_ingest_chunks_total", "Chunks embedded by ingestion.")
+INGEST_PAGES_PER_SECOND = REGISTRY.histogram(
+    "auramind_ingest_pages_per_second", "Per-document ingestion speed in pages/s.", buckets=RATE_BUCKETS,
+)
+INGEST_CHUNKS_PER_SECOND = REGISTRY.histogram(
+    "auramind_ingest_chunks_per_second", "Per-document ingestion speed in chunks/s.", buckets=RATE_BUCKETS,
+)
+
+def observe_stage(stage: str, seconds: float):
+    STAGE_SECONDS.labels(stage).observe(seconds)
+
+@contextmanager
+def timed_stage(stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started)
+
+
+class RequestTimings:
+    """Stage timings of one request: always fed to the histograms, and kept
+    per request for an optional breakdown in the response."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    def record(self, stage: str, seconds: float):
+        observe_stage(stage, seconds)
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, stage: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started)
+
+    def breakdown(self) -> Dict[str, float]:
+        """Milliseconds per stage, plus the total so far."""
+        result = {stage: round(seconds * 1000, 1) for stage, seconds in self.stages.items()}
+        result["total"] = round((time.perf_counter() - self.started) * 1000, 1)
+        return result
@@ -0,0 +1,451 @@
+import json
+import os
+import shutil
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# SQLite caps the number of bound parameters per statement
+_MAX_PARAMS = 500
+# Rows scored per matrix product, bounding the temporary score buffers
+_SCAN_BLOCK = 65536
+
+IVF_THRESHOLD = int(os.getenv("VECTOR_IVF_THRESHOLD", "100000"))
+IVF_NPROBE = int(os.getenv("VECTOR_IVF_NPROBE", "16"))
+
+def _unit_rows(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.clip(norms, 1e-12, None)
+
+
+class NumpyCollection:
+    """A vector collection stored as a memory-mapped matrix plus a SQLite side-table.
+
+    Implements the part of the Chroma collection API that VectorService uses
+    (add / query / get / delete / count). Vectors are unit-normalized and
+    scored by inner product: brute force over the whole matrix at small
+    scale, inverted-file (k-means partitions, `IVF_NPROBE` probed per query)
+    once the collection passes `IVF_THRESHOLD` chunks. Rows live in fixed
+    slots; deleting frees the slot for reuse, and chunks are found by id or
+    by the indexed `document_id` column without scanning.
+
+    Every process that opens the collection maps the same file, so they
+    share one copy in the OS page cache. Writers serialize on the SQLite
+    write lock and bump a generation counter that readers check before
+    each query to pick up other processes' changes.
+    """
+
+    def __init__(self, directory: str, name: str, metadata: Optional[Dict[str, Any]] = None, dtype=np.float32):
+        self.name = name
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._db_path = os.path.join(directory, "meta.db")
+        self._vectors_path = os.path.join(directory, "vectors.bin")
+        self._assign_path = os.path.join(directory, "assign.i32")
+        self._centroids_path = os.path.join(directory, "centroids.npy")
+        self._local = threading.local()
+        self._lock = threading.RLock()
+        self._training = False
+
+        conn = self._conn()
+        with conn:
+            info = self._info(conn)
+            if "dtype" not in info:
+                self._set_info(conn, dtype=np.dtype(dtype).name, metadata=metadata or {}, generation=0,
+                               capacity=0, high=0, dim=0, ivf_version=0)
+        self.metadata = json.loads(self._info(conn)["metadata"])
+        self._generation = None
+        self._refresh(conn)
+
+    # Storage
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                " slot INTEGER PRIMARY KEY,"
+                " id TEXT NOT NULL UNIQUE,"
+                " document_id TEXT,"
+                " document TEXT,"
+                " metadata TEXT"
+                ")"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_chunks_document_id ON chunks (document_id)")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _info(conn) -> Dict[str, str]:
+        return dict(conn.execute("SELECT key, value FROM info"))
+
+    @staticmethod
+    def _set_info(conn, **values):
+        conn.executemany(
+            "INSERT OR REPLACE INTO info (key, value) VALUES (?, ?)",
+            [(k, v if isinstance(v, str) else json.dumps(v)) for k, v in values.items()],
+        )
+
+    @contextmanager
+    def _write(self):
+        """A write transaction holding the cross-process write lock."""
+        conn = self._conn()
+        with self._lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._refresh(conn)
+                yield conn
+                self._generation += 1
+                self._set_info(conn, generation=self._generation, high=self._high, capacity=self._capacity, dim=self._dim)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                self._generation = None  # Reload from disk on next use
+                raise
+
+    def _map(self, capacity: int, dim: int):
+        self._capacity, self._dim = capacity, dim
+        if not capacity:
+            self._vectors = np.zeros((0, dim), dtype=self._dtype)
+            self._assign = np.zeros(0, dtype=np.int32)
+            return
+        self._vectors = np.memmap(self._vectors_path, dtype=self._dtype, mode="r+", shape=(capacity, dim))
+        self._assign = np.memmap(self._assign_path, dtype=np.int32, mode="r+", shape=(capacity,))
+
+    def _grow(self, needed: int, dim: int):
+        capacity = max(1024, self._capacity)
+        while capacity < needed:
+            capacity *= 2
+        self._vectors = self._assign = None  # Unmap before resizing the files
+        for path, row_bytes, fill in (
+            (self._vectors_path, dim * self._dtype.itemsize, None),
+            (self._assign_path, 4, -1),
+        ):
+            with open(path, "ab") as f:
+                old = f.tell()
+                f.truncate(capacity * row_bytes)
+            if fill is not None and capacity * row_bytes > old:
+                assign = np.memmap(path, dtype=np.int32, mode="r+", shape=(capacity,))
+                assign[old // 4:] = fill
+                assign.flush()
+                del assign
+        self._map(capacity, dim)
+
+    def _refresh(self, conn):
+        """Reloads slot state if any process changed the collection."""
+        info = self._info(conn)
+        generation = int(info["generation"])
+        if generation == self._generation:
+            return
+        self._dtype = np.dtype(info["dtype"])
+        capacity, dim = int(info["capacity"]), int(info["dim"])
+        if self._generation is None or capacity != self._capacity or dim != self._dim:
+            self._map(capacity, dim)
+        self._high = int(info["high"])
+
+        self._ids: List[Optional[str]] = [None] * self._high
+        self._alive = np.zeros(self._high, dtype=bool)
+        for slot, chunk_id in conn.execute("SELECT slot, id FROM chunks"):
+            self._ids[slot] = chunk_id
+            self._alive[slot] = True
+        self._slot_of = {chunk_id: slot for slot, chunk_id in enumerate(self._ids) if chunk_id is not None}
+        self._free = [slot for slot in range(self._high - 1, -1, -1) if not self._alive[slot]]
+
+        ivf_version = int(info["ivf_version"])
+        if ivf_version != getattr(self, "_ivf_version", None):
+            self._centroids = np.load(self._centroids_path) if ivf_version and os.path.exists(self._centroids_path) else None
+            self._ivf_version = ivf_version
+            self._ivf_trained_on = int(info.get("ivf_trained_on", "0"))
+        self._lists = None
+        self._generation = generation
+
+    # Writes
+
+    def add(self, ids: List[str], embeddings=None, documents: Optional[List[str]] = None, metadatas: Optional[List[Dict[str, Any]]] = None):
+        if embeddings is None:
+            raise ValueError("NumpyCollection.add needs precomputed embeddings")
+        vectors = _unit_rows(embeddings)
+        documents = documents or [None] * len(ids)
+        metadatas = metadatas or [{} for _ in ids]
+        with self._write() as conn:
+            fresh = [i for i, chunk_id in enumerate(ids) if chunk_id not in self._slot_of]
+            if not fresh:
+                return
+            dim = vectors.shape[1]
+            if self._dim and dim != self._dim:
+                raise ValueError(f"Embedding dimension {dim} does not match collection dimension {self._dim}")
+            slots = [self._free.pop() if self._free else None for _ in fresh]
+            new_high = self._high + sum(1 for s in slots if s is None)
+            if new_high > self._capacity or not self._dim:
+                self._grow(new_high, dim)
+            for n, slot in enumerate(slots):
+                if slot is None:
+                    slots[n] = self._high
+                    self._high += 1
+            slots = np.asarray(slots, dtype=np.int64)
+
+            self._vectors[slots] = vectors[fresh].astype(self._dtype)
+            self._assign[slots] = self._nearest_centroid(vectors[fresh]) if self._centroids is not None else -1
+            self._vectors.flush()
+            self._assign.flush()
+            conn.executemany(
+                "INSERT INTO chunks (slot, id, document_id, document, metadata) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (int(slot), ids[i], (metadatas[i] or {}).get("document_id"), documents[i], json.dumps(metadatas[i] or {}))
+                    for slot, i in zip(slots, fresh)
+                ],
+            )
+
+            if self._high > len(self._ids):
+                self._ids.extend([None] * (self._high - len(self._ids)))
+                self._alive = np.concatenate([self._alive, np.zeros(self._high - len(self._alive), dtype=bool)])
+            for slot, i in zip(slots, fresh):
+                self._ids[slot] = ids[i]
+                self._slot_of[ids[i]] = int(slot)
+            self._alive[slots] = True
+            self._lists = None
+        self._maybe_train()
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None):
+        if where is not None:
+            ids = self.get(where=where, include=[])["ids"]
+        if not ids:
+            return
+        with self._write() as conn:
+            slots = [self._slot_of.pop(chunk_id) for chunk_id in ids if chunk_id in self._slot_of]
+            for i in range(0, len(slots), _MAX_PARAMS):
+                part = slots[i:i + _MAX_PARAMS]
+                conn.execute(f"DELETE FROM chunks WHERE slot IN ({','.join('?' * len(part))})", part)
+            for slot in slots:
+                self._ids[slot] = None
+                self._free.append(slot)
+            self._alive[slots] = False
+
+    # Reads
+
+    def count(self) -> int:
+        with self._lock:
+            self._refresh(self._conn())
+            return int(self._alive.sum())
+
+    @staticmethod
+    def _where_sql(where: Dict[str, Any], params: List[Any]) -> str:
+        clauses = []
+        for key, value in where.items():
+            if key == "$and":
+                clauses.extend(f"({NumpyCollection._where_sql(part, params)})" for part in value)
+                continue
+            if isinstance(value, dict):
+                (op, value), = value.items()
+                if op not in ("$eq", "$ne"):
+                    raise ValueError(f"Unsupported filter operator {op}")
+                sql_op = "=" if op == "$eq" else "IS NOT"
+            else:
+                sql_op = "="
+            column = "document_id" if key == "document_id" else "json_extract(metadata, ?)"
+            if column != "document_id":
+                params.append(f"$.{key}")
+            clauses.append(f"{column} {sql_op} ?")
+            params.append(value)
+        return " AND ".join(clauses) or "1"
+
+    def _rows(self, slots: List[int], include) -> Dict[int, tuple]:
+        conn = self._conn()
+        rows = {}
+        for i in range(0, len(slots), _MAX_PARAMS):
+            part = slots[i:i + _MAX_PARAMS]
+            for row in conn.execute(
+                f"SELECT slot, id, document, metadata FROM chunks WHERE slot IN ({','.join('?' * len(part))})", part
+            ):
+                rows[row[0]] = row
+        return rows
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None, include=("documents", "metadatas"),
+            limit: Optional[int] = None, offset: Optional[int] = None) -> Dict[str, Any]:
+        params: List[Any] = []
+        sql = "SELECT slot, id, document, metadata FROM chunks WHERE " + self._where_sql(where or {}, params)
+        if ids is not None:
+            if not ids:
+                return {"ids": [], "documents": [], "metadatas": [], "embeddings": []}
+            sql += f" AND id IN ({','.join('?' * len(ids))})"
+            params.extend(ids)
+        sql += " ORDER BY slot"
+        if limit is not None or offset:
+            sql += " LIMIT ? OFFSET ?"
+            params.extend([limit if limit is not None else -1, offset or 0])
+        rows = self._conn().execute(sql, params).fetchall()
+        result = {"ids": [r[1] for r in rows], "documents": None, "metadatas": None, "embeddings": None}
+        if "documents" in include:
+            result["documents"] = [r[2] for r in rows]
+        if "metadatas" in include:
+            result["metadatas"] = [json.loads(r[3]) if r[3] else None for r in rows]
+        if "embeddings" in include:
+            with self._lock:
+                result["embeddings"] = [self._vectors[r[0]].astype(np.float32).tolist() for r in rows]
+        return result
+
+    @staticmethod
+    def _scores(vectors, high: int, queries: np.ndarray, slots: Optional[np.ndarray] = None) -> np.ndarray:
+        """Inner products of queries against the given slots (or all slots)."""
+        if slots is not None:
+            return np.asarray(vectors[slots], dtype=np.float32) @ queries.T
+        out = np.empty((high, len(queries)), dtype=np.float32)
+        for start in range(0, high, _SCAN_BLOCK):
+            block = np.asarray(vectors[start:min(start + _SCAN_BLOCK, high)], dtype=np.float32)
+            out[start:start + len(block)] = block @ queries.T
+        return out
+
+    def query(self, query_embeddings, n_results: int = 10, include=("documents", "metadatas", "distances")) -> Dict[str, Any]:
+        queries = _unit_rows(query_embeddings)
+        # Snapshot under the lock, score outside it: concurrent queries run in
+        # parallel (NumPy releases the GIL) and a resize can't unmap our view.
+        with self._lock:
+            self._refresh(self._conn())
+            vectors, high, alive = self._vectors, self._high, self._alive.copy()
+            use_ivf = self._centroids is not None and alive.sum() >= IVF_THRESHOLD
+            if use_ivf:
+                centroids, lists = self._centroids, self._inverted_lists()
+        if high == 0:
+            empty = [[] for _ in queries]
+            return {"ids": empty, "documents": empty, "metadatas": empty, "distances": empty}
+
+        top: List[List[tuple]] = []
+        if use_ivf:
+            for q in queries:
+                slots = self._probe(centroids, lists, q)
+                slots = slots[alive[slots]]
+                scores = self._scores(vectors, high, q[None, :], slots)[:, 0]
+                top.append(self._top(slots, scores, n_results))
+        else:
+            scores = self._scores(vectors, high, queries)
+            live = np.flatnonzero(alive)
+            for j in range(len(queries)):
+                top.append(self._top(live, scores[live, j], n_results))
+
+        rows = self._rows(sorted({slot for hits in top for slot, _ in hits}), include)
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for hits in top:
+            # A slot deleted (or reused) since the snapshot is dropped
+            hits = [(slot, score) for slot, score in hits if slot in rows]
+            result["ids"].append([rows[slot][1] for slot, _ in hits])
+            result["documents"].append([rows[slot][2] for slot, _ in hits])
+            result["metadatas"].append([json.loads(rows[slot][3]) if rows[slot][3] else None for slot, _ in hits])
+            result["distances"].append([1.0 - score for _, score in hits])  # Cosine distance
+        return result
+
+    @staticmethod
+    def _top(slots: np.ndarray, scores: np.ndarray, k: int) -> List[tuple]:
+        if len(scores) > k:
+            part = np.argpartition(-scores, k)[:k]
+            slots, scores = slots[part], scores[part]
+        order = np.argsort(-scores)
+        return [(int(slots[i]), float(scores[i])) for i in order]
+
+    # IVF
+
+    def _nearest_centroid(self, vectors: np.ndarray) -> np.ndarray:
+        return np.argmax(vectors @ self._centroids.T, axis=1).astype(np.int32)
+
+    def _inverted_lists(self):
+        """(slots ordered by partition, partition boundaries), rebuilt after writes."""
+        if self._lists is None:
+            assign = np.asarray(self._assign[:self._high])
+            order = np.argsort(assign, kind="stable")
+            bounds = np.searchsorted(assign[order], np.arange(len(self._centroids) + 1))
+            self._lists = (order, bounds)
+        return self._lists
+
+    @staticmethod
+    def _probe(centroids: np.ndarray, lists, query: np.ndarray) -> np.ndarray:
+        order, bounds = lists
+        nprobe = min(IVF_NPROBE, len(centroids))
+        nearest = np.argpartition(-(centroids @ query), nprobe - 1)[:nprobe]
+        return np.concatenate([order[bounds[c]:bounds[c + 1]] for c in nearest])
+
+    def _maybe_train(self):
+        alive = int(self._alive.sum())
+        trained_on = self._ivf_trained_on if self._centroids is not None else 0
+        if alive < IVF_THRESHOLD or self._training or (trained_on and alive < 2 * trained_on):
+            return
+        self._training = True
+        threading.Thread(target=self._train, daemon=True).start()
+
+    def _train(self, iterations: int = 10, seed: int = 0):
+        """K-means partitions of the live vectors; retrained as the collection doubles."""
+        try:
+            with self._lock:
+                live = np.flatnonzero(self._alive)
+            nlist = max(1, int(np.sqrt(len(live))))
+            rng = np.random.default_rng(seed)
+            sample = rng.choice(live, size=min(len(live), 64 * nlist), replace=False)
+            data = _unit_rows(self._vectors[np.sort(sample)])
+            centroids = data[rng.choice(len(data), size=nlist, replace=False)]
+            for _ in range(iterations):
+                assign = np.argmax(data @ centroids.T, axis=1)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, assign, data)
+                counts = np.bincount(assign, minlength=nlist)[:, None]
+                # Empty partitions keep their previous centroid
+                centroids = np.where(counts > 0, sums / np.clip(counts, 1, None), centroids)
+                centroids = _unit_rows(centroids)
+
+            with self._write() as conn:
+                self._centroids = centroids.astype(np.float32)
+                for start in range(0, self._high, _SCAN_BLOCK):
+                    block = np.asarray(self._vectors[start:start + _SCAN_BLOCK], dtype=np.float32)
+                    self._assign[start:start + len(block)] = self._nearest_centroid(block)
+                self._assign.flush()
+                np.save(self._centroids_path, self._centroids)
+                self._ivf_version = getattr(self, "_ivf_version", 0) + 1
+                self._ivf_trained_on = len(live)
+                self._set_info(conn, ivf_version=self._ivf_version, ivf_trained_on=self._ivf_trained_on)
+                self._lists = None
+            print(f"NumpyCollection {self.name}: trained {nlist} IVF partitions on {len(live)} vectors")
+        except Exception as e:
+            print(f"NumpyCollection {self.name}: IVF training failed: {e}")
+        finally:
+            self._training = False
+
+
+class NumpyVectorStore:
+    """Directory of NumpyCollections; mirrors the PersistentClient calls VectorService makes."""
+
+    def __init__(self, path: str, dtype: str = "float32"):
+        self.path = path
+        self.dtype = np.float16 if dtype == "float16" else np.float32
+        self._collections: Dict[str, NumpyCollection] = {}
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def get_or_create_collection(self, name: str, metadata: Optional[Dict[str, Any]] = None) -> NumpyCollection:
+        with self._lock:
+            collection = self._collections.get(name)
+            if collection is None:
+                collection = NumpyCollection(os.path.join(self.path, name), name, metadata, dtype=self.dtype)
+                self._collections[name] = collection
+            return collection
+
+    def delete_collection(self, name: str):
+        with self._lock:
+            self._collections.pop(name, None)
+            shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+
+
+_stores: Dict[str, NumpyVectorStore] = {}
+
+def open_numpy_store(path: str) -> NumpyVectorStore:
+    """The process-wide store for `path`; collections keep in-memory slot state."""
+    store = _stores.get(path)
+    if store is None:
+        store = _stores[path] = NumpyVectorStore(path, dtype=os.getenv("VECTOR_DTYPE", "float32"))
+    return store
@@ -0,0 +1,121 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from services.cache import LRUCache
+
+class Reranker:
+    """Cross-encoder reranking of retrieved chunks under a latency budget.
+
+    Candidates are scored in mini-batches of `batch_size` on a dedicated
+    executor. If scoring does not finish within `budget_ms` (or the model is
+    unavailable) the candidates are returned in their retrieval order, so
+    reranking can only ever cost the budget, never fail a request. The
+    worker checks the same deadline between mini-batches, so abandoned work
+    stops (and work queued past its deadline never starts) instead of
+    holding the executor for later requests.
+    """
+
+    def __init__(self, model_name: str, budget_ms: float = 300.0, max_length: int = 256, cache_size: int = 1024,
+                 batch_size: int = 16):
+        self.model_name = model_name
+        self.budget = budget_ms / 1000.0
+        self.max_length = max_length
+        self.batch_size = max(batch_size, 1)
+        self._model = None
+        self._load_failed = False
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank")
+        # (query, candidate ids) -> candidate indices in reranked order
+        self.cache = LRUCache(max_size=cache_size, ttl=float(os.getenv("RERANK_CACHE_TTL", "3600")))
+        self.reranked = 0
+        self.fallbacks = 0
+        self.total_ms = 0.0
+
+    def _load(self):
+        if self._model is None and not self._load_failed:
+            try:
+                from sentence_transformers import CrossEncoder
+                self._model = CrossEncoder(self.model_name, device="cpu", max_length=self.max_length)
+                print(f"Reranker initialized with model: {self.model_name}")
+            except Exception as e:
+                self._load_failed = True
+                print(f"Reranker unavailable ({e}); falling back to retrieval order")
+        return self._model
+
+    def warm(self):
+        """Loads the model ahead of the first request."""
+        self._load()
+
+    def _score(self, query: str, contents: List[str], deadline: float) -> Optional[List[float]]:
+        model = self._load()
+        if model is None:
+            return None
+        scores: List[float] = []
+        for i in range(0, len(contents), self.batch_size):
+            if time.monotonic() >= deadline:
+                return None  # The request has already fallen back
+            pairs = [(query, c) for c in contents[i:i + self.batch_size]]
+            scores.extend(float(s) for s in model.predict(pairs, batch_size=len(pairs), show_progress_bar=False))
+        return scores
+
+    async def rerank(self, query: str, candidates: List[Dict[str, Any]], top_k: int) -> List[Dict[str, Any]]:
+        if len(candidates) <= 1:
+            return candidates[:top_k]
+
+        key = (query.strip().lower(), tuple(c["id"] for c in candidates))
+        order = self.cache.get(key)
+        if order is None:
+            started = time.perf_counter()
+            loop = asyncio.get_running_loop()
+            deadline = time.monotonic() + self.budget
+            work = loop.run_in_executor(self._executor, self._score, query, [c["content"] for c in candidates], deadline)
+            try:
+                scores = await asyncio.wait_for(work, timeout=self.budget)
+            except asyncio.TimeoutError:
+                scores = None
+            self.total_ms += (time.perf_counter() - started) * 1000
+            if scores is None:
+                self.fallbacks += 1
+                return candidates[:top_k]
+            order = sorted(range(len(candidates)), key=lambda i: scores[i], reverse=True)
+            self.cache.set(key, order)
+        self.reranked += 1
+        return [candidates[i] for i in order[:top_k]]
+
+    def stats(self) -> Dict[str, Any]:
+        scored = self.reranked + self.fallbacks - self.cache.hits
+        return {
+            "model": self.model_name,
+            "budget_ms": self.budget * 1000,
+            "reranked": self.reranked,
+            "fallbacks": self.fallbacks,
+            "avg_ms": round(self.total_ms / scored, 2) if scored > 0 else 0.0,
+            "cache": self.cache.stats(),
+        }
+
+
+# Off by default: it downloads a second model on first use
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() in ("1", "true", "yes")
+# Chunks over-fetched from retrieval for the reranker, and how many it keeps
+# (5, the same context size as without reranking)
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "50"))
+RERANK_TOP_K = int(os.getenv("RERANK_TOP_K", "5"))
+
+_reranker: Optional[Reranker] = None
+
+def get_reranker() -> Optional[Reranker]:
+    """The process-wide reranker, or None when RERANK_ENABLED is off."""
+    global _reranker
+    if not RERANK_ENABLED:
+        return None
+    if _reranker is None:
+        _reranker = Reranker(
+            model_name=os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2"),
+            budget_ms=float(os.getenv("RERANK_BUDGET_MS", "300")),
+            max_length=int(os.getenv("RERANK_MAX_LENGTH", "256")),
+            cache_size=int(os.getenv("RERANK_CACHE_SIZE", "1024")),
+            batch_size=int(os.getenv("RERANK_BATCH_SIZE", "16")),
+        )
+    return _reranker
@@ -0,0 +1,120 @@
+"""Server-sent event framing for the chat stream.
+
+The wire format is unchanged: one `data: {json}\\n\\n` frame per event and a
+final `data: [DONE]`. Chunk frames are built from a fixed prefix/suffix
+around the escaped text rather than a `json.dumps` of a fresh dict, and a
+`TokenCoalescer` caps chunk frames at one per short window by merging the
+deltas that arrive in between, so a fast model costs a few dozen frames
+(and socket writes) per second instead of one per token.
+"""
+import asyncio
+import json
+import os
+from json.encoder import encode_basestring_ascii
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+DONE_FRAME = "data: [DONE]\n\n"
+_CHUNK_PREFIX = 'data: {"type": "chunk", "text": '
+_FRAME_END = "}\n\n"
+
+def encode_event(payload: Dict[str, Any]) -> str:
+    return f"data: {json.dumps(payload)}\n\n"
+
+def chunk_frame(text: str) -> str:
+    """Equivalent to `encode_event({'type': 'chunk', 'text': text})`."""
+    return _CHUNK_PREFIX + encode_basestring_ascii(text) + _FRAME_END
+
+
+_END = object()
+
+class TokenCoalescer:
+    """Merges streamed text deltas into fewer, larger pieces.
+
+    At most one piece is emitted per `window_ms`: a delta arriving after a
+    quiet window goes out immediately (so time-to-first-token is unchanged),
+    otherwise it waits out the rest of the window and everything that has
+    arrived by then is sent together, up to `max_bytes` characters per
+    piece. With `window_ms` 0 the stream is passed through untouched.
+    """
+
+    def __init__(self, window_ms: float = 30.0, max_bytes: int = 256):
+        self.window = window_ms / 1000.0
+        self.max_bytes = max_bytes
+        self.streams = 0
+        self.deltas = 0
+        self.pieces = 0
+
+    async def _pump(self, source: AsyncIterator[str], queue: asyncio.Queue):
+        try:
+            async for delta in source:
+                queue.put_nowait(delta)
+        except Exception as e:
+            queue.put_nowait(e)
+        queue.put_nowait(_END)
+
+    async def coalesce(self, source: AsyncIterator[str]) -> AsyncIterator[str]:
+        self.streams += 1
+        if self.window <= 0:
+            async for delta in source:
+                self.deltas += 1
+                self.pieces += 1
+                yield delta
+            return
+
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        # The source is read by its own task so deltas keep arriving while
+        # this side waits out a window (or a slow client)
+        pump = loop.create_task(self._pump(source, queue))
+        try:
+            last = None  # _END or an exception, seen while filling a piece
+            next_emit = 0.0
+            while last is None:
+                item = await queue.get()
+                if item is _END:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                # One sleep per piece, no per-delta timers
+                wait = next_emit - loop.time()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                buffer: List[str] = [item]
+                size = len(item)
+                while size < self.max_bytes and not queue.empty():
+                    item = queue.get_nowait()
+                    if item is _END or isinstance(item, Exception):
+                        last = item
+                        break
+                    buffer.append(item)
+                    size += len(item)
+                self.deltas += len(buffer)
+                self.pieces += 1
+                next_emit = loop.time() + self.window
+                yield "".join(buffer)
+            if isinstance(last, Exception):
+                raise last
+        finally:
+            pump.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "window_ms": self.window * 1000,
+            "max_bytes": self.max_bytes,
+            "streams": self.streams,
+            "deltas": self.deltas,
+            "frames": self.pieces,
+            "deltas_per_frame": round(self.deltas / self.pieces, 2) if self.pieces else 0.0,
+        }
+
+
+_coalescer: Optional[TokenCoalescer] = None
+
+def get_token_coalescer() -> TokenCoalescer:
+    global _coalescer
+    if _coalescer is None:
+        _coalescer = TokenCoalescer(
+            window_ms=float(os.getenv("SSE_COALESCE_MS", "30")),
+            max_bytes=int(os.getenv("SSE_COALESCE_BYTES", "256")),
+        )
+    return _coalescer
@@ -0,0 +1,172 @@
+"""Cancellable chat streams.
+
+Each answer is produced by its own task, which pushes SSE frames into a
+queue that the HTTP response drains. The two ends close independently:
+  - client disconnect: the response stops draining and `close` cancels the
+    producer, which aborts retrieval, closes the upstream LLM stream and
+    releases the generation slot at its next await;
+  - POST /api/chat/cancel: `cancel` stops the producer, the frames already
+    produced are still delivered, then a `cancelled` event and [DONE].
+Either way the answer text the client actually received is handed to the
+stream's `on_close` callback marked as truncated, and generated vs.
+delivered LLM deltas are counted so wasted generation is visible.
+"""
+import asyncio
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from services.sse import DONE_FRAME, encode_event
+
+_END = object()
+
+class StreamConflict(Exception):
+    """The user already has an active stream with this request id."""
+
+
+class ChatStream:
+    def __init__(self, registry: "StreamRegistry", request_id: str, user_id: int):
+        self.registry = registry
+        self.request_id = request_id
+        self.user_id = user_id
+        self.parts: List[str] = []  # Answer text produced so far
+        self.generated = 0  # Deltas received from the LLM
+        self.delivered_chars = 0
+        # Set by the producer once there is an answer worth persisting
+        self.on_close: Optional[Callable[[str, bool], None]] = None
+        self.cancel_requested = False
+        self.outcome: Optional[str] = None
+        self._closed = False
+        self._frames: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+
+    def emit(self, frame: str, answer_text: str = ""):
+        """Queues a frame; `answer_text` is the part of the answer it carries."""
+        self._frames.put_nowait((frame, len(answer_text)))
+
+    def start(self, producer):
+        self._task = asyncio.get_running_loop().create_task(self._run(producer))
+
+        def done(task):
+            producer.close()  # In case the task was cancelled before it ran
+            self._frames.put_nowait((_END, 0))
+        self._task.add_done_callback(done)
+
+    async def _run(self, producer):
+        try:
+            await producer
+        except Exception as e:
+            print(f"Chat stream {self.request_id} failed: {e!r}")
+            self.outcome = self.outcome or "failed"
+            self.emit(encode_event({'error': 'Something went wrong while answering. Please try again.'}))
+            self.emit(DONE_FRAME)
+
+    async def frames(self) -> AsyncIterator[str]:
+        """The response body; closes the stream however iteration ends."""
+        try:
+            while True:
+                frame, chars = await self._frames.get()
+                if frame is _END:
+                    break
+                yield frame
+                self.delivered_chars += chars
+            if self.cancel_requested:
+                yield encode_event({'type': 'cancelled', 'truncated': True})
+                yield DONE_FRAME
+            self.close("cancelled" if self.cancel_requested else "completed")
+        finally:
+            # Still open here only if the client went away mid-stream
+            self.close("disconnected")
+
+    def cancel(self):
+        self.cancel_requested = True
+        if self._task is not None:
+            self._task.cancel()
+
+    def answer(self) -> Tuple[str, bool]:
+        """The answer as delivered, and whether it was cut short."""
+        full = "".join(self.parts)
+        if self.outcome == "completed":
+            return full, False
+        return full[:self.delivered_chars], True
+
+    def delivered_deltas(self) -> int:
+        delivered, total = 0, 0
+        for part in self.parts[:self.generated]:
+            total += len(part)
+            if total > self.delivered_chars:
+                break
+            delivered += 1
+        return delivered
+
+    async def aclose(self, outcome: str):
+        """`close` for Starlette background tasks, which run plain callables
+        in the threadpool; task cancellation and `on_close` need the loop."""
+        self.close(outcome)
+
+    def close(self, outcome: str):
+        if self._closed:
+            return
+        self._closed = True
+        # A failure recorded by the producer takes precedence
+        self.outcome = self.outcome or outcome
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        if self.on_close is not None:
+            answer, truncated = self.answer()
+            if answer or not truncated:
+                try:
+                    self.on_close(answer, truncated)
+                except Exception as e:
+                    print(f"Chat stream {self.request_id}: on_close failed: {e!r}")
+        self.registry._finished(self)
+
+
+class StreamRegistry:
+    """Active chat streams by (user, request id), plus outcome/token counters."""
+
+    def __init__(self):
+        self._active: Dict[Tuple[int, str], ChatStream] = {}
+        self.outcomes: Dict[str, int] = {"completed": 0, "cancelled": 0, "disconnected": 0, "failed": 0}
+        self.tokens_generated = 0
+        self.tokens_delivered = 0
+
+    def open(self, request_id: str, user_id: int) -> ChatStream:
+        key = (user_id, request_id)
+        if key in self._active:
+            raise StreamConflict(request_id)
+        stream = ChatStream(self, request_id, user_id)
+        self._active[key] = stream
+        return stream
+
+    def cancel(self, request_id: str, user_id: int) -> bool:
+        stream = self._active.get((user_id, request_id))
+        if stream is None:
+            return False
+        stream.cancel()
+        return True
+
+    def _finished(self, stream: ChatStream):
+        if self._active.pop((stream.user_id, stream.request_id), None) is None:
+            return
+        self.outcomes[stream.outcome] = self.outcomes.get(stream.outcome, 0) + 1
+        self.tokens_generated += stream.generated
+        self.tokens_delivered += stream.delivered_deltas()
+
+    def stats(self) -> Dict[str, Any]:
+        wasted = self.tokens_generated - self.tokens_delivered
+        return {
+            "active": len(self._active),
+            "outcomes": dict(self.outcomes),
+            "tokens_generated": self.tokens_generated,
+            "tokens_delivered": self.tokens_delivered,
+            "tokens_wasted": wasted,
+            "waste_ratio": round(wasted / self.tokens_generated, 4) if self.tokens_generated else 0.0,
+        }
+
+
+_registry: Optional[StreamRegistry] = None
+
+def get_stream_registry() -> StreamRegistry:
+    global _registry
+    if _registry is None:
+        _registry = StreamRegistry()
+    return _registry
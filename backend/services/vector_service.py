@@ -1,57 +1,432 @@
 from fastapi.concurrency import run_in_threadpool
-import chromadb
-from chromadb.config import Settings
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
+import json
+import os
+import threading
+import time
 import uuid
+from services.lexical_index import BM25Index, reciprocal_rank_fusion
+from services.metrics import observe_stage, timed_stage
+
+# Collection used before versioned collections existed; it holds 384-dim
+# all-MiniLM-L6-v2 embeddings.
+LEGACY_COLLECTION = "document_chunks_v2"
+LEGACY_MODEL = "all-MiniLM-L6-v2"
+
+# Which collection serves search, and which one (if any) a full reindex is
+# building, is shared by every VectorService in the process and persisted next
+# to the Chroma data so a restart keeps serving the same collection. Other
+# worker processes may promote or abandon a rebuild, so the file is re-read
+# whenever it changes on disk.
+_state_lock = threading.Lock()
+_states: Dict[str, Dict[str, Optional[str]]] = {}
+_state_stamps: Dict[str, Optional[Tuple[int, int]]] = {}  # state path -> (inode, mtime) when read
+_collection_handles: Dict[str, Dict[str, Any]] = {}
+_lexical_indexes: Dict[str, BM25Index] = {}  # index file path -> index
+
+# Hybrid retrieval: dense and BM25 rankings are fused by weighted reciprocal
+# rank. A weight of 0 disables that retriever.
+HYBRID_VECTOR_WEIGHT = float(os.getenv("HYBRID_VECTOR_WEIGHT", "1.0"))
+HYBRID_LEXICAL_WEIGHT = float(os.getenv("HYBRID_LEXICAL_WEIGHT", "1.0"))
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+LEXICAL_FLUSH_INTERVAL = float(os.getenv("LEXICAL_FLUSH_INTERVAL", "30"))
+_last_lexical_flush = 0.0
+
+# Vector storage: "chroma" (PersistentClient) or "numpy" (memory-mapped matrix
+# with a SQLite side-table, see numpy_vector_store). The two keep separate data
+# directories; switching needs a full POST /api/admin/reindex.
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma").lower()
+
+def _open_client(persist_directory: str):
+    if VECTOR_BACKEND == "numpy":
+        from services.numpy_vector_store import open_numpy_store
+        return open_numpy_store(persist_directory)
+    import chromadb
+    return chromadb.PersistentClient(path=persist_directory)
 
 class VectorService:
-    def __init__(self, persist_directory: str = "./chroma_db"):
-        self.client = chromadb.PersistentClient(path=persist_directory)
-        # Using document_chunks_v2 for 384-dim local embeddings
-        self.collection = self.client.get_or_create_collection(name="document_chunks_v2")
+    def __init__(self, persist_directory: str = None):
+        persist_directory = persist_directory or os.getenv(
+            "VECTOR_DB_PATH", "./vector_db" if VECTOR_BACKEND == "numpy" else "./chroma_db"
+        )
+        self.persist_directory = persist_directory
+        self._client = None
+        self._state_path = os.path.join(persist_directory, "collections.json")
+        self._version_path = os.path.join(persist_directory, "corpus_version")
+        # Handles are shared too, so a collection dropped through one instance
+        # is never used through a stale handle in another.
+        self._collections = _collection_handles.setdefault(self._state_path, {})
+
+    # The store client and embedding model are opened on first use, so
+    # constructing a VectorService (e.g. at import time) costs nothing.
+
+    @property
+    def client(self):
+        if self._client is None:
+            with _state_lock:
+                if self._client is None:
+                    self._client = _open_client(self.persist_directory)
+        return self._client
+
+    @property
+    def embedding_service(self):
         from services.embedding_service import EmbeddingService
         # EmbeddingService is now a Singleton
-        self.embedding_service = EmbeddingService()
+        return EmbeddingService()
 
-    def add_chunks(self, chunks: List[str], metadatas: List[Dict[str, Any]], embeddings: Optional[List[List[float]]] = None):
-        # Synchronous on purpose: this runs inside the document-ingestion
-        # background task, which FastAPI already executes in a worker thread.
-        ids = [str(uuid.uuid4()) for _ in chunks]
-        self.collection.add(
-            documents=chunks,
-            metadatas=metadatas,
-            ids=ids,
-            embeddings=embeddings
+    @property
+    def embedding_batcher(self):
+        from services.embedding_batcher import get_embedding_batcher
+        return get_embedding_batcher()
+
+    # Collection state
+
+    def _stamp(self) -> Optional[Tuple[int, int]]:
+        # os.replace gives the file a new inode, so a rewrite within the
+        # mtime resolution is still noticed
+        try:
+            st = os.stat(self._state_path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns)
+
+    def _read_state(self) -> Dict[str, Optional[str]]:
+        state = {"active": LEGACY_COLLECTION, "building": None}
+        if os.path.exists(self._state_path):
+            with open(self._state_path) as f:
+                state.update(json.load(f))
+        return state
+
+    def _set_state(self, state: Dict[str, Optional[str]], stamp: Optional[Tuple[int, int]], forget: bool = True):
+        """Caches `state`, forgetting handles of collections it no longer names. Holds _state_lock."""
+        old = _states.get(self._state_path)
+        if forget and old is not None:
+            live = {state["active"], state["building"]}
+            for name in {old["active"], old["building"]} - live:
+                if name:
+                    # Dropped by whoever promoted or abandoned it; its files
+                    # are theirs to delete
+                    self._collections.pop(name, None)
+                    _lexical_indexes.pop(os.path.join(self.persist_directory, f"bm25_{name}.pkl"), None)
+        _states[self._state_path] = state
+        _state_stamps[self._state_path] = stamp
+
+    def _state(self) -> Dict[str, Optional[str]]:
+        stamp = self._stamp()
+        with _state_lock:
+            state = _states.get(self._state_path)
+            if state is None or _state_stamps.get(self._state_path) != stamp:
+                state = self._read_state()
+                self._set_state(state, stamp)
+            return state
+
+    def _save_state(self, **changes):
+        with _state_lock:
+            # Read-modify-write against the file, not the cache, which may
+            # predate another worker's change
+            state = self._read_state()
+            state.update(changes)
+            tmp_path = f"{self._state_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(state, f)
+            # Atomic on POSIX and Windows: readers see the old or new state, never half
+            os.replace(tmp_path, self._state_path)
+            # promote() and abandon_rebuild() clean up what they drop themselves
+            self._set_state(state, self._stamp(), forget=False)
+
+    def _get_collection(self, name: str):
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = self.client.get_or_create_collection(name=name)
+            self._collections[name] = collection
+        return collection
+
+    # Corpus version: bumped on every change to the searchable index. Anything
+    # derived from search results (e.g. cached answers) is only valid for the
+    # version it was built on. Every worker process writes the same index, so
+    # the version lives on disk: each change appends one byte to a marker file
+    # (O_APPEND writes from different processes never overwrite each other)
+    # and the version is its size, read at lookup time with one stat.
+
+    @property
+    def corpus_version(self) -> int:
+        try:
+            return os.stat(self._version_path).st_size
+        except FileNotFoundError:
+            return 0
+
+    def _bump_corpus_version(self):
+        with open(self._version_path, "ab") as f:
+            f.write(b".")
+
+    def _lexical(self, name: str) -> BM25Index:
+        """The BM25 index mirroring a collection, loaded or rebuilt on first use."""
+        path = os.path.join(self.persist_directory, f"bm25_{name}.pkl")
+        with _state_lock:
+            index = _lexical_indexes.get(path)
+            if index is not None:
+                return index
+            index = _lexical_indexes[path] = BM25Index(path)
+        collection = self._get_collection(name)
+        if not index.load() or len(index) != collection.count():
+            # Missing or out of date (e.g. crash before a flush): rebuild from
+            # Chroma in the background; search is vector-only until it is ready.
+            index.ready = False
+            threading.Thread(target=self._rebuild_lexical, args=(index, collection), daemon=True).start()
+        return index
+
+    def _rebuild_lexical(self, index: BM25Index, collection, page_size: int = 5000):
+        started = time.perf_counter()
+        index.clear()
+        offset = 0
+        while True:
+            page = collection.get(include=["documents"], limit=page_size, offset=offset)
+            if not page["ids"]:
+                break
+            index.add(page["ids"], page["documents"])
+            offset += len(page["ids"])
+        index.save()
+        index.ready = True
+        print(f"Rebuilt BM25 index for {collection.name}: {len(index)} chunks in {time.perf_counter() - started:.1f}s")
+
+    @property
+    def active_collection_name(self) -> str:
+        return self._state()["active"]
+
+    @property
+    def building_collection_name(self) -> Optional[str]:
+        return self._state()["building"]
+
+    @property
+    def collection(self):
+        """The collection currently serving search."""
+        return self._get_collection(self.active_collection_name)
+
+    def _write_collections(self, collection_name: Optional[str] = None) -> List[Any]:
+        # While a full reindex is building, writes that don't target a specific
+        # collection go to both so nothing is lost when it is promoted.
+        if collection_name:
+            return [self._get_collection(collection_name)]
+        names = [self.active_collection_name]
+        if self.building_collection_name:
+            names.append(self.building_collection_name)
+        return [self._get_collection(n) for n in names]
+
+    def collection_model(self, name: Optional[str] = None) -> str:
+        """Embedding model a collection was built with."""
+        metadata = self._get_collection(name or self.active_collection_name).metadata or {}
+        return metadata.get("embedding_model", LEGACY_MODEL)
+
+    def begin_rebuild(self) -> str:
+        """Creates a new, empty versioned collection for a full reindex."""
+        if self.building_collection_name:
+            raise RuntimeError(f"Collection {self.building_collection_name} is already being built")
+        name = f"document_chunks_{time.strftime('%Y%m%d%H%M%S')}"
+        self._collections[name] = self.client.get_or_create_collection(
+            name=name, metadata={"embedding_model": self.embedding_service.model_name}
         )
+        self._save_state(building=name)
+        return name
+
+    def promote(self, name: str):
+        """Atomically switches search to `name` and drops the previous collection."""
+        old = self.active_collection_name
+        self._save_state(active=name, building=None)
+        self._bump_corpus_version()
+        self.flush_lexical(force=True)
+        if old != name:
+            self._collections.pop(old, None)
+            old_lexical = _lexical_indexes.pop(os.path.join(self.persist_directory, f"bm25_{old}.pkl"), None)
+            if old_lexical:
+                old_lexical.delete_file()
+            try:
+                self.client.delete_collection(old)
+            except Exception as e:
+                print(f"Could not delete old collection {old}: {e}")
+        print(f"VectorService: now serving collection {name}")
+
+    def abandon_rebuild(self, name: str):
+        """Drops a collection that was being built; the active one keeps serving."""
+        self._save_state(building=None)
+        self._collections.pop(name, None)
+        lexical = _lexical_indexes.pop(os.path.join(self.persist_directory, f"bm25_{name}.pkl"), None)
+        if lexical:
+            lexical.delete_file()
+        try:
+            self.client.delete_collection(name)
+        except Exception as e:
+            print(f"Could not delete abandoned collection {name}: {e}")
+
+    # Data
+
+    def add_chunks(self, chunks: List[str], metadatas: List[Dict[str, Any]], embeddings: Optional[List[List[float]]] = None, collection_name: Optional[str] = None):
+        # Synchronous on purpose: this runs on the ingestion collector thread.
+        ids = [str(uuid.uuid4()) for _ in chunks]
+        for collection in self._write_collections(collection_name):
+            collection.add(
+                documents=chunks,
+                metadatas=metadatas,
+                ids=ids,
+                embeddings=embeddings
+            )
+            self._lexical(collection.name).add(ids, chunks)
+        self._bump_corpus_version()
+
+    async def embed_query(self, query: str) -> List[float]:
+        # Concurrent queries are micro-batched into one encode call on a
+        # dedicated executor rather than one threadpool hop each
+        return await self.embedding_batcher.embed(query)
+
+    async def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """Embeds many queries in one encode call (cached ones are reused)."""
+        return await self.embedding_batcher.embed_many(queries)
+
+    async def search(
+        self,
+        query: str,
+        n_results: int = 5,
+        query_embeddings: Optional[List[List[float]]] = None,
+        vector_weight: Optional[float] = None,
+        lexical_weight: Optional[float] = None,
+    ) -> List[Dict[str, Any]]:
+        """Hybrid retrieval: dense (Chroma) and BM25 results fused by RRF.
 
-    async def search(self, query: str, n_results: int = 5, query_embeddings: Optional[List[List[float]]] = None) -> List[Dict[str, Any]]:
-        if not query_embeddings:
-            # Offload blocking embedding generation to threadpool
-            emb = await run_in_threadpool(self.embedding_service.get_embeddings, query)
-            query_embeddings = [emb]
-
-        # Offload blocking Chroma queries
-        results = await run_in_threadpool(
-            self.collection.query,
-            query_embeddings=query_embeddings,
-            n_results=n_results
+        Weights default to HYBRID_VECTOR_WEIGHT / HYBRID_LEXICAL_WEIGHT; with a
+        zero lexical weight (or while the BM25 index is rebuilding) this is
+        plain dense retrieval.
+        """
+        if not query_embeddings and (HYBRID_VECTOR_WEIGHT if vector_weight is None else vector_weight) > 0:
+            # Through the micro-batcher, shared with concurrent requests
+            query_embeddings = [await self.embed_query(query)]
+        results = await self.search_many(
+            [query], n_results, query_embeddings=query_embeddings,
+            vector_weight=vector_weight, lexical_weight=lexical_weight,
         )
-        
-        formatted_results = []
-        if results['documents']:
-            for i in range(len(results['documents'][0])):
-                formatted_results.append({
-                    "content": results['documents'][0][i],
-                    "metadata": results['metadatas'][0][i],
-                    "id": results['ids'][0][i]
-                })
-        return formatted_results
-
-    def delete_by_document(self, document_id: str):
-        # Synchronous: called from sync request handlers (run in a worker thread).
-        self.collection.delete(where={"document_id": document_id})
+        return results[0]
+
+    async def search_many(
+        self,
+        queries: List[str],
+        n_results: int = 5,
+        query_embeddings: Optional[List[List[float]]] = None,
+        vector_weight: Optional[float] = None,
+        lexical_weight: Optional[float] = None,
+    ) -> List[List[Dict[str, Any]]]:
+        """`search` for several queries at once: one multi-vector Chroma query
+        and one fetch of lexical-only hits for all of them."""
+        vector_weight = HYBRID_VECTOR_WEIGHT if vector_weight is None else vector_weight
+        lexical_weight = HYBRID_LEXICAL_WEIGHT if lexical_weight is None else lexical_weight
+        collection = self.collection
+        lexical = self._lexical(collection.name) if lexical_weight > 0 else None
+        hybrid = lexical is not None and lexical.ready and len(lexical) > 0
+        if not hybrid:
+            vector_weight = vector_weight or 1.0
+        n_candidates = max(HYBRID_CANDIDATES, n_results) if hybrid else n_results
+
+        hits: Dict[str, Dict[str, Any]] = {}
+        vector_ids: List[List[str]] = [[] for _ in queries]
+        if vector_weight > 0:
+            if not query_embeddings:
+                query_embeddings = await self.embed_queries(queries)
+            # Offload blocking Chroma queries; timed including the threadpool hop
+            started = time.perf_counter()
+            results = await run_in_threadpool(
+                collection.query,
+                query_embeddings=query_embeddings,
+                n_results=n_candidates
+            )
+            observe_stage("vector_query", time.perf_counter() - started)
+            for q, documents in enumerate(results['documents'] or []):
+                for i in range(len(documents)):
+                    chunk_id = results['ids'][q][i]
+                    vector_ids[q].append(chunk_id)
+                    hits[chunk_id] = {
+                        "content": documents[i],
+                        "metadata": results['metadatas'][q][i],
+                        "id": chunk_id
+                    }
+        if not hybrid:
+            return [[hits[i] for i in ids[:n_results]] for ids in vector_ids]
+
+        # BM25 scoring is CPU-bound over the postings of the query terms, so it
+        # runs in the threadpool (one hop for all queries)
+        lexical_ranked = await run_in_threadpool(_lexical_search_many, lexical, queries, n_candidates)
+        top_ids: List[List[str]] = []
+        for ids, lexical_ids in zip(vector_ids, lexical_ranked):
+            fused = reciprocal_rank_fusion([(ids, vector_weight), (lexical_ids, lexical_weight)], k=RRF_K)
+            top_ids.append([chunk_id for chunk_id, _ in fused[:n_results]])
+
+        missing = list(dict.fromkeys(chunk_id for ids in top_ids for chunk_id in ids if chunk_id not in hits))
+        if missing:
+            fetched = await run_in_threadpool(collection.get, ids=missing, include=["documents", "metadatas"])
+            for chunk_id, content, metadata in zip(fetched["ids"], fetched["documents"], fetched["metadatas"]):
+                hits[chunk_id] = {"content": content, "metadata": metadata, "id": chunk_id}
+        return [[hits[chunk_id] for chunk_id in ids if chunk_id in hits] for ids in top_ids]
+
+    def delete_by_document(self, document_id: str, only_run: Optional[str] = None, keep_run: Optional[str] = None, collection_name: Optional[str] = None):
+        """Deletes a document's chunks.
+
+        `only_run` restricts the delete to chunks written by one ingestion run;
+        `keep_run` deletes every other run's chunks, which swaps a re-ingested
+        document to its new version without a gap in search results.
+        """
+        # Synchronous: called from sync request handlers and ingestion threads.
+        where: Dict[str, Any] = {"document_id": document_id}
+        if only_run:
+            where = {"$and": [where, {"ingest_run": only_run}]}
+        for collection in self._write_collections(collection_name):
+            # Resolved to ids first so the BM25 index can drop the same chunks.
+            # keep_run is filtered here rather than with "$ne", so chunks
+            # written before runs were tagged are matched too.
+            existing = collection.get(where=where, include=["metadatas"] if keep_run else [])
+            ids = existing["ids"]
+            if keep_run:
+                ids = [
+                    chunk_id for chunk_id, metadata in zip(ids, existing["metadatas"])
+                    if (metadata or {}).get("ingest_run") != keep_run
+                ]
+            if ids:
+                collection.delete(ids=ids)
+                self._lexical(collection.name).delete(ids)
+        self._bump_corpus_version()
+
+    def flush_lexical(self, force: bool = False):
+        """Persists BM25 indexes changed since the last flush (rate-limited)."""
+        flush_lexical_indexes(force=force)
 
     def reset_collection(self):
         """Clears all data from the collection."""
-        self.client.delete_collection("document_chunks_v2")
-        self.collection = self.client.get_or_create_collection(name="document_chunks_v2")
+        name = self.active_collection_name
+        self._collections.pop(name, None)
+        self.client.delete_collection(name)
+        self._get_collection(name)
+        self._lexical(name).clear()
+        self._bump_corpus_version()
+
+
+_vector_service: Optional[VectorService] = None
+
+def get_vector_service() -> VectorService:
+    """The app-scoped VectorService shared by the API routers and the ingestion worker."""
+    global _vector_service
+    if _vector_service is None:
+        _vector_service = VectorService()
+    return _vector_service
+
+def _lexical_search_many(lexical: BM25Index, queries: List[str], k: int) -> List[List[str]]:
+    ranked = []
+    for query in queries:
+        with timed_stage("lexical_query"):
+            ranked.append([chunk_id for chunk_id, _ in lexical.search(query, k=k)])
+    return ranked
+
+def flush_lexical_indexes(force: bool = False):
+    global _last_lexical_flush
+    now = time.monotonic()
+    if not force and now - _last_lexical_flush < LEXICAL_FLUSH_INTERVAL:
+        return
+    _last_lexical_flush = now
+    for index in list(_lexical_indexes.values()):
+        if index.dirty and index.ready:
+            index.save()
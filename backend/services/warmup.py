@@ -0,0 +1,110 @@
+"""Background warm-up of the app's heavy components.
+
+Nothing heavy is loaded at import time. Startup only opens the database and
+starts the ingestion worker; the embedding model, vector store, BM25 index,
+reranker and LLM connection pool are then loaded by a background task, so
+the app answers `/` immediately while `/ready` reports what is warm.
+"""
+import asyncio
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Dict
+
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() in ("1", "true", "yes")
+# Components that must be warm before /ready reports ready
+REQUIRED = ("database", "embedding_model", "vector_store")
+
+_components: Dict[str, Dict[str, Any]] = {}
+
+def _set(name: str, state: str, **details):
+    _components.setdefault(name, {}).update(state=state, **details)
+
+@contextmanager
+def timed(name: str):
+    """Records a component's load time and state, and logs it."""
+    _set(name, "warming")
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        _set(name, "failed", seconds=round(time.perf_counter() - started, 3), error=str(e))
+        print(f"Startup: {name} failed after {time.perf_counter() - started:.2f}s: {e}")
+        raise
+    seconds = time.perf_counter() - started
+    _set(name, "warm", seconds=round(seconds, 3))
+    print(f"Startup: {name} ready in {seconds:.2f}s")
+
+
+def _warm_embedding_model():
+    from services.embedding_service import EmbeddingService
+    # A dummy encode also initializes kernels / ORT session buffers
+    EmbeddingService().get_batch_embeddings(["warm-up"], use_cache=False)
+
+def _warm_vector_store():
+    from services.embedding_service import EmbeddingService
+    from services.vector_service import get_vector_service
+    collection = get_vector_service().collection
+    if collection.count():
+        vector = EmbeddingService().get_batch_embeddings(["warm-up"], use_cache=False)[0]
+        collection.query(query_embeddings=[vector], n_results=1)
+
+def _warm_lexical_index():
+    from services.vector_service import get_vector_service
+    vector_service = get_vector_service()
+    # Loads the BM25 pickle, or starts a background rebuild (see readiness)
+    vector_service._lexical(vector_service.active_collection_name)
+
+def _warm_reranker():
+    from services.reranker import get_reranker
+    reranker = get_reranker()
+    if reranker is None:
+        return False
+    reranker.warm()
+    reranker._score("warm-up", ["warm-up"])
+    return True
+
+
+async def warm_up():
+    """Loads components in dependency order; failures are logged, never raised."""
+    steps = [
+        ("embedding_model", _warm_embedding_model),
+        ("vector_store", _warm_vector_store),
+        ("lexical_index", _warm_lexical_index),
+        ("reranker", _warm_reranker),
+    ]
+    for name, step in steps:
+        try:
+            with timed(name):
+                result = await asyncio.to_thread(step)
+        except Exception:
+            continue
+        if result is False:
+            _set(name, "disabled")
+    try:
+        with timed("llm_client"):
+            from services.llm_service import get_llm_client
+            await get_llm_client().start()
+    except Exception:
+        pass
+
+
+def start_warm_up():
+    if WARMUP_ENABLED:
+        return asyncio.get_running_loop().create_task(warm_up())
+    return None
+
+
+def readiness() -> Dict[str, Any]:
+    components = {name: dict(info) for name, info in _components.items()}
+    # The lexical index is usable only once a background rebuild finishes
+    lexical = components.get("lexical_index")
+    if lexical and lexical["state"] == "warm":
+        from services.vector_service import get_vector_service
+        vector_service = get_vector_service()
+        if not vector_service._lexical(vector_service.active_collection_name).ready:
+            lexical.update(state="warming", detail="rebuilding from the vector store")
+    # Without warm-up, components load on first use and only the database gates readiness
+    required = REQUIRED if WARMUP_ENABLED else ("database",)
+    ready = all(components.get(name, {}).get("state") == "warm" for name in required)
+    return {"ready": ready, "components": components}
@@ -36,10 +36,20 @@ export default function DocumentsPage() {
     const [uploading, setUploading] = useState(false);
     const [searchQuery, setSearchQuery] = useState('');
 
+    const [nextCursor, setNextCursor] = useState<string | null>(null);
+
+    // Polling refreshes the newest page; older pages loaded via "load more" are kept
     const fetchDocs = async () => {
         try {
             const response = await api.get('/api/documents');
-            setDocuments(response.data);
+            const fresh: DocItem[] = response.data;
+            const cursor = response.headers['x-next-cursor'] ?? null;
+            setDocuments((prev) => {
+                if (!cursor) return fresh;
+                const oldest = Math.min(...fresh.map((d) => d.id));
+                return [...fresh, ...prev.filter((d) => d.id < oldest)];
+            });
+            setNextCursor((prev) => (cursor ? prev ?? cursor : null));
         } catch (err) {
             console.error('Error fetching documents', err);
         } finally {
@@ -53,6 +63,20 @@ export default function DocumentsPage() {
         return () => clearInterval(interval);
     }, []);
 
+    const loadMore = async () => {
+        if (!nextCursor) return;
+        try {
+            const response = await api.get('/api/documents', { params: { cursor: nextCursor } });
+            setDocuments((docs) => {
+                const seen = new Set(docs.map((d) => d.id));
+                return [...docs, ...response.data.filter((d: DocItem) => !seen.has(d.id))];
+            });
+            setNextCursor(response.headers['x-next-cursor'] ?? null);
+        } catch (err) {
+            console.error('Error fetching documents', err);
+        }
+    };
+
     const handleFileUpload = async (e: React.ChangeEvent<HTMLInputElement>) => {
         const file = e.target.files?.[0];
         if (!file || !file.name.toLowerCase().endsWith('.pdf')) return;
@@ -183,6 +207,14 @@ export default function DocumentsPage() {
                         ))}
                     </AnimatePresence>
                 )}
+                {nextCursor && (
+                    <button
+                        onClick={loadMore}
+                        className="w-full px-5 py-3 text-[11px] text-muted hover:text-primary transition-colors text-left"
+                    >
+                        ... load more
+                    </button>
+                )}
             </div>
         </div>
     );
@@ -1,7 +1,7 @@
 'use client';
 
 import { useState, useRef, useEffect } from 'react';
-import { CornerDownLeft, Cpu, Quote, Loader2, Terminal } from 'lucide-react';
+import { CornerDownLeft, Cpu, Quote, Loader2, Terminal, Square } from 'lucide-react';
 import { motion, AnimatePresence } from 'framer-motion';
 import api from '@/lib/api';
 import { useSearchParams } from 'next/navigation';
@@ -10,6 +10,7 @@ interface Message {
     role: 'user' | 'bot';
     content: string;
     citations?: any[];
+    truncated?: boolean;
 }
 
 export default function ChatPage() {
@@ -19,23 +20,46 @@ export default function ChatPage() {
     const [input, setInput] = useState('');
     const [loading, setLoading] = useState(false);
     const [fetchingMessages, setFetchingMessages] = useState(false);
+    const [olderCursor, setOlderCursor] = useState<string | null>(null);
     const scrollRef = useRef<HTMLDivElement>(null);
+    const keepScrollRef = useRef(false);
+    const requestIdRef = useRef<string | null>(null);
+
+    // History is paginated newest-first; X-Next-Cursor points at the page before
+    const fetchPage = async (cursor?: string) => {
+        const res = await api.get(`/api/history/conversations/${convId}/messages`, {
+            params: { include_citations: true, cursor },
+        });
+        setOlderCursor(res.headers['x-next-cursor'] ?? null);
+        return res.data.map((m: any) => ({
+            role: m.role as 'user' | 'bot',
+            content: m.content,
+            citations: m.citations ? JSON.parse(m.citations) : undefined,
+            truncated: !!m.truncated,
+        })) as Message[];
+    };
+
+    const loadOlder = async () => {
+        if (!olderCursor) return;
+        try {
+            const older = await fetchPage(olderCursor);
+            keepScrollRef.current = true;
+            setMessages((prev) => [...older, ...prev]);
+        } catch (err) {
+            console.error('Failed to fetch older messages', err);
+        }
+    };
 
     useEffect(() => {
         const fetchMessages = async () => {
+            setOlderCursor(null);
             if (!convId) {
                 setMessages([{ role: 'bot', content: "AuraMind online. Select a session from the sidebar or start a new one, then ask anything about your knowledge base." }]);
                 return;
             }
             setFetchingMessages(true);
             try {
-                const res = await api.get(`/api/history/conversations/${convId}/messages`);
-                const formatted = res.data.map((m: any) => ({
-                    role: m.role as 'user' | 'bot',
-                    content: m.content,
-                    citations: m.citations ? JSON.parse(m.citations) : undefined,
-                }));
-                setMessages(formatted);
+                setMessages(await fetchPage());
             } catch (err) {
                 console.error('Failed to fetch messages', err);
                 setMessages([{ role: 'bot', content: 'Error loading session. Try again or start a new chat.' }]);
@@ -47,6 +71,10 @@ export default function ChatPage() {
     }, [convId]);
 
     useEffect(() => {
+        if (keepScrollRef.current) {
+            keepScrollRef.current = false;
+            return;
+        }
         if (scrollRef.current) {
             scrollRef.current.scrollTop = scrollRef.current.scrollHeight;
         }
@@ -60,6 +88,9 @@ export default function ChatPage() {
         setMessages((prev) => [...prev, userMessage]);
         setInput('');
         setLoading(true);
+        // Lets "stop" cancel this answer server-side (POST /api/chat/cancel)
+        const requestId = crypto.randomUUID();
+        requestIdRef.current = requestId;
 
         try {
             const token = localStorage.getItem('token');
@@ -69,7 +100,7 @@ export default function ChatPage() {
                     'Content-Type': 'application/json',
                     Authorization: `Bearer ${token}`,
                 },
-                body: JSON.stringify({ query: userMessage.content, conversation_id: parseInt(convId) }),
+                body: JSON.stringify({ query: userMessage.content, conversation_id: parseInt(convId), request_id: requestId }),
             });
 
             if (response.status === 401) {
@@ -77,6 +108,11 @@ export default function ChatPage() {
                 window.location.href = '/login';
                 return;
             }
+            if (response.status === 429) {
+                const { detail } = await response.json().catch(() => ({ detail: null }));
+                setMessages((prev) => [...prev, { role: 'bot', content: detail || 'The model is busy. Please try again shortly.' }]);
+                return;
+            }
             if (!response.ok) throw new Error('Failed to fetch');
 
             const reader = response.body?.getReader();
@@ -87,6 +123,7 @@ export default function ChatPage() {
             // Buffer across reads — an SSE line can be split between chunks.
             let buffer = '';
             let streaming = true;
+            let queued = false;
             while (streaming) {
                 const { done, value } = await reader!.read();
                 if (done) break;
@@ -104,7 +141,16 @@ export default function ChatPage() {
                     try {
                         const data = JSON.parse(dataStr);
                         if (data.type === 'citations') botMessage.citations = data.citations;
-                        else if (data.type === 'chunk') botMessage.content += data.text;
+                        else if (data.type === 'queued') {
+                            // Placeholder until the first token replaces it
+                            queued = true;
+                            botMessage.content = `queued · position ${data.position}`;
+                        }
+                        else if (data.type === 'chunk') {
+                            if (queued) { botMessage.content = ''; queued = false; }
+                            botMessage.content += data.text;
+                        }
+                        else if (data.type === 'cancelled') botMessage.truncated = true;
                         else if (data.error) botMessage.content = data.error;
 
                         setMessages((prev) => {
@@ -120,10 +166,21 @@ export default function ChatPage() {
         } catch (err) {
             setMessages((prev) => [...prev, { role: 'bot', content: 'Connection error. Ensure the backend and NVIDIA engine are reachable.' }]);
         } finally {
+            requestIdRef.current = null;
             setLoading(false);
         }
     };
 
+    const handleStop = async () => {
+        if (!requestIdRef.current) return;
+        try {
+            // The stream then ends with what was already generated, kept as truncated
+            await api.post('/api/chat/cancel', { request_id: requestIdRef.current });
+        } catch (err) {
+            console.error('Failed to cancel', err);
+        }
+    };
+
     return (
         <div className="flex flex-col h-full relative">
             {/* header */}
@@ -154,6 +211,14 @@ export default function ChatPage() {
                     </div>
                 ) : (
                     <div className="max-w-3xl mx-auto space-y-7">
+                        {olderCursor && (
+                            <button
+                                onClick={loadOlder}
+                                className="block mx-auto text-[11px] text-muted hover:text-primary border border-line px-3 py-1 transition-colors"
+                            >
+                                ↑ load earlier messages
+                            </button>
+                        )}
                         <AnimatePresence initial={false}>
                             {messages.map((msg, idx) => {
                                 const isLast = idx === messages.length - 1;
@@ -177,6 +242,7 @@ export default function ChatPage() {
                                                 <p className="pl-3 text-foreground/90 whitespace-pre-wrap break-words">
                                                     {msg.content}
                                                     {loading && isLast && <span className="caret" />}
+                                                    {msg.truncated && <span className="text-[11px] text-muted"> [stopped]</span>}
                                                 </p>
 
                                                 {msg.citations && msg.citations.length > 0 && (
@@ -227,15 +293,27 @@ export default function ChatPage() {
                         placeholder={convId ? 'ask your knowledge base...' : 'select or start a session to begin'}
                         className="flex-1 bg-transparent border-none outline-none text-foreground caret-primary placeholder:text-muted/60 text-[15px]"
                     />
-                    <button
-                        id="chat-submit-btn"
-                        type="submit"
-                        disabled={!input.trim() || loading || !convId}
-                        aria-label="Send query"
-                        className="flex items-center gap-2 text-sm text-primary border border-line px-3 py-1.5 hover:border-primary/60 hover:box-glow transition-all disabled:opacity-30 disabled:cursor-not-allowed"
-                    >
-                        {loading ? <Loader2 className="w-4 h-4 animate-spin" /> : <>run <CornerDownLeft className="w-3.5 h-3.5" /></>}
-                    </button>
+                    {loading ? (
+                        <button
+                            id="chat-stop-btn"
+                            type="button"
+                            onClick={handleStop}
+                            aria-label="Stop answer"
+                            className="flex items-center gap-2 text-sm text-danger border border-line px-3 py-1.5 hover:border-danger/60 transition-all"
+                        >
+                            stop <Square className="w-3.5 h-3.5" />
+                        </button>
+                    ) : (
+                        <button
+                            id="chat-submit-btn"
+                            type="submit"
+                            disabled={!input.trim() || !convId}
+                            aria-label="Send query"
+                            className="flex items-center gap-2 text-sm text-primary border border-line px-3 py-1.5 hover:border-primary/60 hover:box-glow transition-all disabled:opacity-30 disabled:cursor-not-allowed"
+                        >
+                            run <CornerDownLeft className="w-3.5 h-3.5" />
+                        </button>
+                    )}
                 </form>
                 <p className="max-w-3xl mx-auto text-center text-[11px] text-muted mt-3">
                     answers are grounded in your private library · local embeddings · hosted generation
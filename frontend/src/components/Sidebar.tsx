@@ -14,6 +14,7 @@ export default function Sidebar() {
     const currentConvId = searchParams.get('convId');
     const [conversations, setConversations] = useState<any[]>([]);
     const [loadingHistory, setLoadingHistory] = useState(false);
+    const [nextCursor, setNextCursor] = useState<string | null>(null);
 
     useEffect(() => {
         const fetchHistory = async () => {
@@ -22,6 +23,7 @@ export default function Sidebar() {
             try {
                 const res = await api.get('/api/history/conversations');
                 setConversations(res.data);
+                setNextCursor(res.headers['x-next-cursor'] ?? null);
             } catch (err) {
                 console.error('Failed to fetch history', err);
             } finally {
@@ -31,6 +33,17 @@ export default function Sidebar() {
         fetchHistory();
     }, [user]);
 
+    const loadMore = async () => {
+        if (!nextCursor) return;
+        try {
+            const res = await api.get('/api/history/conversations', { params: { cursor: nextCursor } });
+            setConversations((prev) => [...prev, ...res.data]);
+            setNextCursor(res.headers['x-next-cursor'] ?? null);
+        } catch (err) {
+            console.error('Failed to fetch history', err);
+        }
+    };
+
     const createNewChat = async () => {
         try {
             const res = await api.post('/api/history/conversations', null, { params: { title: 'New Conversation' } });
@@ -87,6 +100,14 @@ export default function Sidebar() {
                             );
                         })
                     )}
+                    {nextCursor && (
+                        <button
+                            onClick={loadMore}
+                            className="w-full text-left px-2.5 py-2 text-[11px] text-muted hover:text-primary transition-colors"
+                        >
+                            ... load older sessions
+                        </button>
+                    )}
                 </div>
 
                 <div className="h-px bg-line my-5" />